@@ -0,0 +1,67 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Regression test of the fused carbonate step kernel on Tests/case1.
+
+Runs case1 with the reference step by step evaluation and with the numpy mode of the
+carbonate kernel, both with the dopri solver in the adaptive endpoint mode, and checks that
+the populations and the core records match. Runs with pytest or as a script:
+
+    python Tests/test_kernel_case1.py
+"""
+import os
+import sys
+import shutil
+import numpy
+
+from pyReefCore.model import Model
+
+# The case is set up as in the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                'benchmarks'))
+import benchutils
+
+# Maximum difference relative to the largest reference value
+TOLERANCE = 1.e-8
+
+RECORDS = [('population', lambda model: model.coral.population),
+           ('thickness', lambda model: model.core.thickness),
+           ('coralH', lambda model: model.core.coralH),
+           ('karstero', lambda model: model.core.karstero)]
+
+def runCase(kernel):
+
+    cwd = os.getcwd()
+    workdir, xmlfile = benchutils.prepareCase(benchutils.CASES['case1'])
+    try:
+        os.chdir(workdir)
+        model = Model(solver='dopri', kernel=kernel)
+        model.load_xml(os.path.basename(xmlfile), params={'odeGrid': 0}, makedir=False)
+        model.run_to_time(model.input.tEnd, showtime=1.e12)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return model
+
+def test_kernel_case1():
+
+    ref = runCase(None)
+    new = runCase('numpy')
+    assert new._kernel.mode == 'numpy'
+    assert new.iter == ref.iter
+    for name, record in RECORDS:
+        scale = max(numpy.abs(record(ref)).max(), 1.e-12)
+        diff = numpy.abs(record(ref)-record(new)).max()/scale
+        assert diff <= TOLERANCE, '%s differs by %.3e' %(name, diff)
+
+if __name__ == '__main__':
+
+    test_kernel_case1()
+    print 'test_kernel_case1 passed'
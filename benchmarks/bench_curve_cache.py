@@ -0,0 +1,97 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the forcing curve cache.
+
+Reads the sea-level curve of Tests/case2 and a synthetic curve of the given number of rows
+by parsing the text file, from the binary cache as a new process would (the curves kept
+by the process being cleared) and from the memory of the process, and times the loading
+of the case2 XmL input file with and without the cache.
+
+Usage:
+    python benchmarks/bench_curve_cache.py [rows]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy
+
+import benchutils
+
+from pyReefCore.forcing import curveCache
+
+def timeRead(filename, repeat, cache):
+
+    t0 = time.time()
+    for k in range(repeat):
+        if cache == 'disk':
+            curveCache.clearCache()
+        data = curveCache.readCurve(filename, cache=(cache != 'parse'))
+
+    return (time.time()-t0)/repeat, data
+
+def timeLoad(xmlfile, repeat, cache):
+
+    parse = curveCache.readCurve
+    if not cache:
+        curveCache.readCurve = lambda filename: parse(filename, cache=False)
+    try:
+        t0 = time.time()
+        for k in range(repeat):
+            model = benchutils.Model()
+            model.load_xml(xmlfile, makedir=False)
+    finally:
+        curveCache.readCurve = parse
+
+    return (time.time()-t0)/repeat
+
+if __name__ == '__main__':
+
+    rows = 100000
+    if len(sys.argv) > 1:
+        rows = int(sys.argv[1])
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(benchutils.CASES['case2'])
+    cachedir = tempfile.mkdtemp(prefix='pyreef-cache-')
+    os.environ['PYREEF_CACHE_DIR'] = cachedir
+    try:
+        os.chdir(workdir)
+        synthetic = os.path.join(workdir, 'synthetic-curve.csv')
+        t = numpy.linspace(-140000., 0., rows)
+        numpy.savetxt(synthetic, numpy.column_stack((t, 10.*numpy.sin(t/5000.))), fmt='%.6f')
+        # Dated as an input curve written before the runs, a curve file modified just before
+        # being read has its content hash checked at each read (see curveCache.RACY)
+        mtime = time.time()-60.
+        os.utime(synthetic, (mtime, mtime))
+        model = benchutils.Model()
+        model.load_xml(os.path.basename(newxml), makedir=False)
+        curves = [('case2 sea', model.input.seafile), ('synthetic', synthetic)]
+
+        print '%10s %8s %12s %12s %12s' %('curve', 'rows', 'parse [ms]', 'disk [ms]',
+                                           'memory [ms]')
+        for name, filename in curves:
+            tparse, ref = timeRead(filename, 5, 'parse')
+            curveCache.readCurve(filename)
+            tdisk, data = timeRead(filename, 5, 'disk')
+            assert numpy.array_equal(ref, data)
+            tmem, data = timeRead(filename, 1000, 'memory')
+            print '%10s %8d %12.3f %12.3f %12.4f' %(name, len(ref), tparse*1.e3, tdisk*1.e3,
+                                                  tmem*1.e3)
+
+        tnone = timeLoad(os.path.basename(newxml), 20, False)
+        tcache = timeLoad(os.path.basename(newxml), 20, True)
+        print '\ncase2 load_xml: %.2f ms parsing the curves, %.2f ms with the cache' \
+            %(tnone*1.e3, tcache*1.e3)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+        shutil.rmtree(cachedir)
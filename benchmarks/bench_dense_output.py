@@ -0,0 +1,57 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the ODE output modes on Tests/case1 and Tests/case2.
+
+Compares the legacy fixed grid of 100 output points per carbonate step with the adaptive
+mode advancing directly to the end of each step (odeGrid=0), in terms of wall time, number
+of right-hand side evaluations and differences on the final populations and core.
+
+Usage:
+    python benchmarks/bench_dense_output.py [solver] [case ...]
+"""
+import os
+import sys
+import shutil
+import numpy
+
+import benchutils
+
+def runCase(xmlfile, solver, grid):
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(xmlfile)
+    try:
+        os.chdir(workdir)
+        model = benchutils.loadModel(os.path.basename(newxml), solver=solver, odeGrid=grid)
+        wall = benchutils.timeRun(model)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return model, wall
+
+if __name__ == '__main__':
+
+    solver = 'dopri'
+    cases = ['case1', 'case2']
+    if len(sys.argv) > 1:
+        solver = sys.argv[1]
+    if len(sys.argv) > 2:
+        cases = sys.argv[2:]
+
+    print '%6s %8s %10s %10s %12s %12s' %('case', 'grid', 'wall [s]', 'nfev', 'max dpop', 'd thick [m]')
+    for case in cases:
+        ref, wref = runCase(benchutils.CASES[case], solver, 100)
+        new, wnew = runCase(benchutils.CASES[case], solver, 0)
+        dpop = numpy.abs(ref.coral.population-new.coral.population).max()
+        dthick = abs(ref.core.thickness.sum()-new.core.thickness.sum())
+        print '%6s %8d %10.2f %10d %12s %12s' %(case, 100, wref, ref.odeRKF.nfev, '-', '-')
+        print '%6s %8d %10.2f %10d %12.3e %12.3e' %(case, 0, wnew, new.odeRKF.nfev, dpop, dthick)
+        print '%6s speed-up %.1f' %(case, wref/wnew)
@@ -0,0 +1,73 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the batched ensemble engine on Tests/case2.
+
+Members use random malthusian parameters and initial depths. The wall time of the ensemble
+is compared with serial Model runs (dopri solver, adaptive endpoint mode) of a few members.
+
+Usage:
+    python benchmarks/bench_ensemble.py [members ...]
+"""
+import os
+import sys
+import time
+import shutil
+import numpy
+
+import benchutils
+from pyReefCore.model import Model
+from pyReefCore.ensemble import EnsembleModel
+
+def memberParams(nb, seed=0):
+
+    rng = numpy.random.RandomState(seed)
+
+    return [{'malthusParam': rng.uniform(0.002, 0.006, 3), 'depth0': rng.uniform(-30., -5.)}
+            for m in range(nb)]
+
+def runSerial(xmlfile, params):
+
+    model = Model(solver='dopri')
+    model.load_xml(xmlfile, params=dict(params, odeGrid=0), makedir=False)
+
+    return model, benchutils.timeRun(model)
+
+def runEnsemble(xmlfile, params):
+
+    ensemble = EnsembleModel()
+    ensemble.load_xml(xmlfile, params=params)
+    t0 = time.time()
+    ensemble.run_to_time(ensemble.input.tEnd, showtime=ensemble.input.tEnd-ensemble.tNow+1.)
+
+    return ensemble, time.time()-t0
+
+if __name__ == '__main__':
+
+    sizes = [1, 10, 100, 1000]
+    if len(sys.argv) > 1:
+        sizes = [int(arg) for arg in sys.argv[1:]]
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(benchutils.CASES['case2'])
+    try:
+        os.chdir(workdir)
+        xmlfile = os.path.basename(newxml)
+        serial = []
+        for params in memberParams(3):
+            serial.append(runSerial(xmlfile, params)[1])
+        print 'serial run: %.2f [s] per member' %numpy.mean(serial)
+
+        print '%8s %10s %10s %14s' %('members', 'wall [s]', 'nfev', 'per member [s]')
+        for nb in sizes:
+            ensemble, wall = runEnsemble(xmlfile, memberParams(nb))
+            print '%8d %10.2f %10d %14.4f' %(nb, wall, ensemble.odeRKF.nfev, wall/nb)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
@@ -0,0 +1,141 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the environmental factors evaluation of enviForce on Tests/case2.
+
+Compares the cost per call of getSea, getSed and getFlow using the grid index lookup with
+the previous membership evaluation which scanned the 1001 points grid of the membership
+functions for each species, and the maximum difference on the factors.
+Depths span the whole grid and beyond, sediment input and flow velocity come from the case
+depth dependent functions.
+
+Also compares getSea and getFactors interpolating the time curves at each carbonate step
+with reading them from the precomputed forcing timeline (buildTimeline).
+
+Usage:
+    python benchmarks/bench_enviforce.py [calls]
+"""
+import os
+import sys
+import time
+import shutil
+import numpy
+
+import benchutils
+
+def legacyLookup(x, xmf, xx):
+    """
+    Previous degree of membership of a value: search of the nearest grid points.
+    """
+
+    x1 = x[x <= xx][-1]
+    x2 = x[x >= xx][0]
+    idx1 = numpy.nonzero(x == x1)[0][0]
+    idx2 = numpy.nonzero(x == x2)[0][0]
+    if x1 == x2:
+        return xmf[idx1]
+    slope = (xmf[idx2] - xmf[idx1]) / float(x2 - x1)
+
+    return slope * (xx - x1) + xmf[idx1]
+
+def legacyMembership(force):
+    """
+    Previous membership evaluation: one scan of the grid per species.
+    """
+
+    def membership(value, x, xmf, below, above, out=None):
+        factors = numpy.ones(force.speciesNb,dtype=float)
+        for s in range(force.speciesNb):
+            if value<x[0]:
+                factors[s] = below[s]
+            elif value>x[-1]:
+                factors[s] = above[s]
+            else:
+                factors[s] = legacyLookup(x, xmf[s], value)
+        return factors
+
+    return membership
+
+def bench(force, times, elevs):
+
+    values = []
+    t0 = time.time()
+    for t, e in zip(times, elevs):
+        force.sealevel = None
+        values.append(force.getSea(t, e)[1])
+    tsea = (time.time()-t0)/len(times)
+    t0 = time.time()
+    for t, e in zip(times, elevs):
+        values.append(force.getSed(t, e)[1])
+    tsed = (time.time()-t0)/len(times)
+    t0 = time.time()
+    for t, e in zip(times, elevs):
+        values.append(force.getFlow(t, e))
+    tflow = (time.time()-t0)/len(times)
+
+    return [tsea, tsed, tflow], numpy.array(values)
+
+def benchTimeline(force, times, elevs):
+
+    t0 = time.time()
+    force.buildTimeline(times)
+    tbuild = time.time()-t0
+    tcalls = []
+    values = []
+    for steps in [[None]*len(times), range(len(times))]:
+        sea = []
+        factors = []
+        t0 = time.time()
+        for t, e, k in zip(times, elevs, steps):
+            force.sealevel = None
+            sea.append(force.getSea(t, e, k)[0])
+            factors.append(force.getFactors(t, e, k).copy())
+        tcalls.append((time.time()-t0)/len(times))
+        values.append((numpy.array(sea), numpy.array(factors)))
+    diff = max(numpy.abs(values[0][0]-values[1][0]).max(),
+               numpy.abs(values[0][1]-values[1][1]).max())
+
+    return tbuild, tcalls, diff
+
+if __name__ == '__main__':
+
+    calls = 5000
+    if len(sys.argv) > 1:
+        calls = int(sys.argv[1])
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(benchutils.CASES['case2'])
+    try:
+        os.chdir(workdir)
+        model = benchutils.loadModel(os.path.basename(newxml))
+        force = model.force
+        rng = numpy.random.RandomState(0)
+        times = rng.uniform(model.input.tStart, model.input.tEnd, calls)
+        elevs = rng.uniform(-5., force.xd[-1]+5., calls)
+
+        tnew, fnew = bench(force, times, elevs)
+        force._membership = legacyMembership(force)
+        told, fold = bench(force, times, elevs)
+        del force._membership
+
+        print 'max factors difference: %.3e' %numpy.abs(fold-fnew).max()
+        print '%8s %14s %14s %10s' %('getter', 'legacy [us]', 'lookup [us]', 'speed-up')
+        for k, name in enumerate(['getSea', 'getSed', 'getFlow']):
+            print '%8s %14.2f %14.2f %10.1f' %(name, told[k]*1.e6, tnew[k]*1.e6, told[k]/tnew[k])
+
+        steps = numpy.arange(model.input.tStart, model.input.tEnd+model.input.tCarb,
+                             model.input.tCarb)[:calls]
+        tbuild, tstep, diff = benchTimeline(force, steps, elevs[:len(steps)])
+        print '\ntimeline of %d steps built in %.2f ms, max difference: %.3e' \
+            %(len(steps), tbuild*1.e3, diff)
+        print 'getSea+getFactors per step: %.2f us interpolated, %.2f us from timeline' \
+            %(tstep[0]*1.e6, tstep[1]*1.e6)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
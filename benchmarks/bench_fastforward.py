@@ -0,0 +1,132 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Regression check and benchmark of the fast-forward of the phases of null populations.
+
+Runs the shipped cases, case2 with a faster karstification which removes the whole core
+and a synthetic case with all the forcings turned on, step by step and with the fast-forward
+(see Model.run_to_time), and compares the population, forcing and core records which
+should be identical. Each case is also run with each stop condition of pyReefCore.events and
+with a plain function, the run should stop at the same step with and without fast-forward.
+The script exits with an error status when the populations or the stops differ or when the
+maximum difference relative to the largest reference value exceeds the tolerance.
+
+Usage:
+    python benchmarks/bench_fastforward.py [--tolerance 1e-10] [case ...]
+"""
+import os
+import sys
+import shutil
+import argparse
+import numpy
+
+import benchutils
+
+from pyReefCore import events
+
+# Variants of the shipped cases: case and input parameters
+VARIANTS = {'case2-karst': ('case2', {'karstRate': 2.e-3})}
+
+RECORDS = [('population', lambda model: model.coral.population),
+           ('accspace', lambda model: model.coral.accspace),
+           ('thickness', lambda model: model.core.thickness),
+           ('coralH', lambda model: model.core.coralH),
+           ('karstero', lambda model: model.core.karstero),
+           ('sealevel', lambda model: model.core.sealevel),
+           ('sedinput', lambda model: model.core.sedinput)]
+
+def runCase(case, fastforward, stop=None):
+
+    cwd = os.getcwd()
+    params = {'odeGrid': 0}
+    if case in VARIANTS:
+        case, variant = VARIANTS[case]
+        params.update(variant)
+    if case == 'synthetic':
+        workdir, newxml = benchutils.syntheticCase(5, tcarb=2., tStart=-40000., tEnd=0.)
+    else:
+        workdir, newxml = benchutils.prepareCase(benchutils.CASES[case])
+    try:
+        os.chdir(workdir)
+        model = benchutils.Model(solver='dopri')
+        model.load_xml(os.path.basename(newxml), params=params, makedir=False)
+        model.run_to_time(model.input.tEnd, showtime=1.e12, timing=True,
+                          fastforward=fastforward, stop=stop)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return model
+
+def stopConditions(ref):
+    """
+    Stop conditions of a case: half of the final core thickness of the reference run, a
+    collapse of 20 carbonate steps, the removal of the core and half of the karstified
+    thickness of the reference run, the last one being a plain function.
+    """
+
+    eroded = ref.summary()['eroded']
+
+    def halfEroded(model):
+        return model.core.metrics.eroded >= 0.5*eroded > 0.
+
+    return [events.ThicknessReached(0.5*ref.summary()['thickness']),
+            events.PopulationsCollapsed(20.*ref.input.tCarb), events.CoreRemoved(),
+            halfEroded]
+
+def difference(ref, new):
+
+    diffs = {}
+    for name, record in RECORDS:
+        scale = max(numpy.abs(record(ref)).max(), 1.e-12)
+        diffs[name] = numpy.abs(record(ref)-record(new)).max()/scale
+
+    return diffs
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fast-forward check.')
+    parser.add_argument('cases', nargs='*', default=['case1', 'case2', 'case2-karst',
+                        'synthetic'], metavar='case', help='cases to run (%s, synthetic)'
+                        %', '.join(sorted(benchutils.CASES)+sorted(VARIANTS)))
+    parser.add_argument('--tolerance', type=float, default=1.e-10,
+                        help='maximum relative difference (default 1e-10)')
+    args = parser.parse_args()
+
+    failures = []
+    print '%11s %10s %10s %8s %8s %8s %12s' %('case', 'step [s]', 'fast [s]', 'speed-up',
+                                              'steps', 'skipped', 'max rel diff')
+    for case in args.cases:
+        ref = runCase(case, False)
+        new = runCase(case, True)
+        diffs = difference(ref, new)
+        skipped = sum(phase[3] for phase in new.phases)
+        print '%11s %10.2f %10.2f %8.1f %8d %8d %12.3e' %(case, ref.timer.wall, new.timer.wall,
+                                                         ref.timer.wall/new.timer.wall,
+                                                         new.iter, skipped, max(diffs.values()))
+        if diffs['population'] > 0.:
+            failures.append((case, 'population', diffs['population']))
+        for name in sorted(diffs):
+            if name != 'population' and diffs[name] > args.tolerance:
+                failures.append((case, name, diffs[name]))
+        for condition in stopConditions(ref):
+            stops = []
+            for fastforward in [False, True]:
+                model = runCase(case, fastforward, [condition])
+                stops.append((model.stopEvent, model.tNow, model.iter))
+            print '%11s %22s stopped at %s' %(case, events.conditionName(condition),
+                                              '-' if stops[0][0] is None else stops[0][1])
+            if stops[0] != stops[1]:
+                failures.append((case, 'stop %s' %events.conditionName(condition),
+                                 abs(stops[0][1]-stops[1][1])))
+
+    for case, name, diff in failures:
+        print >> sys.stderr, 'Fast-forward mismatch on %s: %s differs by %.3e' %(case, name, diff)
+    if len(failures) > 0:
+        sys.exit(1)
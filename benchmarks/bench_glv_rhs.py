@@ -0,0 +1,76 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Micro-benchmark of the Generalized Lotka-Volterra right-hand side.
+
+Compares the per-call cost of the loop based coralGLV._functionGLV with the
+vectorised coralGLV._functionGLVvec for 3, 10 and 50 communities.
+
+Usage:
+    python benchmarks/bench_glv_rhs.py [repeat]
+"""
+import sys
+import timeit
+import numpy
+
+from pyReefCore.simulation.coralGLV import coralGLV
+
+class glvInput:
+    """
+    Minimal input parameters required to build a coralGLV object.
+    """
+
+    def __init__(self, nb, seed=0):
+
+        rng = numpy.random.RandomState(seed)
+        self.tStart = 0.
+        self.tEnd = 100.
+        self.tCarb = 1.
+        self.speciesNb = nb
+        self.speciesPopulation = numpy.zeros(nb)
+        self.malthusParam = rng.uniform(0.001, 0.01, nb)
+        self.communityMatrix = -rng.uniform(0., 0.001, (nb,nb))
+        self.odeSolver = 'dopri'
+        self.odeRtol = 1.e-6
+        self.odeAtol = 1.e-6
+        self.odeMinStep = 1.e-4
+        self.odeGrid = 100
+        self.odeDense = 0
+
+        return
+
+def bench(nb, number):
+    """
+    Returns the time per call [s] of the loop and vectorised right-hand sides.
+    """
+
+    glv = coralGLV(input=glvInput(nb))
+    X = numpy.random.RandomState(1).uniform(0., 20., nb)
+
+    ref = glv._functionGLV(X, 0.)
+    vec = glv._functionGLVvec(X, 0.)
+    if not numpy.allclose(ref, vec, rtol=1.e-12, atol=0.):
+        raise RuntimeError('Vectorised GLV right-hand side differs from the reference one.')
+
+    tloop = min(timeit.repeat(lambda: glv._functionGLV(X, 0.), number=number, repeat=3))/number
+    tvec = min(timeit.repeat(lambda: glv._functionGLVvec(X, 0.), number=number, repeat=3))/number
+    tjac = min(timeit.repeat(lambda: glv._jacobianGLV(X, 0.), number=number, repeat=3))/number
+
+    return tloop, tvec, tjac
+
+if __name__ == '__main__':
+
+    number = 20000
+    if len(sys.argv) > 1:
+        number = int(sys.argv[1])
+
+    print '%12s %14s %14s %10s %14s' %('communities', 'loop [us]', 'vector [us]', 'speed-up', 'jacobian [us]')
+    for nb in [3, 10, 50]:
+        tloop, tvec, tjac = bench(nb, number)
+        print '%12d %14.3f %14.3f %10.1f %14.3f' %(nb, tloop*1.e6, tvec*1.e6, tloop/tvec, tjac*1.e6)
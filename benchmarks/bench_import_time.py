@@ -0,0 +1,77 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the pyReefCore start-up time.
+
+Each measure is done in a new Python process: bare interpreter, import of pyReefCore.model
+and import followed by the loading of the Tests/case2 XmL input file (headless run set-up).
+The heavy modules loaded by each step are listed, plotting and fuzzy curve modules should
+only be imported when plotting.
+
+Usage:
+    python benchmarks/bench_import_time.py [repeat]
+"""
+import os
+import sys
+import json
+import shutil
+import subprocess
+import numpy
+
+import benchutils
+
+HEAVY = ['pandas', 'matplotlib', 'matplotlib.pyplot', 'skfuzzy', 'scipy.interpolate',
+         'scipy.optimize', 'scipy.integrate', 'scipy.ndimage', 'odespy']
+
+SCRIPTS = {
+    'interpreter': '',
+    'import': 'import pyReefCore.model',
+    'load_xml': ('import pyReefCore.model\n'
+                 'model = pyReefCore.model.Model()\n'
+                 'model.load_xml(%r, makedir=False)'),
+}
+
+PROBE = '''
+import time, sys, json
+t0 = time.time()
+%s
+wall = time.time()-t0
+print json.dumps([wall, [m for m in %r if m in sys.modules]])
+'''
+
+def measure(code, repeat):
+
+    walls = []
+    for k in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', PROBE %(code, HEAVY)])
+        wall, modules = json.loads(out.strip().split('\n')[-1])
+        walls.append(wall)
+
+    return numpy.median(walls), modules
+
+if __name__ == '__main__':
+
+    repeat = 10
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(benchutils.CASES['case2'])
+    try:
+        os.chdir(workdir)
+        print '%12s %12s   %s' %('step', 'median [ms]', 'heavy modules loaded')
+        for name in ['interpreter', 'import', 'load_xml']:
+            code = SCRIPTS[name]
+            if name == 'load_xml':
+                code = code %os.path.basename(newxml)
+            wall, modules = measure(code, repeat)
+            print '%12s %12.1f   %s' %(name, wall*1.e3, ', '.join(modules) or '-')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
@@ -0,0 +1,89 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the fused carbonate step kernel, the case1 regression test in numpy mode is
+Tests/test_kernel_case1.py.
+
+Runs a case with the reference step by step evaluation and with the carbonate kernel (see
+pyReefCore.carbonateKernel) in the adaptive endpoint mode of the dopri solver, and compares
+the populations and the core records. The script exits with an error status when the
+maximum difference relative to the largest reference value exceeds the tolerance. The
+kernel is run twice, the first run includes the numba compilation.
+
+Usage:
+    python benchmarks/bench_kernel.py [--kernel auto] [--tolerance 1e-8] [case ...]
+"""
+import os
+import sys
+import shutil
+import argparse
+import numpy
+
+import benchutils
+
+RECORDS = [('population', lambda model: model.coral.population),
+           ('thickness', lambda model: model.core.thickness),
+           ('coralH', lambda model: model.core.coralH),
+           ('karstero', lambda model: model.core.karstero)]
+
+def runCase(xmlfile, kernel):
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(xmlfile)
+    try:
+        os.chdir(workdir)
+        model = benchutils.Model(solver='dopri', kernel=kernel)
+        model.load_xml(os.path.basename(newxml), params={'odeGrid': 0}, makedir=False)
+        wall = benchutils.timeRun(model)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return model, wall
+
+def difference(ref, new):
+
+    diffs = {}
+    for name, record in RECORDS:
+        scale = max(numpy.abs(record(ref)).max(), 1.e-12)
+        diffs[name] = numpy.abs(record(ref)-record(new)).max()/scale
+
+    return diffs
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fused carbonate kernel check.')
+    parser.add_argument('cases', nargs='*', default=['case1'], metavar='case',
+                        help='cases to run (%s)' %', '.join(sorted(benchutils.CASES)))
+    parser.add_argument('--kernel', default='auto', help='kernel mode (default auto)')
+    parser.add_argument('--tolerance', type=float, default=1.e-8,
+                        help='maximum relative difference (default 1e-8)')
+    args = parser.parse_args()
+
+    failures = []
+    print '%6s %12s %10s %10s %12s' %('case', 'path', 'wall [s]', 'nfev', 'max rel diff')
+    for case in args.cases:
+        ref, wref = runCase(benchutils.CASES[case], None)
+        print '%6s %12s %10.2f %10d %12s' %(case, 'reference', wref, ref.odeRKF.nfev, '-')
+        for run in ['first', 'second']:
+            new, wnew = runCase(benchutils.CASES[case], args.kernel)
+            diffs = difference(ref, new)
+            worst = max(diffs.values())
+            print '%6s %12s %10.2f %10d %12.3e' %(case, new._kernel.name, wnew,
+                                                  new._kernel.nfev, worst)
+            for name in sorted(diffs):
+                if diffs[name] > args.tolerance:
+                    failures.append((case, run, name, diffs[name]))
+        print '%6s speed-up %.1f' %(case, wref/wnew)
+
+    for case, run, name, diff in failures:
+        print >> sys.stderr, 'Kernel mismatch on %s (%s run): %s differs by %.3e' %(case, run,
+                                                                                   name, diff)
+    if len(failures) > 0:
+        sys.exit(1)
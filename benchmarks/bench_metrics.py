@@ -0,0 +1,115 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Regression check and benchmark of the summary metrics maintained during the runs.
+
+Runs a case with the reference step by step evaluation and with the numpy carbonate kernel,
+and compares the summary record of the model (see Model.summary) with the metrics computed
+from the full records after the run: component totals, karstified thickness and facies
+sequence. The summary is also checked after restoring a checkpoint written halfway. The
+script exits with an error status when a relative difference exceeds the tolerance.
+
+Usage:
+    python benchmarks/bench_metrics.py [--tolerance 1e-10] [case ...]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import numpy
+
+import benchutils
+
+def fromRecords(model):
+    """
+    Summary metrics computed from the full core records.
+    """
+
+    coralH = model.core.coralH
+    thickness = model.core.thickness
+    ids = numpy.flatnonzero(thickness > 0.)
+    facies = coralH[:,ids].argmax(axis=0)
+    # First layer of each facies unit
+    starts = numpy.flatnonzero(numpy.diff(numpy.append(-1, facies)))
+
+    return {'thickness': thickness.sum(), 'totals': coralH.sum(axis=1),
+            'eroded': model.core.karstero.sum(), 'facies': facies[starts],
+            'faciesThickness': numpy.add.reduceat(thickness[ids], starts)}
+
+def difference(ref, new):
+
+    diffs = {}
+    for name in ref:
+        a = numpy.atleast_1d(numpy.asarray(ref[name], dtype=float))
+        b = numpy.atleast_1d(numpy.asarray(new[name], dtype=float))
+        if a.shape != b.shape:
+            diffs[name] = numpy.inf
+        else:
+            diffs[name] = numpy.abs(a-b).max()/max(numpy.abs(a).max(), 1.e-12)
+
+    return diffs
+
+def runCase(xmlfile, kernel, split=False):
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(xmlfile)
+    try:
+        os.chdir(workdir)
+        model = benchutils.Model(solver='dopri', kernel=kernel)
+        model.load_xml(os.path.basename(newxml), params={'odeGrid': 0}, makedir=False)
+        if split:
+            half = 0.5*(model.input.tStart+model.input.tEnd)
+            model.run_to_time(half, showtime=1.e12)
+            model.save_checkpoint('half.npz')
+            model = benchutils.Model(solver='dopri', kernel=kernel)
+            model.load_xml(os.path.basename(newxml), params={'odeGrid': 0}, makedir=False)
+            model.load_checkpoint('half.npz')
+        model.run_to_time(model.input.tEnd, showtime=1.e12)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return model
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Summary metrics check.')
+    parser.add_argument('cases', nargs='*', default=['case1', 'case2'], metavar='case',
+                        help='cases to run (%s)' %', '.join(sorted(benchutils.CASES)))
+    parser.add_argument('--tolerance', type=float, default=1.e-10,
+                        help='maximum relative difference (default 1e-10)')
+    args = parser.parse_args()
+
+    failures = []
+    print '%6s %12s %8s %14s %14s %12s' %('case', 'path', 'units', 'summary [ms]',
+                                          'records [ms]', 'max rel diff')
+    for case in args.cases:
+        for path, kernel, split in [('reference', None, False), ('kernel', 'numpy', False),
+                                    ('checkpoint', None, True)]:
+            model = runCase(benchutils.CASES[case], kernel, split)
+            t0 = time.time()
+            new = model.summary()
+            tnew = time.time()-t0
+            t0 = time.time()
+            ref = fromRecords(model)
+            tref = time.time()-t0
+            diffs = difference(ref, new)
+            print '%6s %12s %8d %14.3f %14.3f %12.3e' %(case, path, len(new['facies']),
+                                                       1000.*tnew, 1000.*tref,
+                                                       max(diffs.values()))
+            for name in sorted(diffs):
+                if diffs[name] > args.tolerance:
+                    failures.append((case, path, name, diffs[name]))
+
+    for case, path, name, diff in failures:
+        print >> sys.stderr, 'Summary mismatch on %s (%s): %s differs by %.3e' %(
+            case, path, name, diff)
+    if len(failures) > 0:
+        sys.exit(1)
@@ -0,0 +1,91 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the on-disk output store on Tests/case1 and Tests/case2.
+
+Runs each case with the records kept in memory, and stored in double and single precision
+memory-mapped files. Reports the wall time, the peak resident memory of the run (each run
+is done in its own process), the size of the records held in memory and written on disk,
+and the maximum difference on the final populations.
+
+Usage:
+    python benchmarks/bench_output_store.py [tCarb] [case ...]
+"""
+import os
+import sys
+import shutil
+import resource
+import multiprocessing
+import numpy
+
+import benchutils
+
+from pyReefCore.simulation import outputStore
+
+def recordBytes(model):
+
+    memory = 0
+    disk = 0
+    for obj, names in ((model.coral, outputStore.CORAL_RECORDS),
+                       (model.core, outputStore.CORE_RECORDS)):
+        for name in names:
+            data = getattr(obj, name)
+            if model.store is not None:
+                disk += data.nbytes
+            else:
+                memory += data.nbytes
+
+    return memory, disk
+
+def runCase(args):
+
+    xmlfile, tcarb, precision = args
+    workdir, newxml = benchutils.prepareCase(xmlfile)
+    try:
+        os.chdir(workdir)
+        model = benchutils.Model(solver='dopri')
+        params = {'odeGrid': 0}
+        if tcarb is not None:
+            params['tCarb'] = tcarb
+        model.load_xml(os.path.basename(newxml), params=params, makedir=False)
+        if precision is not None:
+            model.use_store(os.path.join(workdir, 'records'), precision=precision)
+        wall = benchutils.timeRun(model)
+        memory, disk = recordBytes(model)
+        population = numpy.array(model.coral.population)
+    finally:
+        shutil.rmtree(workdir)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+
+    return wall, rss, memory, disk, population
+
+if __name__ == '__main__':
+
+    tcarb = None
+    cases = ['case1', 'case2']
+    if len(sys.argv) > 1:
+        tcarb = float(sys.argv[1])
+    if len(sys.argv) > 2:
+        cases = sys.argv[2:]
+
+    print '%6s %10s %10s %10s %12s %12s %12s' %('case', 'store', 'wall [s]', 'RSS [MB]',
+                                              'memory [MB]', 'disk [MB]', 'max diff')
+    for case in cases:
+        ref = None
+        for precision in [None, 'float64', 'float32']:
+            # One process per run to measure its own peak memory
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            wall, rss, memory, disk, pop = pool.apply(runCase, ((benchutils.CASES[case], tcarb,
+                                                                 precision),))
+            pool.close()
+            pool.join()
+            if ref is None:
+                ref = pop
+            print '%6s %10s %10.2f %10.1f %12.3f %12.3f %12.3e' %(case, precision or 'memory',
+                  wall, rss, memory/1.e6, disk/1.e6, numpy.abs(pop-ref).max())
@@ -0,0 +1,104 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark of the headless rendering of the modelPlot figures.
+
+Runs Tests/case2 once, then renders and saves each figure with the Agg backend (headless
+mode) and measures the throughput of the core figure rendered by a pool of worker processes,
+as done by the sweep runners. The core figure is then rendered for synthetic cores of 1k and
+10k layers, its cost should not depend on the number of layers.
+
+Usage:
+    python benchmarks/bench_render.py [copies] [processes]
+"""
+import os
+import sys
+import time
+import shutil
+import multiprocessing
+
+import benchutils
+
+FIGURES = [('communityTime', {'fname': 'pop_t.png'}),
+           ('communityDepth', {'fname': 'pop_d.png'}),
+           ('accommodationTime', {'fname': 'acc_t.png'}),
+           ('drawCore', {'tstep': 20, 'size': (10,8), 'figname': 'core.png'})]
+
+# Number of layers of the synthetic cores
+LAYERS = [1000, 10000]
+
+# Plotting object of the run, inherited by the forked worker processes
+_plot = None
+
+def render(index):
+
+    t0 = time.time()
+    _plot.drawCore(tstep=20, size=(10,8), figname='core%d.png' %index)
+
+    return time.time()-t0
+
+if __name__ == '__main__':
+
+    copies = 8
+    processes = multiprocessing.cpu_count()
+    if len(sys.argv) > 1:
+        copies = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        processes = int(sys.argv[2])
+
+    cwd = os.getcwd()
+    workdir, newxml = benchutils.prepareCase(benchutils.CASES['case2'])
+    try:
+        os.chdir(workdir)
+        model = benchutils.Model(solver='dopri')
+        model.load_xml(os.path.basename(newxml), params={'odeGrid': 0}, makedir=False)
+        model.run_to_time(model.input.tEnd, showtime=1.e12)
+        _plot = model.plot
+        _plot.headless = True
+        _plot.folder = workdir
+
+        print '%18s %10s' %('figure', 'wall [s]')
+        for name, kwargs in FIGURES:
+            t0 = time.time()
+            getattr(_plot, name)(**kwargs)
+            print '%18s %10.2f' %(name, time.time()-t0)
+
+        t0 = time.time()
+        for k in range(copies):
+            render(k)
+        serial = time.time()-t0
+        pool = multiprocessing.Pool(processes)
+        t0 = time.time()
+        pool.map(render, range(copies))
+        parallel = time.time()-t0
+        pool.close()
+        pool.join()
+        print '%d core figures: %.2f s serial, %.2f s on %d processes (%.1f figures/s)' %(
+            copies, serial, parallel, processes, copies/parallel)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    print '%18s %10s' %('layers', 'wall [s]')
+    for layers in LAYERS:
+        # Synthetic layers are made of 4 carbonate steps
+        workdir, newxml = benchutils.syntheticCase(5, tcarb=1., tStart=-4.*layers, tEnd=0.)
+        try:
+            os.chdir(workdir)
+            model = benchutils.Model(solver='dopri')
+            model.load_xml(os.path.basename(newxml), params={'odeGrid': 0}, makedir=False)
+            model.run_to_time(model.input.tEnd, showtime=1.e12)
+            model.plot.headless = True
+            model.plot.folder = workdir
+            t0 = time.time()
+            model.plot.drawCore(tstep=20, size=(10,8), figname='core.png')
+            print '%18d %10.2f' %(len(model.core.thickness)-1, time.time()-t0)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
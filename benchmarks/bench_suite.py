@@ -0,0 +1,198 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Benchmark suite of the carbonate loop.
+
+Runs the Model on the shipped Tests/case1 (7 kyr, 2.5 yr steps) and Tests/case2 (140 kyr,
+50 yr steps) inputs and on synthetic inputs with 10 to 100 communities, a finer carbonate
+time step and all the forcings turned on (see benchutils.syntheticCase). Each run is done
+in its own process and reports its wall time, peak resident memory, number of right-hand
+side evaluations, simulated years per second and the time spent in each phase of the loop
+(see pyReefCore.timing). The numpy array allocations are measured on a second run of a few
+steps with tracemalloc (see benchutils.allocationCounter), as the peak of the memory
+allocated by these steps (alloc column in kB, n/a without tracemalloc).
+
+Results are appended to a history file (JSON lines, benchmarks/history.jsonl by default)
+with the git commit and host name, and each run is compared with the median of the previous
+runs of the same case on the same host and with the same solver. The script exits with an
+error status when a run is slower than this reference by more than the tolerance.
+
+Usage:
+    python benchmarks/bench_suite.py [--solver dopri] [--history file] [--tolerance 0.2]
+                                     [--no-save] [case ...]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import resource
+import subprocess
+import multiprocessing
+import numpy
+
+import benchutils
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Synthetic cases: number of communities, carbonate time step and simulated period [a]
+SYNTHETIC = {
+    'synth10': (10, 2., 20000.),
+    'synth30': (30, 2., 20000.),
+    'synth100': (100, 5., 20000.),
+}
+
+CASES = ['case1', 'case2']+sorted(SYNTHETIC, key=lambda name: SYNTHETIC[name][0])
+
+# Number of previous runs used as reference
+REFERENCE = 5
+
+# Number of carbonate steps on which allocations are measured, after a few warm-up steps
+ALLOCSTEPS = 100
+WARMUP = 10
+
+def prepare(case):
+
+    if case in SYNTHETIC:
+        communities, tcarb, span = SYNTHETIC[case]
+        return benchutils.syntheticCase(communities, tcarb=tcarb, tStart=-span, tEnd=0.)
+
+    return benchutils.prepareCase(benchutils.CASES[case])
+
+def runCase(args):
+
+    case, solver = args
+    workdir, xmlfile = prepare(case)
+    try:
+        os.chdir(workdir)
+        model = benchutils.Model(solver=solver)
+        model.load_xml(os.path.basename(xmlfile), params={'odeGrid': 0}, makedir=False)
+        tEnd = model.input.tEnd
+        model.run_to_time(tEnd, showtime=tEnd-model.tNow+1., timing=True)
+        report = model.timer.report()
+        report['communities'] = model.input.speciesNb
+        report['tcarb'] = model.input.tCarb
+        report.update(countAllocations(os.path.basename(xmlfile), solver))
+    finally:
+        shutil.rmtree(workdir)
+    report['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+
+    return report
+
+def countAllocations(xmlfile, solver):
+    """
+    Peak of the memory allocated by a few carbonate steps [bytes] (allocPeak), None when
+    the allocation counter is not available.
+    """
+
+    try:
+        counter = benchutils.allocationCounter()
+    except RuntimeError:
+        return {'allocPeak': None}
+
+    model = benchutils.Model(solver=solver)
+    model.load_xml(xmlfile, params={'odeGrid': 0}, makedir=False)
+    tCarb = model.input.tCarb
+    steps = min(ALLOCSTEPS, int(round((model.input.tEnd-model.tNow)/tCarb))-WARMUP)
+    model.run_to_time(model.tNow+WARMUP*tCarb, showtime=1.e12)
+    counter.start()
+    try:
+        model.run_to_time(model.tNow+steps*tCarb, showtime=1.e12)
+    finally:
+        peak = counter.stop()
+
+    return {'allocPeak': peak}
+
+def formatAllocations(entry):
+
+    if entry.get('allocPeak') is not None:
+        return '%.1f kB' %(entry['allocPeak']/1024.)
+
+    return 'n/a'
+
+def gitCommit():
+
+    try:
+        with open(os.devnull, 'w') as null:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                           stderr=null).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def readHistory(filename):
+
+    history = []
+    if os.path.isfile(filename):
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+
+    return history
+
+def reference(history, entry):
+
+    walls = [old['wall'] for old in history if old['case'] == entry['case'] and
+             old['host'] == entry['host'] and old['solver'] == entry['solver']]
+    if len(walls) == 0:
+        return None
+
+    return numpy.median(walls[-REFERENCE:])
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark suite of the carbonate loop.')
+    parser.add_argument('cases', nargs='*', default=CASES, metavar='case',
+                        help='cases to run (%s)' %', '.join(CASES))
+    parser.add_argument('--solver', default='dopri', help='ODE solver (default dopri)')
+    parser.add_argument('--history', default=os.path.join(HERE, 'history.jsonl'),
+                        help='history file of the results')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slow down reported as a regression (default 0.2)')
+    parser.add_argument('--no-save', dest='save', action='store_false',
+                        help='do not append the results to the history file')
+    args = parser.parse_args()
+    for case in args.cases:
+        if case not in CASES:
+            parser.error('unknown case %s' %case)
+
+    history = readHistory(args.history)
+    commit = gitCommit()
+    host = socket.gethostname()
+    regressions = []
+
+    print '%9s %6s %10s %10s %10s %10s %12s %12s %10s' %('case', 'comm', 'steps', 'wall [s]',
+          'RSS [MB]', 'nfev', 'years/s', 'alloc', 'ref [s]')
+    for case in args.cases:
+        # One process per run to measure its own peak memory
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        report = pool.apply(runCase, ((case, args.solver),))
+        pool.close()
+        pool.join()
+
+        entry = dict(report, case=case, commit=commit, host=host,
+                     date=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        ref = reference(history, entry)
+        print '%9s %6d %10d %10.2f %10.1f %10d %12.1f %12s %10s' %(case,
+              entry['communities'], entry['steps'], entry['wall'], entry['rss'],
+              entry['nfev'], entry['yearsPerSecond'], formatAllocations(entry),
+              '-' if ref is None else '%.2f' %ref)
+        if ref is not None and entry['wall'] > (1.+args.tolerance)*ref:
+            regressions.append((case, entry['wall'], ref))
+        if args.save:
+            with open(args.history, 'a') as f:
+                f.write(json.dumps(entry, sort_keys=True)+'\n')
+
+    for case, wall, ref in regressions:
+        print >> sys.stderr, 'Regression on %s: %.2f s against %.2f s (median of the last ' \
+            '%d runs)' %(case, wall, ref, REFERENCE)
+    if len(regressions) > 0:
+        sys.exit(1)
@@ -0,0 +1,292 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Helper functions shared by the pyReefCore benchmarks.
+"""
+import os
+import re
+import time
+import shutil
+import tempfile
+import numpy
+import xml.etree.ElementTree as ET
+
+from pyReefCore.model import Model
+
+# Location of the shipped test cases
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Tests')
+CASES = {
+    'case1': os.path.join(TESTS, 'case1', 'input-case1.xml'),
+    'case2': os.path.join(TESTS, 'case2', 'input-case2.xml'),
+}
+
+def prepareCase(xmlfile, workdir=None):
+    """
+    Copy a test case in a temporary working directory so that the output folders created
+    by the runs do not pollute the repository.
+
+    Forcing structures pointing to a curve file which is not shipped with the case are
+    removed from the copied input file and reported.
+
+    Parameters
+    ----------
+    string : xmlfile
+        XmL input file of the case.
+
+    string : workdir
+        Working directory, a temporary one is created when None.
+
+    Returns the working directory and the copied XmL input file name.
+    """
+
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='pyreef-bench-')
+    casedir = os.path.dirname(os.path.abspath(xmlfile))
+    for name in os.listdir(casedir):
+        src = os.path.join(casedir, name)
+        if os.path.isdir(src) and not name.startswith('output'):
+            shutil.copytree(src, os.path.join(workdir, name))
+
+    tree = ET.parse(xmlfile)
+    root = tree.getroot()
+    for child in list(root):
+        curve = child.find('curve')
+        if curve is not None and not os.path.isfile(os.path.join(casedir, curve.text)):
+            print 'Warning: %s is missing, the %s forcing is not used.'%(curve.text, child.tag)
+            root.remove(child)
+    out = root.find('outfolder')
+    if out is not None:
+        out.text = 'output'
+    newxml = os.path.join(workdir, os.path.basename(xmlfile))
+    tree.write(newxml)
+
+    return workdir, newxml
+
+def numpyVersion():
+    """
+    Major and minor version numbers of numpy.
+    """
+
+    return tuple(int(v) for v in re.findall(r'\d+', numpy.__version__)[:2])
+
+class allocationCounter(object):
+    """
+    Measure of the numpy array data allocations of a piece of code, given by the peak of the
+    memory traced by tracemalloc above its level at start [bytes]. It requires Python 3 and
+    numpy 1.13 or later, which reports its allocations to tracemalloc, a RuntimeError is
+    raised otherwise.
+
+    Usage:
+        counter = allocationCounter()
+        counter.start()
+        try:
+            ...
+        finally:
+            peak = counter.stop()
+    """
+
+    def __init__(self):
+
+        try:
+            import tracemalloc
+        except ImportError:
+            raise RuntimeError('The allocation counter requires tracemalloc (Python 3)')
+        if numpyVersion() < (1, 13):
+            raise RuntimeError('numpy %s does not report its allocations to tracemalloc'
+                               %numpy.__version__)
+        self._tracemalloc = tracemalloc
+        self._start = 0
+        self._tracing = False
+
+        return
+
+    def start(self):
+        """
+        Start tracing the allocations.
+        """
+
+        self._tracing = not self._tracemalloc.is_tracing()
+        if self._tracing:
+            self._tracemalloc.start()
+        if hasattr(self._tracemalloc, 'reset_peak'):
+            self._tracemalloc.reset_peak()
+        self._start = self._tracemalloc.get_traced_memory()[0]
+
+        return
+
+    def stop(self):
+        """
+        Stop tracing and return the peak of the allocated memory [bytes].
+        """
+
+        peak = self._tracemalloc.get_traced_memory()[1]
+        if self._tracing:
+            self._tracemalloc.stop()
+        self._tracing = False
+
+        return max(peak-self._start, 0)
+
+def loadModel(xmlfile, solver=None, **inputs):
+    """
+    Build a Model from an XmL input file located in the current directory and override
+    some of the input parameters.
+
+    Parameters
+    ----------
+    string : xmlfile
+        XmL input file name.
+
+    string : solver
+        ODE solver name.
+
+    inputs :
+        Input parameters to override (e.g. odeGrid=0).
+    """
+
+    model = Model(solver=solver)
+    model.load_xml(xmlfile)
+    for key, value in inputs.items():
+        setattr(model.input, key, value)
+
+    return model
+
+def timeRun(model, tEnd=None):
+    """
+    Run a model to its end time and return the wall time [s].
+    """
+
+    if tEnd is None:
+        tEnd = model.input.tEnd
+    t0 = time.time()
+    model.run_to_time(tEnd, showtime=tEnd-model.tNow+1.)
+
+    return time.time()-t0
+
+def _element(parent, tag, text=None, **attrib):
+
+    element = ET.SubElement(parent, tag, dict((k, str(v)) for k, v in attrib.items()))
+    if text is not None:
+        element.text = str(text)
+
+    return element
+
+def _shape(parent, tag, value, shape):
+
+    node = ET.SubElement(parent, tag)
+    for i in range(shape.shape[0]):
+        for j in range(shape.shape[1]):
+            _element(node, value, '%g' %shape[i,j], col=j, row=i)
+
+    return
+
+def syntheticCase(communities, tcarb=5., tStart=-20000., tEnd=0., seed=0, workdir=None):
+    """
+    Write a synthetic test case with all the forcings turned on: sea-level, tectonic,
+    temperature, pH and nutrients curves, depth dependent flow velocity and sediment input,
+    and depth, flow and sediment shape functions for each community.
+
+    Communities are spread over the 0-40 m depth range and interact with their neighbours.
+
+    Parameters
+    ----------
+    int : communities
+        Number of communities.
+
+    float : tcarb
+        Time step of the carbonate module [a].
+
+    float : tStart, tEnd
+        Simulation start and end times [a].
+
+    int : seed
+        Seed of the random community parameters.
+
+    string : workdir
+        Working directory, a temporary one is created when None.
+
+    Returns the working directory and the XmL input file name.
+    """
+
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='pyreef-bench-')
+    rng = numpy.random.RandomState(seed)
+    os.makedirs(os.path.join(workdir, 'data'))
+    t = numpy.linspace(tStart-1000., tEnd+1000., 2001)
+    span = tEnd-tStart
+    curves = {
+        'sea': 20.*numpy.sin(2.*numpy.pi*(t-tStart)/span)-5.*numpy.cos(6.*numpy.pi*t/span),
+        'tec': -1.e-4-5.e-5*numpy.sin(2.*numpy.pi*t/span),
+        'temp': 0.8+0.2*numpy.sin(4.*numpy.pi*t/span),
+        'pH': 0.9+0.1*numpy.cos(2.*numpy.pi*t/span),
+        'Nu': 0.75+0.25*numpy.sin(8.*numpy.pi*t/span),
+    }
+    for name, values in curves.items():
+        numpy.savetxt(os.path.join(workdir, 'data', name+'.csv'),
+                      numpy.column_stack((t, values)), fmt='%.8g')
+
+    root = ET.Element('pyreefcore')
+    time = _element(root, 'time')
+    for tag, value in [('start', tStart), ('end', tEnd), ('tcarb', tcarb),
+                       ('display', 100.*tcarb), ('laytime', 4.*tcarb)]:
+        _element(time, tag, value)
+
+    habitats = _element(root, 'habitats')
+    for tag, value in [('depth', 15.), ('communityNb', communities), ('maxPopulation', 20),
+                       ('prodFactor', 10), ('facOpt', 0.5), ('karstRate', 0.1e-3)]:
+        _element(habitats, tag, value)
+    for k in range(communities):
+        community = _element(habitats, 'community')
+        _element(community, 'name', 'comm%d' %k)
+        _element(community, 'malthus', '%g' %rng.uniform(0.003, 0.005))
+        _element(community, 'population', 0.)
+        _element(community, 'production', '%g' %rng.uniform(0.008, 0.012))
+    matrix = -1.e-4*rng.uniform(0.5, 1., (communities, communities))
+    matrix[numpy.abs(numpy.subtract.outer(numpy.arange(communities),
+                                          numpy.arange(communities))) > 1] = 0.
+    numpy.fill_diagonal(matrix, -5.e-4)
+    _shape(habitats, 'communityMatrix', 'value', matrix)
+
+    sea = _element(root, 'sea')
+    _element(sea, 'val', 0.)
+    _element(sea, 'curve', 'data/sea.csv')
+    tec = _element(root, 'tec')
+    _element(tec, 'val', -1.e-4)
+    _element(tec, 'curve', 'data/tec.csv')
+    for tag in ['temp', 'pH', 'Nu']:
+        _element(_element(root, tag), 'curve', 'data/%s.csv' %tag)
+
+    expdecay = _element(_element(_element(root, 'flow'), 'function'), 'expdecay')
+    for j, (x, y) in enumerate([(0.03, 25.), (0.05, 15.), (0.06, 10.), (0.13, 3.), (0.25, 0.)]):
+        _element(expdecay, 'fdvalue', x, col=j, row=0)
+        _element(expdecay, 'fdvalue', y, col=j, row=1)
+    linear = _element(_element(_element(root, 'sedinput'), 'function'), 'linear')
+    for tag, value in [('dmax', 30.), ('a', 6.67e-05), ('b', 0.001)]:
+        _element(linear, tag, value)
+
+    envi = _element(root, 'envishape')
+    width = 40./communities
+    top = numpy.arange(communities)*width
+    _shape(envi, 'depthshape', 'dvalue', numpy.column_stack((top-width, top, top+2.*width,
+                                                             top+3.*width)).clip(0.))
+    low = rng.uniform(0., 0.1, communities)
+    _shape(envi, 'flowshape', 'fvalue', numpy.column_stack((low, low+0.02, low+0.15,
+                                                            low+0.2)))
+    low = rng.uniform(0., 0.0025, communities)
+    _shape(envi, 'sedshape', 'svalue', numpy.column_stack((low, low+0.0003, low+0.001,
+                                                           low+0.002)))
+
+    solver = _element(root, 'solver')
+    for tag, value in [('method', 'dopri'), ('rtol', 1.e-6), ('atol', 1.e-6), ('grid', 0)]:
+        _element(solver, tag, value)
+    _element(root, 'outfolder', 'output')
+
+    xmlfile = os.path.join(workdir, 'input-synthetic.xml')
+    ET.ElementTree(root).write(xmlfile)
+
+    return workdir, xmlfile
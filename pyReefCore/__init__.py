@@ -13,6 +13,10 @@
 from .forcing import preProc
 from .forcing import xmlParser
 from .forcing import enviForce
+from .simulation import odeSolver
 from .simulation import coralGLV
 from .simulation import coreData
 from .simulation import modelPlot
+from .simulation import outputStore
+from .simulation import carbonateKernel
+from .simulation import coreExport
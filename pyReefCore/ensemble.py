@@ -0,0 +1,549 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   pyReefCore ensemble model: several realisations of a simulation solved together.
+
+   The members share the time definition and the number of species but can use different
+   malthusian parameters, community matrices, initial depths and forcing curves. The state
+   of the ensemble is stored in (members, species) arrays: the GLV equations of all members
+   are integrated in a single ODE system and the environmental factors and the carbonate
+   production are evaluated for all members at once.
+"""
+import numpy as np
+
+from pyReefCore import (enviForce, odeSolver, coralGLV)
+from pyReefCore.model import Model
+
+# Input parameters which have to be identical for all members
+SHARED = ['speciesNb', 'tStart', 'tEnd', 'tCarb', 'laytime', 'seaOn', 'tecOn', 'sedOn',
+          'flowOn', 'tempOn', 'pHOn', 'nutrientOn']
+
+class ensembleSolver(odeSolver.dopriSolver):
+    """
+    Dormand-Prince stepper for the stacked states of the ensemble members. All members
+    advance with the same step size which is controlled by the largest member error.
+    """
+
+    name = 'ensemble-dopri'
+
+    def __init__(self, f, members, rtol=1.e-6, atol=1.e-6, min_step=1.e-4):
+
+        super(ensembleSolver, self).__init__(f, None, rtol, atol, min_step)
+
+        self.members = members
+
+        return
+
+    def _norm(self, x):
+
+        x = x.reshape(self.members, -1)
+
+        return np.sqrt(np.einsum('ij,ij->i', x, x).max()/x.shape[1])
+
+class EnsembleModel(object):
+    """State object for an ensemble of pyReef models solved together."""
+
+    def __init__(self, solver=None):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        string : solver
+            Name of the ODE solver defined for the members, the ensemble itself is always
+            integrated with the batched Dormand-Prince stepper.
+        """
+
+        self.members = []
+        self.M = 0
+        self.solver = solver
+        self.tNow = 0.
+        self.iter = 0
+        self.layID = 0
+        self.odeRKF = None
+
+        return
+
+    def load_xml(self, filename, params=None, verbose=False):
+        """
+        Load the XML configuration of the ensemble members.
+
+        Parameters
+        ----------
+        variable : filename
+            XmL input file shared by all members or list of XmL input files (one per member).
+
+        variable : params
+            Optional list of dictionaries (one per member) of input parameters overriding
+            the ones defined in the XmL input file (e.g. malthusParam, communityMatrix,
+            depth0, seafile).
+        """
+
+        if isinstance(filename, basestring):
+            if params is None:
+                params = [{}]
+            filenames = [filename]*len(params)
+        else:
+            filenames = list(filename)
+            if params is None:
+                params = [{}]*len(filenames)
+        if len(params) != len(filenames):
+            raise ValueError('Define the same number of XmL input files and parameter sets.')
+
+        self.members = []
+        for fname, param in zip(filenames, params):
+            member = Model(solver=self.solver)
+            member.load_xml(fname, verbose=verbose, params=param, makedir=False)
+            self.members.append(member)
+
+        self._build()
+
+        return
+
+    def _build(self):
+        """
+        Stack the members parameters and records and precompute the time dependent forcing.
+        """
+
+        inputs = [member.input for member in self.members]
+        self.input = inputs[0]
+        for key in SHARED:
+            for inp in inputs[1:]:
+                if getattr(inp, key) != getattr(self.input, key):
+                    raise ValueError('All ensemble members should share the same %s.'%key)
+
+        M = len(inputs)
+        S = self.input.speciesNb
+        self.M = M
+        self.S = S
+        self.tNow = self.input.tStart
+        self.tCoral = self.tNow
+        self.tLayer = self.tNow + self.input.laytime
+        self.timetec = self.input.tStart
+        self.iter = 0
+        self.layID = 0
+
+        # Members parameters
+        self.epsilon0 = np.array([inp.malthusParam for inp in inputs], dtype=float)
+        self.epsilon = np.zeros((M,S), dtype=float)
+        alpha = np.array([inp.communityMatrix for inp in inputs], dtype=float)
+        if (alpha == alpha[0]).all():
+            self.alpha = alpha[0]
+        else:
+            self.alpha = alpha
+        self.population0 = np.array([inp.speciesPopulation for inp in inputs], dtype=float)
+        self.prod = np.array([inp.speciesProduction for inp in inputs], dtype=float)
+        self.prodscale = np.array([inp.prodscale for inp in inputs], dtype=float)
+        self.maxpop = np.array([inp.maxpop for inp in inputs], dtype=float)
+        self.facOpt = np.array([inp.facOpt for inp in inputs], dtype=float)
+        self.karstRate = np.array([inp.karstRate for inp in inputs], dtype=float)
+        self.topH = np.array([inp.depth0 for inp in inputs], dtype=float)
+
+        # Members records, each member coral and core records are views on these arrays
+        self.iterationTime = np.arange(self.input.tStart, self.input.tEnd+self.input.tCarb,
+                                       self.input.tCarb)
+        nT = len(self.iterationTime)
+        self.population = np.zeros((M,S,nT), dtype=float)
+        self.accspace = np.zeros((M,nT), dtype=float)
+        self.mbsl = np.zeros((M,nT), dtype=float)
+        core = self.members[0].core
+        self.thickness = np.zeros((M,core.layNb), dtype=float)
+        self.coralH = np.zeros((M,S+1,core.layNb), dtype=float)
+        self.karstero = np.zeros((M,core.layNb), dtype=float)
+        self.topLay = -np.ones(M, dtype=int)
+        nL = len(core.layTime)
+        records = ['sealevel', 'sedinput', 'tecrate', 'waterflow', 'nutrient', 'temperature', 'pH']
+        for name in records:
+            setattr(self, name, np.zeros((M,nL), dtype=float))
+        for m in range(M):
+            member = self.members[m]
+            member.coral = coralGLV.coralGLV(input=member.input)
+            member.coral.population = self.population[m]
+            member.coral.accspace = self.accspace[m]
+            member.coral.mbsl = self.mbsl[m]
+            member.core.thickness = self.thickness[m]
+            member.core.coralH = self.coralH[m]
+            member.core.karstero = self.karstero[m]
+            for name in records:
+                setattr(member.core, name, getattr(self, name)[m])
+
+        # Time dependent forcing of each member for all carbonate steps
+        forces = [member.force for member in self.members]
+        for f in forces:
+            f.buildTimeline(self.iterationTime)
+        self.seaTime = self._stack_timeline(forces, 'sea', 'sea0')
+        self.tecTime = self._stack_timeline(forces, 'tec', 'tec0')
+        # Times used by the tectonic rate, clamped to the curve extent
+        self.tecClock = np.array([f.timeline['tecclock'] for f in forces])
+        self.sedTime = self._stack_timeline(forces, 'sed', 'sed0')
+        self.flowTime = self._stack_timeline(forces, 'flow', 'flow0')
+        self.tempTime = self._stack_timeline(forces, 'temp')
+        self.pHTime = self._stack_timeline(forces, 'pH')
+        self.nuTime = self._stack_timeline(forces, 'nu')
+
+        # Depth dependent sediment input and flow velocity functions
+        self.sedFct = self._depth_functions(forces, 'sed')
+        self.flowFct = self._depth_functions(forces, 'flow')
+
+        # Trapezoidal production curves sampled by each member
+        if self.input.seaOn:
+            self.depthMbs = self._membership_tables(forces, 'xd', 'dtrap', 'depth')
+        if self.input.sedOn:
+            self.sedMbs = self._membership_tables(forces, 'xs', 'strap', 'sed')
+        if self.input.flowOn:
+            self.flowMbs = self._membership_tables(forces, 'xf', 'ftrap', 'flow')
+        self.oldsea = None
+
+        # Batched GLV solver, all members are integrated as a single system
+        self._dX = np.zeros((M,S), dtype=float)
+        self._dXflat = self._dX.reshape(-1)
+        self.odeRKF = ensembleSolver(self._functionGLV, M, rtol=self.input.odeRtol,
+                                     atol=self.input.odeAtol, min_step=self.input.odeMinStep)
+
+        return
+
+    def _stack_timeline(self, forces, name, constant=None):
+        """
+        Stack the timelines of a forcing for all members, members without a time curve
+        use their constant level (or 1 when no constant is defined).
+        """
+
+        nT = len(self.iterationTime)
+        timeline = np.ones((len(forces),nT), dtype=float)
+        for m in range(len(forces)):
+            f = forces[m]
+            if name in f.timeline:
+                timeline[m] = f.timeline[name]
+            elif constant is not None:
+                timeline[m] = getattr(f, constant)
+
+        return timeline
+
+    def _membership_tables(self, forces, grid, table, name):
+        """
+        Stack the membership functions of the members sampled on their uniform grids.
+        """
+
+        return (np.array([getattr(f, table) for f in forces]),
+                np.array([getattr(f, grid)[-1] for f in forces]),
+                np.array([getattr(f, name+'below') for f in forces]),
+                np.array([getattr(f, name+'above') for f in forces]))
+
+    def _depth_functions(self, forces, name):
+        """
+        Gather the coefficients of the depth dependent functions used by the members.
+        Function type is 0 for a time curve, 1 for a linear and 2 for an exponential decay.
+        """
+
+        M = len(forces)
+        kind = np.zeros(M, dtype=int)
+        lin = np.zeros((M,2), dtype=float)
+        opt = np.zeros((M,3), dtype=float)
+        xmin = np.zeros(M, dtype=float)
+        xmax = np.zeros(M, dtype=float)
+        for m in range(M):
+            f = forces[m]
+            if not getattr(f, name+'fct'):
+                continue
+            x = getattr(f, 'plot'+name+'x')
+            xmin[m] = x.min()
+            xmax[m] = x.max()
+            if getattr(f, name+'lin') is None:
+                kind[m] = 2
+                opt[m] = getattr(f, name+'opt')
+            else:
+                kind[m] = 1
+                lin[m] = getattr(f, name+'lin')
+
+        return kind, lin, opt, xmin, xmax
+
+    def _depth_level(self, fct, elev, level):
+        """
+        Evaluate the depth dependent forcing level of the members using a function of the
+        elevation, the time curve level is kept for the other members.
+        """
+
+        kind, lin, opt, xmin, xmax = fct
+        if not kind.any():
+            return level
+        with np.errstate(over='ignore', invalid='ignore'):
+            val = np.where(kind == 1, lin[:,0]*elev+lin[:,1],
+                           opt[:,0]*np.exp(-opt[:,1]*elev)+opt[:,2])
+        val[np.logical_or(elev > xmax, elev < xmin)] = 0.
+        val[val < 0.] = 0.
+
+        return np.where(kind > 0, val, level)
+
+    def _functionGLV(self, X, t):
+        """
+        Generalized Lotka-Volterra equation for all the members.
+
+        Parameters
+        ----------
+
+        variable : X
+            Stacked species population distribution of the members.
+
+        variable : t
+            Time step on which to solve the ODEs for.
+        """
+
+        X = X.reshape(self.M, self.S)
+        if self.alpha.ndim == 2:
+            np.dot(X, self.alpha.T, out=self._dX)
+        else:
+            np.einsum('mij,mj->mi', self.alpha, X, out=self._dX)
+        self._dX += self.epsilon
+        self._dX *= X
+
+        return self._dXflat
+
+    def run_to_time(self, tEnd, showtime=10, verbose=False):
+        """
+        Run the ensemble simulation to a specified point in time (tEnd).
+        """
+
+        timeVerbose = self.tNow+showtime
+        print 'tNow = %s [yr]' %self.tNow
+
+        if tEnd > self.input.tEnd:
+            tEnd = self.input.tEnd
+            print 'Requested end time is longer than the one defined in your XmL input file'
+            print 'Your simulation will run for %s years.'%(tEnd)
+
+        M = self.M
+        S = self.S
+        dfac = np.ones((M,S), dtype=float)
+        sfac = np.ones((M,S), dtype=float)
+        ffac = np.ones((M,S), dtype=float)
+        while self.tNow < tEnd:
+
+            j = self.iter
+            if self.tNow == self.input.tStart:
+                self.population[:,:,j] = self.population0
+                rec = self.layID
+            else:
+                rec = self.layID+1
+
+            # Get tectonic
+            if self.input.tecOn:
+                self.topH -= self.tecTime[:,j]*(self.tecClock[:,j]-self.timetec)
+                self.timetec = self.tecClock[:,j]
+                self.tecrate[:,rec] = self.tecTime[:,j]
+            else:
+                self.tecrate[:,self.layID+1] = 0.
+
+            # Get sea-level
+            if self.input.seaOn:
+                if self.oldsea is not None:
+                    self.topH += self.seaTime[:,j]-self.oldsea
+                self.oldsea = self.seaTime[:,j]
+                dfac = enviForce.membershipFactors(self.topH, *self.depthMbs)
+                self.sealevel[:,rec] = self.seaTime[:,j]
+                self.mbsl[:,j] = self.seaTime[:,j]
+            else:
+                self.sealevel[:,rec] = 0.
+                self.mbsl[:,j] = 0.
+
+            # Store accommodation space through time
+            self.accspace[:,j] = self.topH
+
+            # Get sediment input
+            if self.input.sedOn:
+                sedh = self._depth_level(self.sedFct, self.topH, self.sedTime[:,j])
+                sfac = enviForce.membershipFactors(sedh, *self.sedMbs)
+                self.sedinput[:,self.layID] = sedh
+            else:
+                sedh = np.zeros(M, dtype=float)
+
+            # Get flow velocity
+            if self.input.flowOn:
+                flowh = self._depth_level(self.flowFct, self.topH, self.flowTime[:,j])
+                ffac = enviForce.membershipFactors(flowh, *self.flowMbs)
+                self.waterflow[:,self.layID] = flowh
+
+            # Limit species activity from environmental forces
+            fac = np.minimum(dfac, sfac)
+            np.minimum(fac, ffac, out=fac)
+            if self.input.tempOn:
+                np.minimum(fac, self.tempTime[:,j,None], out=fac)
+                self.temperature[:,self.layID] = self.tempTime[:,j]
+            if self.input.pHOn:
+                np.minimum(fac, self.pHTime[:,j,None], out=fac)
+                self.pH[:,self.layID] = self.pHTime[:,j]
+            if self.input.nutrientOn:
+                np.minimum(fac, self.nuTime[:,j,None], out=fac)
+                self.nutrient[:,self.layID] = self.nuTime[:,j]
+
+            # Re-arm the batched solver
+            np.multiply(self.epsilon0, fac, out=self.epsilon)
+            self.odeRKF.set_initial_condition(self.population[:,:,j].ravel())
+
+            # Solve the Generalized Lotka-Volterra equation of all members
+            self.tCoral += self.input.tCarb
+            population, dense = self.odeRKF.advance(self.tNow, self.tCoral)
+            population = population.reshape(M,S)
+            np.minimum(population, self.maxpop[:,None], out=population)
+
+            # Update coral population
+            self.iter += 1
+            population[self.epsilon == 0.] = 0.
+            population[np.logical_and(fac >= self.facOpt[:,None], population == 0.)] = 1.
+
+            # In case there is no accommodation space
+            exposed = self.topH <= 0.
+            population[exposed] = 0.
+            ero = np.zeros(M, dtype=float)
+            ero[exposed] = np.maximum(-self.karstRate*self.input.tCarb, self.topH)[exposed]
+            self.population[:,:,self.iter] = population
+
+            # Compute carbonate production and update coral cores characteristics
+            self._coralProduction(population, sedh, ero)
+
+            # Update time step
+            self.tNow = self.tCoral
+
+            # Update stratigraphic layer ID
+            if self.tLayer <= self.tNow :
+                self.tLayer += self.input.laytime
+                self.layID += 1
+
+            if self.tNow>=timeVerbose:
+                timeVerbose = self.tNow+showtime
+                print 'tNow = %s [yr]' %self.tNow
+
+        # Update members state, summary metrics and plotting parameters
+        for m in range(M):
+            member = self.members[m]
+            member.core.topH = self.topH[m]
+            member.core.topLay = self.topLay[m]
+            member.core.metrics.rebuild(self.coralH[m], self.thickness[m], self.karstero[m],
+                                        self.topLay[m])
+            member.tNow = self.tNow
+            member.iter = self.iter
+            member.layID = self.layID
+            member._update_plot()
+
+        return
+
+    def _coralProduction(self, population, sedh, ero):
+        """
+        Estimate the coral growth of all members based on newly computed populations
+        (see coreData.coralProduction).
+
+        Parameters
+        ----------
+
+        variable : population
+            Species population distribution of the members at current time step.
+
+        variable : sedh
+            Silicilastic sediment input of the members m/d
+
+        variable : ero
+            Amount of erosion due to karstification of the members
+        """
+
+        dt = self.input.tCarb
+        layID = self.layID
+        S = self.S
+
+        # Compute production for the given time step [m]
+        production = self.prod * population * (dt / self.prodscale[:,None])
+        production[self.epsilon <= 0.] = 0.
+        np.minimum(production, self.prod*dt, out=production)
+
+        # Total thickness deposited
+        sh = sedh * dt
+        prodsum = production.sum(axis=1)
+        toth = prodsum + sh
+
+        topH = self.topH
+        karst = np.where(np.logical_and(topH < 0., ero < 0.))[0]
+        filled = np.logical_and(topH > 0., topH - sh < 0.)
+        grow = np.logical_and(topH > 0., ~filled)
+        partial = np.where(np.logical_and(grow, topH - toth < 0.))[0]
+        grow = np.where(grow)[0]
+
+        # Karstification of the exposed cores
+        if len(karst) > 0:
+            self._karstification(karst, -ero[karst])
+
+        # Accommodation space filled by sediments
+        ids = np.where(filled)[0]
+        self.coralH[ids,S,layID] += topH[ids]
+        self.thickness[ids,layID] += topH[ids]
+        topH[ids] = 0.
+
+        # Accommodation space disappearing due to carbonate growth and sediment input
+        frac = (topH[partial] - sh[partial])/prodsum[partial]
+        production[partial] *= frac[:,None]
+        toth[partial] = production[partial].sum(axis=1) + sh[partial]
+
+        # Update current layer composition, thickness and top elevation
+        self.coralH[grow,:S,layID] += production[grow]
+        self.coralH[grow,S,layID] += sh[grow]
+        self.thickness[grow,layID] += toth[grow]
+        topH[grow] -= toth[grow]
+
+        # Uppermost layer containing sediments for each member
+        self.topLay[self.thickness[:,layID] > 0.] = layID
+
+        return
+
+    def _karstification(self, ids, remero):
+        """
+        Erode the cores of the exposed members from their top layer downwards. Layers are
+        entirely removed as long as the cumulative thickness from the top is lower than the
+        erosion, the next one is partially eroded. Only a band of layers below the top one
+        is read, it is enlarged until it contains the requested erosion.
+
+        Parameters
+        ----------
+
+        variable : ids
+            Indices of the exposed members.
+
+        variable : remero
+            Thickness to erode due to karstification for each exposed member [m].
+        """
+
+        top = self.topLay[ids]
+        rows = ids[:,None]
+        band = 8
+        while True:
+            cols = top[:,None] - np.arange(band)
+            valid = cols >= 0
+            cols = np.maximum(cols, 0)
+            thick = np.where(valid, self.thickness[rows,cols], 0.)
+            cumthick = np.cumsum(thick, axis=1)
+            if np.logical_or(cumthick[:,-1] >= remero, ~valid[:,-1]).all():
+                break
+            band *= 4
+
+        remero = remero[:,None]
+        full = np.logical_and(cumthick <= remero, valid)
+        amount = np.where(full, thick,
+                          np.minimum(np.maximum(remero-cumthick+thick, 0.), thick))
+        perc = np.where(full, 1., amount/np.where(thick > 0., thick, 1.))
+        left = thick - amount
+
+        r = np.broadcast_to(rows, cols.shape)[valid]
+        c = cols[valid]
+        self.thickness[r,c] = left[valid]
+        self.karstero[r,c] += amount[valid]
+        self.coralH[r,:,c] *= (1.-perc[valid])[:,None]
+        self.topH[ids] += amount.sum(axis=1)
+
+        # Update the uppermost layers containing sediments
+        remain = left > 0.
+        first = np.argmax(remain, axis=1)
+        self.topLay[ids] = np.where(remain.any(axis=1), top-first, top-band)
+
+        return
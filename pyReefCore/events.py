@@ -0,0 +1,135 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   pyReefCore stop conditions of Model.run_to_time. A stop condition is any callable taking
+   the model and returning True when the simulation should stop, it is checked after each
+   carbonate step and after each phase advanced by the fast-forward. The conditions below
+   are classes so that they can be sent to the workers of the sweep runners.
+
+   A phase of null populations advanced by the fast-forward ends at the step reaching a
+   condition, given by its phaseStep method, so that the run stops at the same step as
+   without fast-forward. The phase is described by a dictionary of the state after each of
+   its steps: exposed (True for an exposed core), topLay (uppermost layer containing
+   sediments, -1 once the core is removed), deposited and eroded (cumulative thicknesses
+   since the start of the phase), the model being at the start of the phase. The
+   fast-forward advances the steps one by one when a condition has no phaseStep method.
+"""
+import numpy
+import math
+
+def conditionName(condition):
+    """
+    Name of a stop condition used in the reports.
+    """
+
+    return getattr(condition, 'name', getattr(condition, '__name__', repr(condition)))
+
+class CoreRemoved(object):
+    """
+    Stop when the core is exposed and karstification has removed all its sediments.
+    """
+
+    name = 'core removed'
+
+    def __call__(self, model):
+
+        core = model.core
+
+        return core.topH <= 0. and core.topLay < 0 and core.metrics.eroded > 0.
+
+    def phaseStep(self, model, phase):
+        """
+        First step of a fast-forwarded phase reaching the condition, None if not reached.
+        """
+
+        if not phase['exposed']:
+            return None
+        eroded = model.core.metrics.eroded+phase['eroded']
+        steps = numpy.flatnonzero((phase['topLay'] < 0) & (eroded > 0.))
+        if len(steps) == 0:
+            return None
+
+        return steps[0]
+
+class PopulationsCollapsed(object):
+    """
+    Stop when all the populations have been null for a given duration.
+
+    Parameters
+    ----------
+    float : duration
+        Duration of the collapse [y], the simulation stops as soon as all the populations
+        are null when 0.
+    """
+
+    name = 'populations collapsed'
+
+    def __init__(self, duration=0.):
+
+        self.duration = duration
+
+        return
+
+    def __call__(self, model):
+
+        steps = int(math.ceil(self.duration/model.input.tCarb))
+        if model.iter < steps:
+            return False
+
+        return not model.coral.population[:,model.iter-steps:model.iter+1].any()
+
+    def phaseStep(self, model, phase):
+        """
+        First step of a fast-forwarded phase reaching the condition, None if not reached.
+        """
+
+        steps = int(math.ceil(self.duration/model.input.tCarb))
+        # Last carbonate step with populations before the phase
+        start = max(model.iter-steps+1, 0)
+        alive = numpy.flatnonzero(model.coral.population[:,start:model.iter+1].any(axis=0))
+        last = start+alive[-1] if len(alive) > 0 else -1
+        first = max(steps, last+steps+1)-model.iter-1
+        if first >= len(phase['topLay']):
+            return None
+
+        return max(first, 0)
+
+class ThicknessReached(object):
+    """
+    Stop when the core reaches a given thickness.
+
+    Parameters
+    ----------
+    float : thickness
+        Core thickness [m].
+    """
+
+    name = 'thickness'
+
+    def __init__(self, thickness):
+
+        self.thickness = thickness
+
+        return
+
+    def __call__(self, model):
+
+        return model.core.metrics.total(model.core.thickness) >= self.thickness
+
+    def phaseStep(self, model, phase):
+        """
+        First step of a fast-forwarded phase reaching the condition, None if not reached.
+        """
+
+        total = model.core.metrics.total(model.core.thickness)
+        steps = numpy.flatnonzero(total+phase['deposited']-phase['eroded'] >= self.thickness)
+        if len(steps) == 0:
+            return None
+
+        return steps[0]
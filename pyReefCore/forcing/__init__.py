@@ -13,4 +13,5 @@
 
 import xmlParser
 import preProc
+import curveCache
 import enviForce
@@ -0,0 +1,228 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module reads the forcing curve files (sea level, tectonic, sediment input...) through
+a binary cache, so that a curve used by many simulations is only parsed once.
+
+Parsed curves are saved as .npy files named after the hash of the curve file content in
+a cache folder of the user, PYREEF_CACHE_DIR or pyreefcore in the user cache folder
+(XDG_CACHE_HOME or ~/.cache) by default. A folder or cache file owned by another user is
+never read nor written, the curves are then parsed from their files.
+The hash of each curve file is kept with its modification time, size, inode and number of
+rows and columns, and is only computed again when they change. A file rewritten within the
+resolution of the modification times keeps them, so the hash is also checked again when the
+file was modified less than RACY seconds before it was last hashed. A cached curve whose
+shape differs from the one of its file is parsed again.
+Cached curves are memory-mapped, so processes reading the same curve share its pages, and
+are also kept in memory by each process as long as the curve file does not change, with the
+same checks. Worker processes forked after a curve has been read inherit it.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import time
+import numpy
+
+# Curves read by the process, indexed by file path with the key and hash of the file and the
+# time it was hashed
+_curves = {}
+
+# Files modified less than this time [s] before being hashed may be modified again without
+# changing their key, their hash is then checked at each read
+RACY = 2.
+
+def cacheFolder():
+    """
+    Folder of the binary curves.
+    """
+
+    folder = os.environ.get('PYREEF_CACHE_DIR')
+    if folder is None:
+        base = os.environ.get('XDG_CACHE_HOME')
+        if base is None:
+            base = os.path.join(os.path.expanduser('~'), '.cache')
+        folder = os.path.join(base, 'pyreefcore')
+
+    return folder
+
+def _owned(path):
+    """
+    Check that a cache folder or file belongs to the current user.
+    """
+
+    if not hasattr(os, 'getuid'):
+        return True
+
+    return os.stat(path).st_uid == os.getuid()
+
+def _trustedFolder(folder):
+    """
+    Create the cache folder if needed (only accessible by the user) and check that it
+    belongs to the current user and cannot be written by others, the cache is not used
+    otherwise.
+    """
+
+    try:
+        if not os.path.exists(folder):
+            os.makedirs(folder, 0o700)
+        if not os.path.isdir(folder) or not _owned(folder):
+            return False
+        return not hasattr(os, 'getuid') or os.stat(folder).st_mode & 0o022 == 0
+    except (IOError, OSError):
+        return False
+
+def _fileKey(stat):
+    """
+    Modification time (in nanoseconds when available), size and inode of a curve file.
+    """
+
+    return [getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size, stat.st_ino]
+
+def _hashCurve(path):
+    """
+    Content hash and shape of a curve file.
+    """
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    return hashlib.sha1(content).hexdigest(), _curveShape(content)
+
+def _curveShape(content):
+    """
+    Number of rows and columns of a whitespace-delimited curve file content.
+    """
+
+    rows = [line for line in content.splitlines() if line.strip()]
+    if len(rows) == 0:
+        return [0, 0]
+
+    return [len(rows), len(rows[0].split())]
+
+def _parseCurve(filename):
+    """
+    Parse a whitespace-delimited curve file.
+    """
+
+    import pandas
+
+    data = pandas.read_csv(filename, sep=r'\s+', engine='c',
+                           header=None, na_filter=False,
+                           dtype=numpy.float, low_memory=False)
+
+    return numpy.ascontiguousarray(data.values, dtype=float)
+
+def _write(filename, dump):
+    """
+    Write a cache file through a unique temporary file, so that concurrent processes never
+    read a partially written file. The cache is skipped if the folder is not writable.
+    """
+
+    folder = os.path.dirname(filename)
+    try:
+        fd, tmpname = tempfile.mkstemp(dir=folder)
+        with os.fdopen(fd, 'wb') as f:
+            dump(f)
+        os.rename(tmpname, filename)
+    except (IOError, OSError):
+        pass
+
+    return
+
+def readCurve(filename, cache=True):
+    """
+    Read a forcing curve file, returns a read only array of its columns.
+
+    Parameters
+    ----------
+    string : filename
+        Curve file name.
+
+    bool : cache
+        If False, the file is parsed without using nor updating the cache.
+    """
+
+    if not cache:
+        return _parseCurve(filename)
+
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    key = _fileKey(stat)
+    entry = _curves.get(path)
+    if entry is not None and entry[0] == key:
+        if entry[2]-stat.st_mtime >= RACY:
+            return entry[3]
+        digest = _hashCurve(path)[0]
+        if digest == entry[1]:
+            _curves[path] = (key, digest, time.time(), entry[3])
+            return entry[3]
+
+    folder = cacheFolder()
+    if not _trustedFolder(folder):
+        checked = time.time()
+        digest = _hashCurve(path)[0]
+        data = _parseCurve(path)
+        data.flags.writeable = False
+        _curves[path] = (key, digest, checked, data)
+        return data
+
+    # Content hash of the file, only computed again when its key changes or when the file
+    # was modified just before being hashed
+    index = os.path.join(folder, hashlib.sha1(path).hexdigest()+'.json')
+    digest = None
+    try:
+        with open(index) as f:
+            if _owned(index):
+                meta = json.load(f)
+                if meta['key'] == key and meta['checked']-stat.st_mtime >= RACY:
+                    digest = str(meta['digest'])
+                    shape = tuple(meta['shape'])
+                    checked = meta['checked']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    if digest is None:
+        checked = time.time()
+        digest, shape = _hashCurve(path)
+        _write(index, lambda f: json.dump({'key': key, 'checked': checked,
+                                           'digest': digest, 'shape': shape}, f))
+        shape = tuple(shape)
+    binary = os.path.join(folder, digest+'.npy')
+    data = None
+    try:
+        if _owned(binary):
+            # Plain array view of the memory map, faster to index and reduce than a memmap
+            data = numpy.load(binary, mmap_mode='r').view(numpy.ndarray)
+            if data.shape != shape or data.dtype != numpy.float64:
+                data = None
+    except (IOError, OSError, ValueError):
+        data = None
+    if data is None:
+        data = _parseCurve(path)
+        data.flags.writeable = False
+        if data.shape == shape:
+            _write(binary, lambda f: numpy.save(f, data))
+    _curves[path] = (key, digest, checked, data)
+
+    return data
+
+def clearCache(disk=False):
+    """
+    Forget the curves read by the process and, if disk is True, remove the cache files.
+    """
+
+    _curves.clear()
+    if disk:
+        folder = cacheFolder()
+        if os.path.isdir(folder) and _owned(folder):
+            for name in os.listdir(folder):
+                if name.endswith('.npy') or name.endswith('.json'):
+                    os.remove(os.path.join(folder, name))
+
+    return
@@ -14,11 +14,109 @@ import warnings
 
 import os
 import numpy
-import pandas
-import skfuzzy as fuzz
-from scipy import interpolate
-from scipy.optimize import curve_fit
-from scipy.optimize import OptimizeWarning
+
+from pyReefCore.forcing import curveCache
+
+def trapezoid(x, abcd):
+    """
+    Trapezoidal membership function, gives the same values as skfuzzy.trapmf.
+
+    Parameters
+    ----------
+    variable : x
+        Independent variable.
+
+    variable : abcd
+        Corners a <= b <= c <= d of the trapezoid.
+    """
+
+    a, b, c, d = numpy.r_[abcd]
+    y = numpy.ones(len(x))
+
+    # Rising edge
+    ids = x <= b
+    y[ids] = 0.
+    if a != b:
+        edge = numpy.logical_and(a < x, x < b)
+        y[edge] = (x[edge]-a)/float(b-a)
+    y[x == b] = 1.
+
+    # Falling edge
+    ids = x >= c
+    y[ids] = 0.
+    if c != d:
+        edge = numpy.logical_and(c < x, x < d)
+        y[edge] = (d-x[edge])/float(d-c)
+    y[x == c] = 1.
+
+    y[x < a] = 0.
+    y[x > d] = 0.
+
+    return y
+
+def _interp1d(x, y, kind):
+    """
+    Interpolation function of a forcing curve, scipy.interpolate is only imported when a
+    curve is used.
+    """
+
+    from scipy import interpolate
+
+    return interpolate.interp1d(x, y, kind=kind)
+
+def _curve_fit(func, x, y):
+    """
+    Least squares fit of the decay functions, scipy.optimize is only imported when needed.
+    """
+
+    from scipy.optimize import curve_fit
+    from scipy.optimize import OptimizeWarning
+
+    warnings.filterwarnings('ignore', category=OptimizeWarning)
+
+    return curve_fit(func, x, y)
+
+def membershipFactors(x, table, xmax, below, above):
+    """
+    Computes the degree of membership of forcing values for trapezoidal production curves
+    sampled on a uniform grid between 0 and xmax. The grid interval containing each value is
+    found by index computation and the membership is linearly interpolated on it, so the
+    cost does not depend on the grid size. Values outside the grid take the below or above
+    factors. Evaluation is vectorised over a leading axis (e.g. ensemble members) and over
+    the species.
+
+    Parameters
+    ----------
+    variable : x
+        Forcing values, shape (M,).
+
+    variable : table
+        Membership curves sampled on the grid, shape (M, speciesNb, grid size).
+
+    variable : xmax
+        Upper bound of the grid, shape (M,).
+
+    variable : below
+        Factors used for values lower than 0, shape (M, speciesNb).
+
+    variable : above
+        Factors used for values greater than xmax, shape (M, speciesNb).
+    """
+
+    x = numpy.asarray(x, dtype=float)
+    M, S, nb = table.shape
+    span = numpy.where(xmax > 0., xmax, 1.)
+    pos = numpy.clip(x/span, 0., 1.)*(nb-1)
+    ids = numpy.minimum(pos.astype(int), nb-2)
+    w = (pos-ids)[:,None]
+    rows = numpy.arange(M)[:,None]
+    cols = numpy.arange(S)[None,:]
+    factors = table[rows,cols,ids[:,None]]*(1.-w)+table[rows,cols,ids[:,None]+1]*w
+
+    factors = numpy.where((x < 0.)[:,None], below, factors)
+    factors = numpy.where((x > xmax)[:,None], above, factors)
+
+    return factors
 
 class enviForce:
     """
@@ -106,8 +204,7 @@ class enviForce:
                 xf = input.flowdecay[1,:]
                 self.xflow = xf
                 self.yflow = yf
-                warnings.filterwarnings('ignore', category=OptimizeWarning)
-                popt, pcov = curve_fit(self._expdecay_func, xf, yf)
+                popt, pcov = _curve_fit(self._expdecay_func, xf, yf)
                 self.flowopt = popt
                 self.plotflowx = numpy.linspace(0., xf.max(), 100)
                 self.plotflowy = self._expdecay_func(self.plotflowx, *popt)
@@ -123,8 +220,7 @@ class enviForce:
             if input.seddecay != None:
                 y = input.seddecay[0,:]
                 x = input.seddecay[1,:]
-                warnings.filterwarnings('ignore', category=OptimizeWarning)
-                popt, pcov = curve_fit(self._expdecay_func, x, y)
+                popt, pcov = _curve_fit(self._expdecay_func, x, y)
                 self.sedopt = popt
                 self.plotsedx = numpy.linspace(0, x.max(), 100)
                 self.plotsedy = self._expdecay_func(self.plotsedx, *popt)
@@ -145,8 +241,11 @@ class enviForce:
             self.edepth = input.enviDepth
             # Trapeizoidal environment depth production curve
             self.xd = numpy.linspace(0, self.edepth.max(), num=1001, endpoint=True)
-            for s in range(input.speciesNb):
-                self.dtrap.append(fuzz.trapmf(self.xd, self.edepth[s,:]))
+            self.dtrap = numpy.array([trapezoid(self.xd, self.edepth[s,:])
+                                     for s in range(input.speciesNb)])
+            # Factors outside of the sampled interval
+            self.depthbelow = (self.edepth[:,1] == self.edepth[:,0]).astype(float)
+            self.depthabove = (self.edepth[:,2] == self.edepth[:,3]).astype(float)
 
         self.speciesNb = input.speciesNb
         self.eflow = None
@@ -158,8 +257,11 @@ class enviForce:
             self.eflow = input.enviFlow
             # Trapeizoidal environment flow production curve
             self.xf = numpy.linspace(0, self.eflow.max(), num=1001, endpoint=True)
-            for s in range(input.speciesNb):
-                self.ftrap.append(fuzz.trapmf(self.xf, self.eflow[s,:]))
+            self.ftrap = numpy.array([trapezoid(self.xf, self.eflow[s,:])
+                                     for s in range(input.speciesNb)])
+            # Factors outside of the sampled interval
+            self.flowbelow = (self.eflow[:,1] == self.eflow[:,0]).astype(float)
+            self.flowabove = (self.eflow[:,2] == self.eflow[:,3]).astype(float)
 
         self.esed = None
         self.xs = None
@@ -170,8 +272,25 @@ class enviForce:
             self.esed = input.enviSed
             # Trapeizoidal environment sediment production curve
             self.xs = numpy.linspace(0, self.esed.max(), num=1001, endpoint=True)
-            for s in range(input.speciesNb):
-                self.strap.append(fuzz.trapmf(self.xs, self.esed[s,:]))
+            self.strap = numpy.array([trapezoid(self.xs, self.esed[s,:])
+                                     for s in range(input.speciesNb)])
+            # Factors outside of the sampled interval
+            self.sedbelow = (self.esed[:,1] == self.esed[:,0]).astype(float)
+            self.sedabove = (self.esed[:,2] == self.esed[:,3]).astype(float)
+
+        # Active forcings limiting species activity, in the order of getFactors rows
+        self.forcings = []
+        for name, active in [('depth', input.seaOn), ('sed', input.sedOn), ('flow', input.flowOn),
+                             ('temp', input.tempOn), ('pH', input.pHOn), ('nu', input.nutrientOn)]:
+            if active:
+                self.forcings.append(name)
+        self.factors = numpy.ones((len(self.forcings),input.speciesNb),dtype=float)
+        self.levels = numpy.ones(len(self.forcings),dtype=float)
+        # Work array of the membership interpolation
+        self._work = numpy.zeros(input.speciesNb,dtype=float)
+
+        # Time dependent forcing levels precomputed for each carbonate step
+        self.timeline = {}
 
         return
 
@@ -179,161 +298,478 @@ class enviForce:
 
         return a*numpy.exp(-b*x) + c
 
-    def _extract_enviParam(self, x, xmf, xx):
-        """
-        Find the degree of membership ``u(xx)`` for a given value of ``x = xx``.
+    def _membership(self, value, x, xmf, below, above, out=None):
         """
+        Find the degree of membership of all species for a given forcing value.
 
-        # Nearest discrete x-values
-        x1 = x[x <= xx][-1]
-        x2 = x[x >= xx][0]
+        Parameters
+        ----------
+        float : value
+            Forcing value.
 
-        idx1 = numpy.nonzero(x == x1)[0][0]
-        idx2 = numpy.nonzero(x == x2)[0][0]
+        variable : x
+            Uniform grid on which the membership functions are sampled.
 
-        xmf1 = xmf[idx1]
-        xmf2 = xmf[idx2]
+        variable : xmf
+            Membership functions of each species sampled on the grid.
 
-        if x1 == x2:
-            xxmf = xmf[idx1]
-        else:
-            slope = (xmf2 - xmf1) / float(x2 - x1)
-            xxmf = slope * (xx - x1) + xmf1
+        variable : below
+            Factors of each species for values below the grid.
+
+        variable : above
+            Factors of each species for values above the grid.
+
+        variable : out
+            Optional array in which the factors are written, a new array is returned when None.
+        """
+
+        if out is None:
+            out = numpy.empty(len(below),dtype=float)
+        if value < 0.:
+            out[:] = below
+            return out
+        if value > x[-1]:
+            out[:] = above
+            return out
 
-        return xxmf
+        # Index of the grid interval containing the value
+        nb = xmf.shape[1]
+        pos = 0.
+        if x[-1] > 0.:
+            pos = value/x[-1]*(nb-1)
+        i = min(int(pos), nb-2)
+        w = pos-i
+
+        numpy.multiply(xmf[:,i], 1.-w, out=out)
+        numpy.multiply(xmf[:,i+1], w, out=self._work)
+        out += self._work
+
+        return out
 
     def _build_Sea_function(self):
         """
-        Using Pandas library to read the sea level file and define sea level interpolation
+        Using the curve cache to read the sea level file and define sea level interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read sea level file
-        seadata = pandas.read_csv(self.seafile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        seadata = curveCache.readCurve(self.seafile)
 
-        self.seatime = seadata.values[:,0]
-        tmp = seadata.values[:,1]
-        self.seaFunc = interpolate.interp1d(self.seatime, tmp, kind='linear')
+        self.seatime = seadata[:,0]
+        tmp = seadata[:,1]
+        self.seaFunc = _interp1d(self.seatime, tmp, kind='linear')
 
         return
 
     def _build_Temp_function(self):
         """
-        Using Pandas library to read the temperature file and define temperature interpolation
+        Using the curve cache to read the temperature file and define temperature interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read temperature file
-        tempdata = pandas.read_csv(self.tempfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        tempdata = curveCache.readCurve(self.tempfile)
 
-        self.temptime = tempdata.values[:,0]
-        tmp = tempdata.values[:,1]
+        self.temptime = tempdata[:,0]
+        tmp = tempdata[:,1]
         if tmp.max()>1.:
             raise ValueError('Error the temperature function should have value between 0 and 1.')
         if tmp.min()<0.:
             raise ValueError('Error the temperature function should have value between 0 and 1.')
-        self.tempFunc = interpolate.interp1d(self.temptime, tmp, kind='linear')
+        self.tempFunc = _interp1d(self.temptime, tmp, kind='linear')
 
         return
 
     def _build_pH_function(self):
         """
-        Using Pandas library to read the pH file and define pH interpolation
+        Using the curve cache to read the pH file and define pH interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read pH file
-        pHdata = pandas.read_csv(self.pHfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        pHdata = curveCache.readCurve(self.pHfile)
 
-        self.pHtime = pHdata.values[:,0]
-        tmp = pHdata.values[:,1]
+        self.pHtime = pHdata[:,0]
+        tmp = pHdata[:,1]
         if tmp.max()>1.:
             raise ValueError('Error the pH function should have value between 0 and 1.')
         if tmp.min()<0.:
             raise ValueError('Error the pH function should have value between 0 and 1.')
-        self.pHFunc = interpolate.interp1d(self.pHtime, tmp, kind='linear')
+        self.pHFunc = _interp1d(self.pHtime, tmp, kind='linear')
 
         return
 
     def _build_nu_function(self):
         """
-        Using Pandas library to read the nutrients file and define nutrients interpolation
+        Using the curve cache to read the nutrients file and define nutrients interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read nutrients file
-        nudata = pandas.read_csv(self.nufile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        nudata = curveCache.readCurve(self.nufile)
 
-        self.nutime = nudata.values[:,0]
-        tmp = nudata.values[:,1]
+        self.nutime = nudata[:,0]
+        tmp = nudata[:,1]
         if tmp.max()>1.:
             raise ValueError('Error the nutrient function should have value between 0 and 1.')
         if tmp.min()<0.:
             raise ValueError('Error the nutrient function should have value between 0 and 1.')
-        self.nuFunc = interpolate.interp1d(self.nutime, tmp, kind='linear')
+        self.nuFunc = _interp1d(self.nutime, tmp, kind='linear')
 
         return
 
     def _build_Tec_function(self):
         """
-        Using Pandas library to read the tectonic file and define tectonic interpolation
+        Using the curve cache to read the tectonic file and define tectonic interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read tectonic file
-        tecdata = pandas.read_csv(self.tecfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        tecdata = curveCache.readCurve(self.tecfile)
 
-        self.tectime = tecdata.values[:,0]
-        tmp = tecdata.values[:,1]
-        self.tecFunc = interpolate.interp1d(self.tectime, tmp, kind='linear')
+        self.tectime = tecdata[:,0]
+        tmp = tecdata[:,1]
+        self.tecFunc = _interp1d(self.tectime, tmp, kind='linear')
 
         return
 
     def _build_Sed_function(self):
         """
-        Using Pandas library to read the sediment input file and define interpolation
+        Using the curve cache to read the sediment input file and define interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read sea level file
-        seddata = pandas.read_csv(self.sedfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        seddata = curveCache.readCurve(self.sedfile)
 
-        self.sedtime = seddata.values[:,0]
-        tmp = seddata.values[:,1]
-        self.sedFunc = interpolate.interp1d(self.sedtime, tmp, kind='linear')
+        self.sedtime = seddata[:,0]
+        tmp = seddata[:,1]
+        self.sedFunc = _interp1d(self.sedtime, tmp, kind='linear')
 
         return
 
     def _build_Flow_function(self):
         """
-        Using Pandas library to read the flow velocity file and define interpolation
+        Using the curve cache to read the flow velocity file and define interpolation
         function based on Scipy 1D cubic function.
         """
 
         # Read sea level file
-        flowdata = pandas.read_csv(self.flowfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        flowdata = curveCache.readCurve(self.flowfile)
 
-        self.flowtime = flowdata.values[:,0]
-        tmp = flowdata.values[:,1]
-        self.flowFunc = interpolate.interp1d(self.flowtime, tmp, kind='cubic')
+        self.flowtime = flowdata[:,0]
+        tmp = flowdata[:,1]
+        self.flowFunc = _interp1d(self.flowtime, tmp, kind='cubic')
 
         return
 
-    def getSea(self, time, top):
+    def _time_curves(self):
+        """
+        List the forcing curves which only depend on time as (name, function, times).
+        """
+
+        curves = [('sea', self.seaFunc, self.seatime), ('tec', self.tecFunc, self.tectime),
+                  ('temp', self.tempFunc, self.temptime), ('pH', self.pHFunc, self.pHtime),
+                  ('nu', self.nuFunc, self.nutime)]
+        if not self.sedfct:
+            curves.append(('sed', self.sedFunc, self.sedtime))
+        if not self.flowfct:
+            curves.append(('flow', self.flowFunc, self.flowtime))
+
+        return [curve for curve in curves if curve[1] is not None]
+
+    def buildTimeline(self, times):
+        """
+        Evaluates once all the forcing curves which only depend on time for the carbonate
+        steps times. The getters called with a step index then read the forcing levels from
+        these contiguous arrays instead of interpolating the curves.
+
+        Parameters
+        ----------
+        variable : times
+            Times of the carbonate steps (coralGLV.iterationTime).
+        """
+
+        times = numpy.asarray(times, dtype=float)
+        self.timeline = {'tecclock': times}
+        for name, func, curvetime in self._time_curves():
+            clock = numpy.clip(times, curvetime.min(), curvetime.max())
+            self.timeline[name] = numpy.ascontiguousarray(func(clock), dtype=float)
+            if name == 'tec':
+                # Tectonic rates are applied over the clamped times
+                self.timeline['tecclock'] = clock
+
+        return
+
+    def _curve_level(self, time, func, curvetime, name=None, step=None):
+        """
+        Interpolates a forcing curve for a given time, times outside of the curve are set to
+        its first or last value. When a step index is given, the level is read from the
+        precomputed timeline.
+
+        Parameters
+        ----------
+        float : time
+            Requested time.
+
+        function : func
+            Interpolation function of the curve.
+
+        variable : curvetime
+            Times of the curve.
+
+        string : name
+            Name of the curve in the timeline.
+
+        int : step
+            Index of the carbonate step in the timeline.
+        """
+
+        if step is not None and name in self.timeline:
+            return self.timeline[name][step]
+
+        if time < curvetime.min():
+            time = curvetime.min()
+        if time > curvetime.max():
+            time = curvetime.max()
+
+        return func(time)
+
+    def _depth_level(self, elev, lin, opt, x):
+        """
+        Computes the forcing level from a function of the water depth, the level is set to 0
+        outside of the function definition range and when negative.
+        """
+
+        if x.max()<elev:
+            level = 0.
+        elif x.min()>elev:
+            level = 0.
+        elif lin is None:
+            level = self._expdecay_func(elev,*opt)
+        else:
+            level = lin[0]*elev+lin[1]
+        if level<0.:
+            level = 0.
+
+        return level
+
+    def _sed_level(self, time, elev, step=None):
+        """
+        Computes the sediment input for a given time and elevation of the bed.
+        """
+
+        if self.sedfct:
+            return self._depth_level(elev, self.sedlin, self.sedopt, self.plotsedx)
+        elif self.sedfile == None:
+            return self.sed0
+
+        return self._curve_level(time, self.sedFunc, self.sedtime, 'sed', step)
+
+    def _flow_level(self, time, elev, step=None):
+        """
+        Computes the flow velocity for a given time and elevation of the bed.
+        """
+
+        if self.flowfct:
+            return self._depth_level(elev, self.flowlin, self.flowopt, self.plotflowx)
+        elif self.flowfile == None:
+            return self.flow0
+
+        return self._curve_level(time, self.flowFunc, self.flowtime, 'flow', step)
+
+    def _depth_factors(self, depth, out=None):
+        """
+        Computes the depth factors of all species, depth factors are not limiting when the
+        depth production curves are not defined.
+        """
+
+        if self.xd is None:
+            if out is None:
+                return numpy.ones(self.speciesNb,dtype=float)
+            out.fill(1.)
+            return out
+
+        return self._membership(depth, self.xd, self.dtrap, self.depthbelow, self.depthabove,
+                                 out)
+
+    def getLevels(self, time, depth, step=None):
+        """
+        Computes for a given time and water depth the level of all the active forcings listed
+        in self.forcings: the water depth, the sediment input and flow velocity, and the
+        temperature, pH and nutrients levels. Forcing levels (sedlevel, flowlevel, templevel,
+        pHlevel and nulevel) are updated as with the individual getters.
+
+        Returns an array of shape (number of active forcings,), the array is reused between
+        calls.
+
+        Parameters
+        ----------
+        float : time
+            Requested time for which to compute the levels.
+
+        float : depth
+            Water depth of the top of the core.
+
+        int : step
+            Index of the carbonate step used to read time dependent levels from the timeline.
+        """
+
+        levels = self.levels
+        for k in range(len(self.forcings)):
+            name = self.forcings[k]
+            if name == 'depth':
+                levels[k] = depth
+            elif name == 'sed':
+                self.sedlevel = self._sed_level(time, depth, step)
+                levels[k] = self.sedlevel
+            elif name == 'flow':
+                self.flowlevel = self._flow_level(time, depth, step)
+                levels[k] = self.flowlevel
+            elif name == 'temp':
+                self.templevel = 1.
+                if self.tempfile is not None:
+                    self.templevel = self._curve_level(time, self.tempFunc, self.temptime,
+                                                       'temp', step)
+                levels[k] = self.templevel
+            elif name == 'pH':
+                self.pHlevel = 1.
+                if self.pHfile is not None:
+                    self.pHlevel = self._curve_level(time, self.pHFunc, self.pHtime,
+                                                     'pH', step)
+                levels[k] = self.pHlevel
+            elif name == 'nu':
+                self.nulevel = 1.
+                if self.nufile is not None:
+                    self.nulevel = self._curve_level(time, self.nuFunc, self.nutime,
+                                                     'nu', step)
+                levels[k] = self.nulevel
+
+        return levels
+
+    def getFactors(self, time, depth, step=None):
+        """
+        Computes for a given time and water depth the factors limiting the activity of each
+        species for all the active forcings listed in self.forcings (depth, sed, flow, temp, pH
+        and nu). Forcing levels (sedlevel, flowlevel, templevel, pHlevel and nulevel) are
+        updated as with the individual getters.
+
+        Returns an array of shape (number of active forcings, speciesNb), the array is reused
+        between calls.
+
+        Parameters
+        ----------
+        float : time
+            Requested time for which to compute the factors.
+
+        float : depth
+            Water depth of the top of the core.
+
+        int : step
+            Index of the carbonate step used to read time dependent levels from the timeline.
+        """
+
+        levels = self.getLevels(time, depth, step)
+        factors = self.factors
+        for k in range(len(self.forcings)):
+            name = self.forcings[k]
+            if name == 'depth':
+                self._depth_factors(depth, factors[k])
+            elif name == 'sed':
+                self._membership(levels[k], self.xs, self.strap, self.sedbelow,
+                                 self.sedabove, factors[k])
+            elif name == 'flow':
+                self._membership(levels[k], self.xf, self.ftrap, self.flowbelow,
+                                 self.flowabove, factors[k])
+            else:
+                factors[k] = levels[k]
+
+        return factors
+
+    def limitingFactors(self, levels):
+        """
+        Computes the factors limiting the activity of each species (minimum over the active
+        forcings, see getFactors) for the forcing levels of several carbonate steps at once.
+
+        Returns an array of shape (number of steps, speciesNb).
+
+        Parameters
+        ----------
+        variable : levels
+            Levels of the active forcings of each step (see getLevels), shape (number of
+            steps, number of active forcings).
+        """
+
+        nb = len(levels)
+        grids = {'depth': ('xd', 'dtrap', 'depth'), 'sed': ('xs', 'strap', 'sed'),
+                 'flow': ('xf', 'ftrap', 'flow')}
+        fac = numpy.ones((nb,self.speciesNb),dtype=float)
+        for k in range(len(self.forcings)):
+            name = self.forcings[k]
+            if name == 'depth' and self.xd is None:
+                factors = numpy.ones((nb,self.speciesNb),dtype=float)
+            elif name in grids:
+                grid, table, prefix = grids[name]
+                xmf = getattr(self, table)
+                factors = membershipFactors(levels[:,k], numpy.broadcast_to(xmf, (nb,)+xmf.shape),
+                                            getattr(self, grid)[-1], getattr(self, prefix+'below'),
+                                            getattr(self, prefix+'above'))
+            else:
+                factors = numpy.repeat(levels[:,k,None], self.speciesNb, axis=1)
+            if k == 0:
+                fac[:] = factors
+            else:
+                numpy.minimum(fac, factors, out=fac)
+
+        return fac
+
+    def kernelTables(self):
+        """
+        Membership functions of the active forcings stacked for the fused carbonate step
+        kernel (see carbonateKernel.carbonateKernel.step).
+
+        Returns the type of each forcing (1 when its factors are given by its membership
+        functions, 0 when its level is the factor of all species), the membership functions
+        sampled on their grid of shape (number of active forcings, speciesNb, grid size),
+        the upper bound of the grids and the factors below and above the grids.
+        """
+
+        K = len(self.forcings)
+        S = self.speciesNb
+        grids = {'depth': ('xd', 'dtrap', 'depth'), 'sed': ('xs', 'strap', 'sed'),
+                 'flow': ('xf', 'ftrap', 'flow')}
+        nb = 2
+        for name in self.forcings:
+            if name in grids and getattr(self, grids[name][0]) is not None:
+                nb = max(nb, len(getattr(self, grids[name][0])))
+        kinds = numpy.zeros(K,dtype=numpy.int64)
+        tables = numpy.zeros((K,S,nb),dtype=float)
+        xmax = numpy.zeros(K,dtype=float)
+        below = numpy.ones((K,S),dtype=float)
+        above = numpy.ones((K,S),dtype=float)
+        for k in range(K):
+            name = self.forcings[k]
+            if name not in grids:
+                continue
+            kinds[k] = 1
+            if getattr(self, grids[name][0]) is None:
+                # Constant membership, the forcing is not limiting
+                tables[k] = 1.
+                xmax[k] = 1.
+                continue
+            grid, table, prefix = grids[name]
+            x = getattr(self, grid)
+            if len(x) != nb:
+                raise ValueError('Membership functions of the %s forcing are not sampled on '
+                                 'a grid of %d points.'%(name, nb))
+            tables[k] = getattr(self, table)
+            xmax[k] = x[-1]
+            below[k] = getattr(self, prefix+'below')
+            above[k] = getattr(self, prefix+'above')
+
+        return kinds, tables, xmax, below, above
+
+    def getSea(self, time, top, step=None, factors=True):
         """
         Computes for a given time the sea level according to input file parameters.
 
@@ -344,39 +780,30 @@ class enviForce:
 
         float : top
             Elevation of the core.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
+
+        bool : factors
+            If False, the depth factors are not computed and None is returned instead.
         """
 
         oldsea = self.sealevel
         if self.seafile is None:
             self.sealevel = self.sea0
         else:
-            if time < self.seatime.min():
-                time = self.seatime.min()
-            if time > self.seatime.max():
-                time = self.seatime.max()
-            self.sealevel = self.seaFunc(time)
+            self.sealevel = self._curve_level(time, self.seaFunc, self.seatime, 'sea', step)
         if oldsea == None:
             depth = top
         else:
             depth = top+(self.sealevel-oldsea)
 
-        factors = numpy.ones(self.speciesNb,dtype=float)
-
-        for s in range(self.speciesNb):
-            if depth<self.xd[0] and self.edepth[s,1] == self.edepth[s,0]:
-                factors[s] = 1.
-            elif depth<self.xd[0] and self.edepth[s,1] != self.edepth[s,0]:
-                factors[s] = 0.
-            elif depth>self.xd[-1] and self.edepth[s,2] == self.edepth[s,3]:
-                factors[s] = 1.
-            elif depth>self.xd[-1] and self.edepth[s,2] != self.edepth[s,3]:
-                factors[s] = 0.
-            else:
-                factors[s] = self._extract_enviParam( self.xd, self.dtrap[s], depth )
+        if not factors:
+            return depth,None
 
-        return depth,factors
+        return depth,self._depth_factors(depth)
 
-    def getTemp(self, time):
+    def getTemp(self, time, step=None):
         """
         Computes for a given time the temperature according to input file parameters.
 
@@ -384,23 +811,19 @@ class enviForce:
         ----------
         float : time
             Requested time for which to compute temperature.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
         """
 
-        factors = numpy.ones(self.speciesNb,dtype=float)
         if self.tempfile is None:
             self.templevel = 1.
         else:
-            if time < self.temptime.min():
-                time = self.temptime.min()
-            if time > self.temptime.max():
-                time = self.temptime.max()
-            self.templevel = self.tempFunc(time)
-            for s in range(self.speciesNb):
-                factors[s] = self.templevel
+            self.templevel = self._curve_level(time, self.tempFunc, self.temptime, 'temp', step)
 
-        return factors
+        return numpy.zeros(self.speciesNb,dtype=float)+self.templevel
 
-    def getpH(self, time):
+    def getpH(self, time, step=None):
         """
         Computes for a given time the pH according to input file parameters.
 
@@ -408,23 +831,19 @@ class enviForce:
         ----------
         float : time
             Requested time for which to compute pH.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
         """
 
-        factors = numpy.ones(self.speciesNb,dtype=float)
         if self.pHfile is None:
             self.pHlevel = 1.
         else:
-            if time < self.pHtime.min():
-                time = self.pHtime.min()
-            if time > self.pHtime.max():
-                time = self.pHtime.max()
-            self.pHlevel = self.pHFunc(time)
-            for s in range(self.speciesNb):
-                factors[s] = self.pHlevel
+            self.pHlevel = self._curve_level(time, self.pHFunc, self.pHtime, 'pH', step)
 
-        return factors
+        return numpy.zeros(self.speciesNb,dtype=float)+self.pHlevel
 
-    def getNu(self, time):
+    def getNu(self, time, step=None):
         """
         Computes for a given time the nutrients according to input file parameters.
 
@@ -432,23 +851,19 @@ class enviForce:
         ----------
         float : time
             Requested time for which to compute nutrients.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
         """
 
-        factors = numpy.ones(self.speciesNb,dtype=float)
         if self.nufile is None:
             self.nulevel = 1.
         else:
-            if time < self.nutime.min():
-                time = self.nutime.min()
-            if time > self.nutime.max():
-                time = self.nutime.max()
-            self.nulevel = self.nuFunc(time)
-            for s in range(self.speciesNb):
-                factors[s] = self.nulevel
+            self.nulevel = self._curve_level(time, self.nuFunc, self.nutime, 'nu', step)
 
-        return factors
+        return numpy.zeros(self.speciesNb,dtype=float)+self.nulevel
 
-    def getTec(self, time, otime, top):
+    def getTec(self, time, otime, top, step=None, factors=True):
         """
         Computes for a given time the tectonic rate according to input file parameters.
 
@@ -462,38 +877,39 @@ class enviForce:
 
         float : top
             Elevation of the core.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
+
+        bool : factors
+            If False, the depth factors are not computed and None is returned instead.
         """
 
+        if step is not None and 'tecclock' in self.timeline:
+            time = self.timeline['tecclock'][step]
         if self.tecfile is None:
             self.tecrate = self.tec0
+        elif step is not None and 'tec' in self.timeline:
+            self.tecrate = self.timeline['tec'][step]
         else:
             if time < self.tectime.min():
                 time = self.tectime.min()
             if time > self.tectime.max():
                 time = self.tectime.max()
             self.tecrate = self.tecFunc(time)
+        # Time to use as previous time at the next call
+        self.tecclock = time
         if otime == time:
             depth = top
         else:
             depth = top-(self.tecrate*(time-otime))
 
-        factors = numpy.ones(self.speciesNb,dtype=float)
-
-        for s in range(self.speciesNb):
-            if depth<self.xd[0] and self.edepth[s,1] == self.edepth[s,0]:
-                factors[s] = 1.
-            elif depth<self.xd[0] and self.edepth[s,1] != self.edepth[s,0]:
-                factors[s] = 0.
-            elif depth>self.xd[-1] and self.edepth[s,2] == self.edepth[s,3]:
-                factors[s] = 1.
-            elif depth>self.xd[-1] and self.edepth[s,2] != self.edepth[s,3]:
-                factors[s] = 0.
-            else:
-                factors[s] = self._extract_enviParam( self.xd, self.dtrap[s], depth )
+        if not factors:
+            return depth,None
 
-        return depth,factors
+        return depth,self._depth_factors(depth)
 
-    def getSed(self, time, elev):
+    def getSed(self, time, elev, step=None):
         """
         Computes for a given time the sediment input according to input file parameters.
 
@@ -504,44 +920,18 @@ class enviForce:
 
         float : elev
             Elevation of the bed.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
         """
 
-        if self.sedfct:
-            if self.plotsedx.max()<elev:
-                self.sedlevel = 0.
-            elif self.plotsedx.min()>elev:
-                self.sedlevel = 0.
-            elif self.sedlin is None:
-                self.sedlevel = self._expdecay_func(elev,*self.sedopt)
-            else:
-                self.sedlevel = self.sedlin[0]*elev+self.sedlin[1]  
-            if self.sedlevel<0:
-                self.sedlevel = 0.
-        elif self.sedfile == None:
-            self.sedlevel = self.sed0
-        else:
-            if time < self.sedtime.min():
-                time = self.sedtime.min()
-            if time > self.sedtime.max():
-                time = self.sedtime.max()
-            self.sedlevel = self.sedFunc(time)
-
-        factors = numpy.ones(self.speciesNb,dtype=float)
-        for s in range(self.speciesNb):
-            if self.sedlevel<self.xs[0] and self.esed[s,1] == self.esed[s,0]:
-                factors[s] = 1.
-            elif self.sedlevel<self.xs[0] and self.esed[s,1] != self.esed[s,0]:
-                factors[s] = 0.
-            elif self.sedlevel>self.xs[-1] and self.esed[s,2] == self.esed[s,3]:
-                factors[s] = 1.
-            elif self.sedlevel>self.xs[-1] and self.esed[s,2] != self.esed[s,3]:
-                factors[s] = 0.
-            else:
-                factors[s] = self._extract_enviParam( self.xs, self.strap[s], self.sedlevel )
+        self.sedlevel = self._sed_level(time, elev, step)
+        factors = self._membership(self.sedlevel, self.xs, self.strap, self.sedbelow,
+                                   self.sedabove)
 
         return self.sedlevel,factors
 
-    def getFlow(self, time, elev):
+    def getFlow(self, time, elev, step=None):
         """
         Computes for a given time the flow velocity according to input file parameters.
 
@@ -552,39 +942,13 @@ class enviForce:
 
         float : elev
             Elevation of the bed.
+
+        int : step
+            Index of the carbonate step used to read the level from the timeline.
         """
 
-        if self.flowfct:
-            if self.plotflowx.max()<elev:
-                self.flowlevel = 0.
-            elif self.plotflowx.min()>elev:
-                self.flowlevel = 0.
-            elif self.flowlin is None:
-                self.flowlevel = self._expdecay_func(elev,*self.flowopt)
-            else:
-                self.flowlevel = self.flowlin[0]*elev+self.flowlin[1]
-            if self.flowlevel<0.:
-                self.flowlevel = 0.
-        elif self.flowfile == None:
-            self.flowlevel = self.flow0
-        else:
-            if time < self.flowtime.min():
-                time = self.flowtime.min()
-            if time > self.flowtime.max():
-                time = self.flowtime.max()
-            self.flowlevel = self.flowFunc(time)
-
-        factors = numpy.ones(self.speciesNb,dtype=float)
-        for s in range(self.speciesNb):
-            if self.flowlevel<self.xf[0] and self.eflow[s,1] == self.eflow[s,0]:
-                factors[s] = 1.
-            elif self.flowlevel<self.xf[0] and self.eflow[s,1] != self.eflow[s,0]:
-                factors[s] = 0.
-            elif self.flowlevel>self.xf[-1] and self.eflow[s,2] == self.eflow[s,3]:
-                factors[s] = 1.
-            elif self.flowlevel>self.xf[-1] and self.eflow[s,2] != self.eflow[s,3]:
-                factors[s] = 0.
-            else:
-                factors[s] = self._extract_enviParam( self.xf, self.ftrap[s], self.flowlevel )
+        self.flowlevel = self._flow_level(time, elev, step)
+        factors = self._membership(self.flowlevel, self.xf, self.ftrap, self.flowbelow,
+                                   self.flowabove)
 
         return factors
@@ -11,11 +11,7 @@ Functions used to create environmental forcing conditions for pyReefCore simulat
 """
 
 import errno
-import matplotlib
 import numpy as np
-import pandas as pd
-from scipy import interpolate
-import matplotlib.pyplot as plt
 
 import warnings
 warnings.simplefilter(action = "ignore", category = FutureWarning)
@@ -44,6 +40,7 @@ class preProc:
         self.func = None
 
         if curve != None:
+            import pandas as pd
             self.build = False
             self.df = pd.read_csv(curve1, sep=r'\s+', header=None, names=['h','t'])
         else:
@@ -77,6 +74,8 @@ class preProc:
             Period of the nvironmental factor wave for starting and ending times (in years)
         """
 
+        from scipy import interpolate
+
         dt = float(timeStep)
         so = float(funcExt[0])
         sm = float(funcExt[1])
@@ -132,6 +131,8 @@ class preProc:
             Discretisation step for time range (in Ma).
         """
 
+        from scipy import interpolate
+
         self.df.columns[1]
         list1 = list(self.df)
         time = self.df[list1[0:len(list1)-1]].values[:,0]
@@ -177,6 +178,9 @@ class preProc:
             Name of the saved file.
         """
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         matplotlib.rcParams.update({'font.size': font})
 
         # Define figure size
@@ -223,6 +227,8 @@ class preProc:
             Name of the saved CSV file.
         """
 
+        import pandas as pd
+
         df = pd.DataFrame({'X':np.around(self.time*factor, decimals=0),'Y':np.around(self.func, decimals=3)})
         df.to_csv(str(nameCSV),columns=['X', 'Y'], sep=' ', index=False ,header=0)
 
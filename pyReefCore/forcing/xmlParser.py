@@ -95,6 +95,13 @@ class xmlParser:
         self.enviSed = None
         self.enviFlow = None
 
+        self.odeSolver = 'fehlberg'
+        self.odeRtol = 1.e-6
+        self.odeAtol = 1.e-6
+        self.odeMinStep = 1.e-4
+        self.odeGrid = 100
+        self.odeDense = 0
+
         self.makeUniqueOutputDir = makeUniqueOutputDir
         self.outDir = None
 
@@ -129,7 +136,7 @@ class xmlParser:
             if element is not None:
                 self.tEnd = float(element.text)
             else:
-                raise ValueErself.ror('Error in the definition of the simulation time: end time declaration is required')
+                raise ValueError('Error in the definition of the simulation time: end time declaration is required')
             if self.tStart > self.tEnd:
                 raise ValueError('Error in the definition of the simulation time: start time is greater than end time!')
             element = None
@@ -312,7 +319,7 @@ class xmlParser:
         # Extract nutrients structure information
         Nu = None
         Nu = root.find('Nu')
-        if pH is not None:
+        if Nu is not None:
             self.nutrientOn = True
             element = None
             element = Nu.find('curve')
@@ -515,6 +522,45 @@ class xmlParser:
                 # Build array from matrix string
                 self.enviSed = numpy.array(numpy.mat(';'.join(rows)))
 
+        # Extract ODE solver information
+        solver = None
+        solver = root.find('solver')
+        if solver is not None:
+            element = None
+            element = solver.find('method')
+            if element is not None:
+                self.odeSolver = element.text.strip()
+            element = None
+            element = solver.find('rtol')
+            if element is not None:
+                self.odeRtol = float(element.text)
+                if self.odeRtol <= 0:
+                    raise ValueError('Error the ODE solver relative tolerance needs to be positive!')
+            element = None
+            element = solver.find('atol')
+            if element is not None:
+                self.odeAtol = float(element.text)
+                if self.odeAtol <= 0:
+                    raise ValueError('Error the ODE solver absolute tolerance needs to be positive!')
+            element = None
+            element = solver.find('minstep')
+            if element is not None:
+                self.odeMinStep = float(element.text)
+                if self.odeMinStep < 0:
+                    raise ValueError('Error the ODE solver minimum step needs to be positive!')
+            element = None
+            element = solver.find('grid')
+            if element is not None:
+                self.odeGrid = int(element.text)
+                if self.odeGrid < 0:
+                    raise ValueError('Error the ODE output grid size needs to be positive!')
+            element = None
+            element = solver.find('dense')
+            if element is not None:
+                self.odeDense = int(element.text)
+                if self.odeDense < 0:
+                    raise ValueError('Error the number of ODE dense output points needs to be positive!')
+
         # Get output directory
         out = None
         out = root.find('outfolder')
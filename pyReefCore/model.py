@@ -9,11 +9,15 @@
 """
    pyReefCore Model main entry file.
 """
+import copy
 import time
 import numpy as np
 #import mpi4py.MPI as mpi
 
-from pyReefCore import (preProc, xmlParser, enviForce, coralGLV, coreData, modelPlot)
+from pyReefCore import (preProc, xmlParser, enviForce, coralGLV, coreData, modelPlot,
+                        outputStore, carbonateKernel, coreExport)
+from pyReefCore.timing import RunTimer
+from pyReefCore.events import conditionName
 
 # profiling support
 import cProfile
@@ -22,12 +26,40 @@ import pstats
 import StringIO
 
 
+# Checkpoint format version
+CHECKPOINT_VERSION = 1
+
+# Model, force, coral and core attributes saved in checkpoints
+CHECKPOINT_STATE = ['tNow', 'tCoral', 'tLayer', 'iter', 'layID', 'timetec', 'dt']
+CHECKPOINT_FORCE = ['sealevel', 'tecrate', 'tecclock', 'sedlevel', 'flowlevel', 'templevel',
+                    'pHlevel', 'nulevel']
+CHECKPOINT_CORAL = outputStore.CORAL_RECORDS
+CHECKPOINT_CORE = outputStore.CORE_RECORDS
+
+# Number of carbonate steps examined at once by the fast-forward, the band grows up to the
+# maximum size as long as the phase of null populations goes on
+FASTFORWARD_BAND = 16
+FASTFORWARD_MAXBAND = 4096
+
+
 class Model(object):
     """State object for the pyReef model."""
 
-    def __init__(self):
+    def __init__(self, solver=None, kernel=None):
         """
         Constructor.
+
+        Parameters
+        ----------
+        string : solver
+            Name of the ODE solver used for the GLV equation (see odeSolver.solvers),
+            overrides the one defined in the XmL input file.
+
+        string : kernel
+            Fused carbonate step kernel (numba, numpy or auto, see carbonateKernel) used
+            instead of the step by step evaluation. The kernel integrates the GLV equation
+            with the Dormand-Prince scheme and requires the adaptive endpoint mode (solver
+            grid set to 0) without dense output.
         """
 
         # Simulation state
@@ -40,6 +72,19 @@ class Model(object):
         self.simStarted = False
 
         self.dispRate = None
+        self.solver = solver
+        self.kernel = kernel
+        self._kernel = None
+        # Timings of the runs, set when run_to_time is called with timing
+        self.timer = None
+        # Phases advanced by the fast-forward and stop condition of the last run
+        self.phases = []
+        self.stopEvent = None
+        self._ffBand = FASTFORWARD_BAND
+
+        # On-disk records, kept in memory when None
+        self.store = None
+        self._storeConfig = None
 
         #self._rank = mpi.COMM_WORLD.rank
         #self._size = mpi.COMM_WORLD.size
@@ -48,27 +93,58 @@ class Model(object):
         # Initialise pre-processing functions
         self.enviforcing = preProc.preProc()
 
-    def load_xml(self, filename, verbose=False):
+    def load_xml(self, filename, verbose=False, params=None, makedir=True, seed=None):
         """
         Load an XML configuration file.
+
+        Parameters
+        ----------
+        string : filename
+            XmL input file.
+
+        dict : params
+            Optional input parameters overriding the ones defined in the XmL input file
+            (e.g. malthusParam, communityMatrix, depth0, seafile). Single entries of array
+            parameters are set with indexed names such as malthusParam[0].
+
+        bool : makedir
+            If True, a uniquely-named output directory is created for the simulation.
+
+        int : seed
+            Seed of the random number generator, a random one is drawn when None.
         """
 
         # Only the first node should create a unique output dir
         #self.input = xmlParser.xmlParser(filename, makeUniqueOutputDir=(self._rank == 0))
-        self.input = xmlParser.xmlParser(filename)
+        self.input = xmlParser.xmlParser(filename, makeUniqueOutputDir=makedir)
+        self._initialise(params, seed)
+
+        return
+
+    def _initialise(self, params=None, seed=None):
+        """
+        Initialise the simulation from the input parameters.
+        """
+
+        if params is not None:
+            for key, value in params.items():
+                self._set_input(key, value)
         self.tNow = self.input.tStart
         self.tCoral = self.tNow
         self.tLayer = self.tNow + self.input.laytime
 
         # Seed the random number generator consistently on all nodes
-        seed = None
         #if self._rank == 0:
             # limit to max uint32
-        seed = np.random.mtrand.RandomState().tomaxint() % 0xFFFFFFFF
+        if seed is None:
+            seed = np.random.mtrand.RandomState().tomaxint() % 0xFFFFFFFF
+        self.seed = seed
         #seed = self._comm.bcast(seed, root=0)
         np.random.seed(seed)
         self.iter = 0
         self.layID = 0
+        # Time of the last tectonic displacement
+        self.timetec = self.tNow
 
         # Initialise environmental forcing conditions
         self.force = enviForce.enviForce(input=self.input)
@@ -92,11 +168,74 @@ class Model(object):
 
         return
 
-    def run_to_time(self, tEnd, showtime=10, profile=False, verbose=False):
+    def use_store(self, folder=None, precision='float64', chunk=1000):
+        """
+        Write the population and core records to memory-mapped files instead of keeping
+        them in memory, the store is created when the simulation starts.
+
+        Parameters
+        ----------
+        string : folder
+            Folder of the record files, the records folder of the output directory when None.
+
+        string : precision
+            Data type of the records, float64 or float32.
+
+        int : chunk
+            Number of carbonate steps between two flushes of the records.
+        """
+
+        if folder is None:
+            folder = os.path.join(self.input.outDir, 'records')
+        self._storeConfig = (folder, precision, chunk)
+
+        return
+
+    def _set_input(self, key, value):
+        """
+        Override an input parameter, key is either a parameter name or an indexed name
+        like malthusParam[0] or communityMatrix[0,1] to set a single array entry.
+        """
+
+        name = key
+        index = None
+        if key.endswith(']') and '[' in key:
+            name, index = key[:-1].split('[', 1)
+            index = tuple(int(i) for i in index.split(','))
+        if not hasattr(self.input, name):
+            raise ValueError('Unknown input parameter %s'%key)
+
+        current = getattr(self.input, name)
+        if index is not None:
+            if not isinstance(current, np.ndarray):
+                raise ValueError('Input parameter %s is not an array'%name)
+            current = np.array(current, dtype=float)
+            current[index] = value
+            value = current
+        elif isinstance(current, np.ndarray):
+            value = np.array(value, dtype=float)
+        setattr(self.input, name, value)
+
+        return
+
+    def run_to_time(self, tEnd, showtime=10, profile=False, verbose=False, timing=False,
+                    fastforward=False, stop=None):
         """
         Run the simulation to a specified point in time (tEnd).
 
-        If profile is True, dump cProfile output to /tmp.
+        If profile is True, dump cProfile output to /tmp and print the most expensive calls.
+
+        If timing is True, the time spent in each phase of the carbonate steps and the ODE
+        solver statistics are accumulated in the timer attribute (see timing.RunTimer).
+
+        If fastforward is True, phases in which the populations stay null (exposed core or
+        environmental factors below facOpt) are advanced at once instead of step by step,
+        see _fast_forward. The phases are listed in the phases attribute as (kind, start,
+        end, steps) with kind exposure or collapse.
+
+        Stop conditions (a callable taking the model or a list of them, see events) are
+        checked after each carbonate step and each fast-forwarded phase, the run stops when
+        one of them returns True and its name is kept in the stopEvent attribute.
         """
 
         timeVerbose = self.tNow+showtime
@@ -108,7 +247,6 @@ class Model(object):
 
         #if self._rank == 0:
         print 'tNow = %s [yr]' %self.tNow
-        timetec = self.input.tStart
 
         if tEnd > self.input.tEnd:
             tEnd = self.input.tEnd
@@ -116,31 +254,56 @@ class Model(object):
             print 'Your simulation will run for %s years.'%(tEnd)
 
         if self.tNow == self.input.tStart:
-            # Initialise Generalized Lotka-Volterra equation
-            self.coral = coralGLV.coralGLV(input=self.input)
+            self._init_records()
+        if fastforward and self.coral.odeDense > 0:
+            raise ValueError('The fast-forward requires the solver dense output to be set to 0.')
+        if stop is None:
+            stop = []
+        elif callable(stop):
+            stop = [stop]
+        self.stopEvent = None
+
+        # Build the ODE solver once for the run, it is re-armed at each carbonate step
+        self.odeRKF = self.coral.solverGLV()
+        stepper = self.odeRKF
+        if self._kernel is not None:
+            stepper = self._kernel
+
+        timer = None
+        if timing:
+            if self.timer is None:
+                self.timer = RunTimer()
+            timer = self.timer
+            timer.start(stepper)
+            tRun = self.tNow
+            iRun = self.iter
 
         # Perform main simulation loop
-        # NOTE: number of iteration for the ODE during a given time step, could be user defined...
-        N = 100
-
-        # Define environmental factors
-        dfac = np.ones(self.input.speciesNb,dtype=float)
-        sfac = np.ones(self.input.speciesNb,dtype=float)
-        ffac = np.ones(self.input.speciesNb,dtype=float)
-        tfac = np.ones(self.input.speciesNb,dtype=float)
-        nfac = np.ones(self.input.speciesNb,dtype=float)
-        pfac = np.ones(self.input.speciesNb,dtype=float)
         while self.tNow < tEnd:
 
+            # Advance at once a phase of null populations
+            if fastforward and self.tNow > self.input.tStart:
+                steps = self._fast_forward(tEnd, stop)
+                if timer is not None:
+                    timer.lap('events')
+                if steps > 0:
+                    if self.tNow>=timeVerbose:
+                        timeVerbose = self.tNow+showtime
+                        print 'tNow = %s [yr]' %self.tNow
+                    if self._stop(stop):
+                        break
+                    continue
+
             # Initial coral population
             if self.tNow == self.input.tStart:
                 self.coral.population[:,self.iter] = self.input.speciesPopulation
+                self.coral.state[:] = self.input.speciesPopulation
 
             # Get tectonic
             if self.input.tecOn:
-                tmp = self.core.topH
-                self.core.topH, dfac = self.force.getTec(self.tNow, timetec, tmp)
-                timetec = self.tNow
+                self.core.topH = self.force.getTec(self.tNow, self.timetec, self.core.topH,
+                                                 self.iter, factors=False)[0]
+                self.timetec = self.force.tecclock
                 if self.tNow == self.input.tStart:
                     self.core.tecrate[self.layID] = self.force.tecrate
                 else:
@@ -151,8 +314,8 @@ class Model(object):
 
             # Get sea-level
             if self.input.seaOn:
-                tmp = self.core.topH
-                self.core.topH, dfac = self.force.getSea(self.tNow, tmp)
+                self.core.topH = self.force.getSea(self.tNow, self.core.topH, self.iter,
+                                                   factors=False)[0]
                 if self.tNow == self.input.tStart:
                     self.core.sealevel[self.layID] = self.force.sealevel
                 else:
@@ -169,79 +332,88 @@ class Model(object):
             # Store accommodation space through time
             self.coral.accspace[self.iter] = self.core.topH #max(self.core.topH,0.)
 
-            # Get sediment input
+            # Get environmental factors of the active forcings
+            if self._kernel is None:
+                factors = self.force.getFactors(self.tNow, self.core.topH, self.iter)
+            else:
+                levels = self.force.getLevels(self.tNow, self.core.topH, self.iter)
             if self.input.sedOn:
-                sedh, sfac = self.force.getSed(self.tNow, self.core.topH)
+                sedh = self.force.sedlevel
                 self.core.sedinput[self.layID] = self.force.sedlevel
             else:
                 sedh = 0.
-
-            # Get flow velocity
             if self.input.flowOn:
-                ffac = self.force.getFlow(self.tNow, self.core.topH)
                 self.core.waterflow[self.layID] = self.force.flowlevel
-
-            # Get temperature control
             if self.input.tempOn:
-                tfac = self.force.getTemp(self.tNow)
                 self.core.temperature[self.layID] = self.force.templevel
-
-            # Get pH control
             if self.input.pHOn:
-                pfac = self.force.getPh(self.tNow)
                 self.core.pH[self.layID] = self.force.pHlevel
-
-            # Get nutrients control
             if self.input.nutrientOn:
-                nfac = self.force.getNu(self.tNow)
                 self.core.nutrient[self.layID] = self.force.nulevel
 
-            # Limit species activity from environmental forces
-            tmp = np.minimum(dfac, sfac)
-            tmp2 = np.minimum(tfac, tmp)
-            tmp3 = np.minimum(pfac, tmp2)
-            tmp4 = np.minimum(nfac, tmp3)
-            fac = np.minimum(ffac, tmp4)
-            self.coral.epsilon = self.input.malthusParam * fac
-
-            # Initialise RKF conditions
-            self.odeRKF = self.coral.solverGLV()
-            self.odeRKF.set_initial_condition(self.coral.population[:,self.iter])
-
-            # Define coral evolution time interval and time stepping
-            self.tCoral += self.input.tCarb
-            tODE = np.linspace(self.tNow, self.tCoral, N+1)
-            self.dt = tODE[1]-tODE[0]
-
-            # Solve the Generalized Lotka-Volterra equation
-            coral,t = self.odeRKF.solve(tODE)
-            population = coral.T
-            tmppop = np.copy(population[:,-1])
-            tmppop[tmppop>self.input.maxpop] = self.input.maxpop
-            population[:,-1] = tmppop
-
-            # Update coral population
-            self.iter += 1
-            ids = np.where(self.coral.epsilon==0.)[0]
-            population[ids,-1] = 0.
-            ids = np.where(np.logical_and(fac>=self.input.facOpt,population[:,-1]==0.))[0]
-            population[ids,-1] = 1.
-
-            self.coral.population[:self.input.speciesNb,self.iter] = population[:,-1]
-
-            # In case there is no accommodation space
-            if self.core.topH <= 0.:
-                population[ids,-1] = 0.
-                self.coral.population[:self.input.speciesNb,self.iter] = 0.
-                ero = -self.input.karstRate*self.input.tCarb
-                if self.core.topH > ero:
-                    ero = self.core.topH
+            if self._kernel is not None:
+                if timer is not None:
+                    timer.lap('forcing')
+                # Fused factors, GLV, production and deposition step
+                self._fused_step(levels, sedh)
+                if timer is not None:
+                    timer.lap('solve')
             else:
-                ero = 0.
+                # Limit species activity from environmental forces
+                fac = self._fac
+                if len(factors) > 0:
+                    factors.min(axis=0, out=fac)
+                if timer is not None:
+                    timer.lap('forcing')
+
+                # Re-arm RKF conditions
+                np.multiply(self.input.malthusParam, fac, out=self._epsilon)
+                self.coral.rearmGLV(self._epsilon, self.coral.state)
+
+                # Define coral evolution time interval and time stepping
+                self.tCoral += self.input.tCarb
+
+                # Solve the Generalized Lotka-Volterra equation
+                if self.coral.odeGrid > 0:
+                    tODE = np.linspace(self.tNow, self.tCoral, self.coral.odeGrid+1)
+                    self.dt = tODE[1]-tODE[0]
+                    coral,t = self.odeRKF.solve(tODE)
+                    population = np.copy(coral[-1,:])
+                else:
+                    self.dt = self.input.tCarb
+                    population = self.coral.advanceGLV(self.tNow, self.tCoral)
+                np.minimum(population, self.input.maxpop, out=population)
+
+                # Update coral population
+                self.iter += 1
+                mask, work = self._masks
+                np.equal(self.coral.epsilon, 0., out=mask)
+                np.copyto(population, 0., where=mask)
+                np.greater_equal(fac, self.input.facOpt, out=mask)
+                np.equal(population, 0., out=work)
+                np.logical_and(mask, work, out=mask)
+                np.copyto(population, 1., where=mask)
+
+                # In case there is no accommodation space
+                if self.core.topH <= 0.:
+                    population[:] = 0.
+                    ero = -self.input.karstRate*self.input.tCarb
+                    if self.core.topH > ero:
+                        ero = self.core.topH
+                else:
+                    ero = 0.
+
+                self.coral.population[:self.input.speciesNb,self.iter] = population
+                self.coral.state = population
+                if timer is not None:
+                    timer.lap('solve')
+
+                # Compute carbonate production and update coral core characteristics
+                self.core.coralProduction(self.layID, population,
+                                          self.coral.epsilon, sedh, ero, verbose)
+                if timer is not None:
+                    timer.lap('production')
 
-            # Compute carbonate production and update coral core characteristics
-            self.core.coralProduction(self.layID, self.coral.population[:,self.iter],
-                                      self.coral.epsilon, sedh, ero, verbose)
             # Update time step
             self.tNow = self.tCoral
 
@@ -255,7 +427,491 @@ class Model(object):
                 timeVerbose = self.tNow+showtime
                 print 'tNow = %s [yr]' %self.tNow
 
-        # Update plotting parameters
+            if self.store is not None:
+                self.store.step()
+            if timer is not None:
+                timer.lap('layers')
+
+            if len(stop) > 0:
+                stopped = self._stop(stop)
+                if timer is not None:
+                    timer.lap('events')
+                if stopped:
+                    break
+
+        self._update_plot()
+
+        if timer is not None:
+            timer.stop(self.tNow-tRun, self.iter-iRun, stepper)
+
+        if profile:
+            pr.disable()
+            name = '/tmp/pyreef-profile-%s.pstats' %pid
+            pr.dump_stats(name)
+            stream = StringIO.StringIO()
+            pstats.Stats(pr, stream=stream).sort_stats('cumulative').print_stats(20)
+            print stream.getvalue()
+            print 'Profile has been saved in', name
+
+        return
+
+    def _fused_step(self, levels, sedh):
+        """
+        Advance a carbonate step with the fused kernel (see carbonateKernel), karstification
+        of the exposed core is done by coreData.
+        """
+
+        self.tCoral += self.input.tCarb
+        self.dt = self.input.tCarb
+        topH = self.core.topH
+        population = self.coral.state
+        self._kernel.h, self.core.topH = self._kernel.step(levels, population, self.tNow,
+                                                           self.tCoral, self._kernel.h,
+                                                           sedh*self.core.dt, topH, self.layID,
+                                                           self.core.coralH,
+                                                           self.core.thickness)
+        self.iter += 1
+        self.coral.population[:self.input.speciesNb,self.iter] = population
+
+        if topH < 0.:
+            ero = max(-self.input.karstRate*self.input.tCarb, topH)
+            if ero < 0.:
+                self.core._karstification(-ero)
+        elif self.core.thickness[self.layID] > 0.:
+            self.core.topLay = self.layID
+            self.core.metrics.deposit(self.layID, self.core.coralH, self.core.thickness)
+
+        return
+
+    def _fast_forward(self, tEnd, stop=()):
+        """
+        Advance at once the carbonate steps of a phase in which the populations stay null:
+        the core is either exposed and only karstified, or submerged with environmental
+        factors below facOpt for all communities and only receives siliciclastic sediments.
+
+        The steps of a band are first simulated on the accommodation space alone with the
+        same operations as the main loop, the environmental factors of the submerged steps
+        are then evaluated at once. The records are written up to the first step leaving
+        the phase, which is done by the main loop. The karstification of the exposed steps
+        is simulated on a copy of the layer thicknesses with the same operations as
+        coreData._karstification, which is then applied to the core for each step.
+
+        The phase also ends at the step reaching a stop condition, given by the phaseStep
+        method of the conditions (see events). Conditions without this method can only be
+        checked after each step, the steps are then advanced one by one.
+
+        Returns the number of carbonate steps advanced.
+
+        Parameters
+        ----------
+        float : tEnd
+            End time of the run.
+
+        list : stop
+            Stop conditions of the run.
+        """
+
+        if self.coral.state.any():
+            return 0
+
+        force = self.force
+        core = self.core
+        karst = -self.input.karstRate*self.input.tCarb
+        tNow, tCoral, tLayer = self.tNow, self.tCoral, self.tLayer
+        layID, step, timetec, topH = self.layID, self.iter, self.timetec, core.topH
+        # Layers available for the karstification
+        top = core.topLay
+        thick = core.thickness[:top+1].copy()
+
+        band = self._ffBand
+        stepwise = any(not hasattr(condition, 'phaseStep') for condition in stop)
+        if stepwise:
+            band = 1
+        tops = []
+        levels = np.zeros((band,len(force.forcings)), dtype=float)
+        states = []
+        steps = []
+        exposed = None
+        while len(steps) < band and tNow < tEnd:
+            states.append([getattr(force, attr) for attr in CHECKPOINT_FORCE])
+
+            # Tectonic and sea-level (see run_to_time)
+            if self.input.tecOn:
+                topH = force.getTec(tNow, timetec, topH, step, factors=False)[0]
+                timetec = force.tecclock
+            else:
+                force.tecrate = 0.
+            if self.input.seaOn:
+                topH = force.getSea(tNow, topH, step, factors=False)[0]
+            else:
+                force.sealevel = 0.
+            if exposed is None:
+                exposed = topH <= 0.
+            elif exposed != (topH <= 0.):
+                break
+            accspace = topH
+            levels[len(steps)] = force.getLevels(tNow, topH, step)
+
+            # Karstification or siliciclastic sediments (see coreData.coralProduction)
+            dep = 0.
+            ero = 0.
+            remero = 0.
+            if exposed:
+                remero = karst
+                if topH > remero:
+                    remero = topH
+                if topH < 0. and remero < 0. and top >= 0:
+                    remero = -remero
+                    nbl, full, partial = coreData.karstLayers(thick, top, remero)
+                    topH += full
+                    top -= nbl
+                    if partial > 0.:
+                        thick[top] -= partial
+                        topH += partial
+                    ero = full+partial
+                else:
+                    remero = 0.
+            elif self.input.sedOn:
+                sh = force.sedlevel*core.dt
+                if topH-sh < 0.:
+                    dep = topH
+                    topH = 0.
+                else:
+                    dep = sh
+                    topH -= dep
+
+            records = [getattr(force, attr) for attr in ('sedlevel', 'flowlevel',
+                                                         'templevel', 'pHlevel', 'nulevel')]
+            t0 = tNow
+            lay = layID
+            tCoral += self.input.tCarb
+            tNow = tCoral
+            if tLayer <= tNow :
+                tLayer += self.input.laytime
+                layID += 1
+            step += 1
+            steps.append((t0, tNow, lay, accspace, force.sealevel, force.tecrate, records,
+                          dep, ero, remero, (topH, timetec, tLayer, layID)))
+            tops.append(top)
+        # Forcing state after the last step, unless a step leaving the phase was started
+        if len(states) == len(steps):
+            states.append([getattr(force, attr) for attr in CHECKPOINT_FORCE])
+
+        # Steps after a recolonisation are left to the main loop
+        nb = len(steps)
+        if nb > 0 and not exposed:
+            fac = force.limitingFactors(levels[:nb])
+            recolonised = np.flatnonzero((fac >= self.input.facOpt).any(axis=1))
+            if len(recolonised) > 0:
+                nb = int(recolonised[0])
+        # Steps after a stop condition is reached are not advanced
+        if nb > 0 and len(stop) > 0:
+            phase = {'exposed': exposed, 'topLay': np.array(tops[:nb]),
+                     'deposited': np.cumsum([entry[7] for entry in steps[:nb]]),
+                     'eroded': np.cumsum([entry[8] for entry in steps[:nb]])}
+            for condition in stop:
+                if hasattr(condition, 'phaseStep'):
+                    first = condition.phaseStep(self, phase)
+                    if first is not None:
+                        nb = min(nb, int(first)+1)
+        if not stepwise and nb == len(steps) and nb == band:
+            self._ffBand = min(4*band, FASTFORWARD_MAXBAND)
+        elif not stepwise and (nb < len(steps) or tNow < tEnd):
+            self._ffBand = FASTFORWARD_BAND
+        for attr, value in zip(CHECKPOINT_FORCE, states[nb]):
+            setattr(force, attr, value)
+        if nb == 0:
+            return 0
+
+        t0, t1, lays, accspace, sealevel, tecrate, records, dep, ero, remero, ends = \
+            zip(*steps[:nb])
+        lays = np.array(lays)
+        # Layer records are set by the last step of each layer
+        last = np.append(lays[1:] != lays[:-1], True)
+        lay = lays[last]
+        self.coral.accspace[self.iter:self.iter+nb] = accspace
+        self.coral.mbsl[self.iter:self.iter+nb] = sealevel
+        self.coral.population[:self.input.speciesNb,self.iter+1:self.iter+nb+1] = 0.
+        core.tecrate[lay+1] = np.array(tecrate)[last]
+        core.sealevel[lay+1] = np.array(sealevel)[last]
+        records = np.array(records, dtype=float)
+        for k, on, record in [(0, self.input.sedOn, core.sedinput),
+                              (1, self.input.flowOn, core.waterflow),
+                              (2, self.input.tempOn, core.temperature),
+                              (3, self.input.pHOn, core.pH),
+                              (4, self.input.nutrientOn, core.nutrient)]:
+            if on:
+                record[lay] = records[last,k]
+
+        # Core update
+        dep = np.array(dep)
+        if dep.any():
+            np.add.at(core.coralH[self.input.speciesNb], lays, dep)
+            np.add.at(core.thickness, lays, dep)
+            for k in np.unique(lays[dep > 0.]):
+                if core.thickness[k] > 0.:
+                    core.topLay = k
+                    core.metrics.deposit(k, core.coralH, core.thickness)
+        for amount in remero:
+            if amount > 0.:
+                core._karstification(amount)
+        core.topH, self.timetec, self.tLayer, self.layID = ends[-1]
+        self.tNow = self.tCoral = t1[-1]
+        self.iter += nb
+
+        # Step size of the GLV integration over the null populations
+        for k in range(nb):
+            if self._kernel is not None:
+                self._kernel.idle(t0[k], t1[k])
+            else:
+                self.coral.idleGLV(t0[k], t1[k])
+        if self.store is not None:
+            self.store.step(nb)
+
+        kind = 'exposure' if exposed else 'collapse'
+        if len(self.phases) > 0 and self.phases[-1][0] == kind and self.phases[-1][2] == t0[0]:
+            self.phases[-1] = (kind, self.phases[-1][1], t1[-1], self.phases[-1][3]+nb)
+        else:
+            self.phases.append((kind, t0[0], t1[-1], nb))
+
+        return nb
+
+    def _stop(self, conditions):
+        """
+        Check the stop conditions of run_to_time, the name of the first one reached is kept
+        in stopEvent.
+        """
+
+        for condition in conditions:
+            if condition(self):
+                self.stopEvent = conditionName(condition)
+                print "Stop condition '%s' reached at tNow = %s [yr]" %(self.stopEvent, self.tNow)
+                return True
+
+        return False
+
+    def fork(self, params=None):
+        """
+        Clone the simulation at the current time. The child model gets its own copy of the
+        simulation state and can continue with different input parameters, for example a
+        different sea-level curve, without changing the parent model. Parameters defining
+        the initial conditions (e.g. depth0) have no effect once the simulation has started.
+
+        Parameters
+        ----------
+        dict : params
+            Input parameters of the child overriding the ones of the parent (see load_xml).
+        """
+
+        # The child initialisation reseeds the global random generator, the parent state
+        # is taken before and the caller's random stream is put back after
+        rng = np.random.get_state()
+        state = None
+        if self.tNow != self.input.tStart:
+            state = self._state()
+        child = Model(solver=self.solver, kernel=self.kernel)
+        child.input = copy.deepcopy(self.input)
+        child._initialise(params, self.seed)
+        if state is not None:
+            child._restore(state)
+        np.random.set_state(rng)
+
+        return child
+
+    def _init_records(self):
+        """
+        Initialise the Generalized Lotka-Volterra equation and the simulation records.
+        """
+
+        self.coral = coralGLV.coralGLV(input=self.input)
+        if self.solver is not None:
+            self.coral.solver = self.solver
+        # Work arrays of the carbonate steps
+        self._fac = np.ones(self.input.speciesNb, dtype=float)
+        self._epsilon = np.zeros(self.input.speciesNb, dtype=float)
+        self._masks = np.zeros((2,self.input.speciesNb), dtype=bool)
+        if self.kernel is not None:
+            if self.coral.odeGrid > 0 or self.coral.odeDense > 0:
+                raise ValueError('The carbonate kernel requires the solver grid and dense '
+                                 'output to be set to 0.')
+            self._kernel = carbonateKernel.carbonateKernel(self.kernel, self.input, self.force)
+        # Evaluate the time dependent forcings once for all carbonate steps
+        self.force.buildTimeline(self.coral.iterationTime)
+        if self._storeConfig is not None:
+            self.store = outputStore.outputStore(*self._storeConfig)
+            self.store.attach(self.coral, self.core)
+
+        return
+
+    def export(self, filename, fmt=None, sep='\t'):
+        """
+        Export the core columns (depth, thickness, proportion and accumulation of each
+        community, forcing records and karstification) without plotting, see coreExport.
+
+        Returns the name of the written file.
+
+        Parameters
+        ----------
+        string : filename
+            Output file name.
+
+        string : fmt
+            File format (npz, parquet, feather or csv), given by the file extension when None.
+
+        string : sep
+            Separator used in CSV files.
+        """
+
+        return coreExport.exportCore(self.plot, filename, fmt, sep)
+
+    def summary(self):
+        """
+        Summary record of the simulation maintained during the run (see coreMetrics), without
+        reading the full records: simulated time (years), core thickness, thickness of each
+        community and of the siliciclastic sediment (totals), karstified thickness (eroded),
+        facies sequence from the bottom of the core (facies and faciesThickness, the facies
+        being the index of the dominant component of the layers) and mean carbonate
+        production rate in mm/y (rate).
+        """
+
+        record = self.core.metrics.summary(self.core.coralH, self.core.thickness)
+        record['years'] = self.tNow-self.input.tStart
+        record['rate'] = 0.
+        if record['years'] > 0.:
+            record['rate'] = record['totals'][:-1].sum()*1000./record['years']
+
+        return record
+
+    def save_checkpoint(self, filename):
+        """
+        Save the simulation state to a compressed binary file (numpy .npz format) from
+        which the simulation can be resumed with load_checkpoint. Only the records computed
+        so far are saved.
+
+        Parameters
+        ----------
+        string : filename
+            Checkpoint file name.
+        """
+
+        if self.tNow == self.input.tStart:
+            raise ValueError('The simulation has not started yet, nothing to checkpoint')
+
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, **self._state())
+
+        return
+
+    def _state(self):
+        """
+        Simulation state saved in checkpoints, records are only given up to the current
+        carbonate step and stratigraphic layer.
+        """
+
+        state = {}
+        state['version'] = CHECKPOINT_VERSION
+        state['definition'] = self._definition()
+        for name in CHECKPOINT_STATE:
+            state[name] = getattr(self, name)
+        state['topH'] = self.core.topH
+        state['seed'] = self.seed
+        for name in CHECKPOINT_FORCE:
+            value = getattr(self.force, name, None)
+            if value is None:
+                value = np.nan
+            state['force.'+name] = value
+        rng = np.random.get_state()
+        state['rng.keys'] = rng[1]
+        state['rng.state'] = np.array(rng[2:], dtype=float)
+
+        # Records up to the current carbonate step and stratigraphic layer
+        nT = self.iter+1
+        nL = min(self.layID+2, self.core.layNb)
+        state['coral.state'] = self.coral.state
+        for name in CHECKPOINT_CORAL:
+            state['coral.'+name] = getattr(self.coral, name)[...,:nT]
+        for name in CHECKPOINT_CORE:
+            state['core.'+name] = getattr(self.core, name)[...,:nL]
+        if self.coral.odeDense > 0:
+            state['coral.denseTime'] = np.array(self.coral.denseTime)
+            state['coral.densePop'] = np.array(self.coral.densePop)
+
+        return state
+
+    def load_checkpoint(self, filename):
+        """
+        Restore the simulation state saved by save_checkpoint, the model should be loaded
+        from the same XmL input file (forcing curves and community parameters can differ).
+
+        Parameters
+        ----------
+        string : filename
+            Checkpoint file name.
+        """
+
+        self._restore(np.load(filename), filename)
+
+        return
+
+    def _restore(self, state, name='state'):
+        """
+        Restore the simulation from a state given by _state.
+        """
+
+        if int(state['version']) != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version %d'%int(state['version']))
+        if not np.array_equal(state['definition'], self._definition()):
+            raise ValueError('Checkpoint %s does not match the time and communities '
+                             'definition of the XmL input file'%name)
+
+        for attr in CHECKPOINT_STATE:
+            setattr(self, attr, np.asarray(state[attr]).item())
+        self.seed = int(state['seed'])
+        rng = state['rng.state']
+        np.random.set_state(('MT19937', state['rng.keys'], int(rng[0]), int(rng[1]), rng[2]))
+
+        self._init_records()
+        self.core.topH = np.asarray(state['topH']).item()
+        for attr in CHECKPOINT_FORCE:
+            value = np.asarray(state['force.'+attr]).item()
+            if value is None or np.isnan(value):
+                value = None
+            setattr(self.force, attr, value)
+        self.coral.state = np.array(state['coral.state'], dtype=float)
+        for attr in CHECKPOINT_CORAL:
+            data = state['coral.'+attr]
+            getattr(self.coral, attr)[...,:data.shape[-1]] = data
+        for attr in CHECKPOINT_CORE:
+            data = state['core.'+attr]
+            getattr(self.core, attr)[...,:data.shape[-1]] = data
+        layers = np.flatnonzero(self.core.thickness[:self.layID+1])
+        self.core.topLay = layers[-1] if len(layers) > 0 else -1
+        self.core.metrics.rebuild(self.core.coralH, self.core.thickness, self.core.karstero,
+                                  self.core.topLay)
+        if self.coral.odeDense > 0 and 'coral.denseTime' in state:
+            self.coral.denseTime = list(state['coral.denseTime'])
+            self.coral.densePop = list(state['coral.densePop'])
+        self._update_plot()
+
+        return
+
+    def _definition(self):
+        """
+        Time and communities definition which should be identical to restore a checkpoint.
+        """
+
+        return np.array([self.input.tStart, self.input.tEnd, self.input.tCarb,
+                         self.input.laytime, self.input.speciesNb], dtype=float)
+
+    def _update_plot(self):
+        """
+        Update plotting parameters with the current simulation records, stored records are
+        memory maps read lazily from their files.
+        """
+
+        if self.store is not None:
+            self.store.flush()
+
         self.plot.pop = self.coral.population
         self.plot.timeCarb = self.coral.iterationTime
         self.plot.mbsl = self.coral.mbsl
@@ -2,6 +2,12 @@ import os
 
 from ipyparallel import Client
 
+# Engine-side registry of the models held by each engine, indexed by scenario name
+_registry = {}
+
+# Registry name of the model mirrored on all engines by RemoteModel
+MIRROR = '__mirror__'
+
 
 def relog():
     ''' For debugging, redirect the individual node stdout/stderr to a file '''
@@ -15,6 +21,60 @@ def relog():
     sys.stderr = logfile
 
 
+def _engine_load(name, filename, cwd, params=None, seed=None, solver=None, verbose=False):
+    ''' Create a model on the engine and load its XmL input file '''
+    from pyReefCore.model import Model
+
+    os.chdir(cwd)
+    model = Model(solver=solver)
+    model.load_xml(filename, verbose=verbose, params=params, makedir=False, seed=seed)
+    _registry[name] = model
+
+    return name
+
+
+def _engine_run(name, tEnd, showtime=None, verbose=False):
+    ''' Run a model held by the engine and return its current time '''
+    model = _registry[name]
+    if tEnd is None:
+        tEnd = model.input.tEnd
+    if showtime is None:
+        showtime = tEnd-model.tNow+1.
+    model.run_to_time(tEnd, showtime=showtime, verbose=verbose)
+
+    return model.tNow
+
+
+def _engine_scenario(name, filename, cwd, params=None, seed=None, solver=None, tEnd=None):
+    ''' Load and run a scenario on the engine, the model is kept in the registry '''
+    _engine_load(name, filename, cwd, params, seed, solver)
+
+    return _engine_run(name, tEnd)
+
+
+def _engine_fetch(name, attributes):
+    ''' Return the requested attributes (e.g. core.thickness) of a model held by the engine '''
+    model = _registry[name]
+    values = {}
+    for path in attributes:
+        obj = model
+        for attr in path.split('.'):
+            obj = getattr(obj, attr)
+        values[path] = obj
+
+    return values
+
+
+def _engine_setattr(name, attribute, value):
+    ''' Set an attribute of a model held by the engine '''
+    setattr(_registry[name], attribute, value)
+
+
+def _engine_release(name):
+    ''' Remove a model from the engine registry '''
+    _registry.pop(name, None)
+
+
 class RemoteModel(object):
     """
     Wrapper to allow Model to run on an MPI cluster while hiding most of the
@@ -27,6 +87,9 @@ class RemoteModel(object):
     and handles all communication with the slaves. The slaves run the native
     Model object. In this way, the calling code does not need to be aware of the
     underlying parallelisation details.
+
+    Exceptions raised on the engines are propagated as ipyparallel RemoteError
+    (or CompositeError when several engines fail).
     """
 
     # These attributes are exposed on the RemoteModel object; any other
@@ -38,26 +101,21 @@ class RemoteModel(object):
         self._view = self._client[:]
         self._view.block = True
 
-        self._view.execute('from pyReef.Model.model import Model')
-        self._view.execute('model = Model()')
-
         # Uncomment this to enable node debug logging to /tmp
         # self._view.apply(relog)
 
     def load_xml(self, filename, verbose=False):
-        try:
-            cwd = os.getcwd()
-            self._view.execute('import os')
-            self._view.execute('os.chdir("%s")' % cwd)
-            self._view.execute('model.load_xml(filename="%s", verbose=%s)' % (filename, verbose))
-        except Exception, e:
-            import pdb; pdb.set_trace()
-
-    def run_to_time(self, tEnd):
-        try:
-            self._view.execute('model.run_to_time(%s)' % tEnd)
-        except Exception, e:
-            import pdb; pdb.set_trace()
+        self._view.apply_sync(_engine_load, MIRROR, filename, os.getcwd(), verbose=verbose)
+
+    def run_to_time(self, tEnd, showtime=10, verbose=False):
+        self._view.apply_sync(_engine_run, MIRROR, tEnd, showtime, verbose)
+
+    def fetch(self, *attributes):
+        """
+        Read only the requested attributes (e.g. core.topH, coral.population) from node 0,
+        returns a dictionary of the values.
+        """
+        return self._client[0].apply_sync(_engine_fetch, MIRROR, list(attributes))
 
     def ncpus(self):
         """Return the number of CPUs used to generate the results."""
@@ -65,7 +123,9 @@ class RemoteModel(object):
 
     def __getattr__(self, name):
         """If we don't define an attribute locally, read its value from node 0"""
-        return self._client[0]['model.%s' % name]
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._client[0].apply_sync(_engine_fetch, MIRROR, [name])[name]
 
     def __setattr__(self, name, value):
         """If we don't define an attribute locally, write its value to all nodes"""
@@ -73,4 +133,107 @@ class RemoteModel(object):
         if name in RemoteModel.REMOTEMODEL_ATTRIBUTES:
             self.__dict__[name] = value
         else:
-            self._view['model.%s' % name] = value
+            self._view.apply_sync(_engine_setattr, MIRROR, name, value)
+
+
+class RemoteScenarios(object):
+    """
+    Distributed backend running a different scenario on each engine.
+
+    Scenarios are submitted to a load-balanced view and return non-blocking
+    ipyparallel AsyncResult objects: ready() tells if the scenario is done and
+    get() returns the final time of the simulation or raises the RemoteError
+    of the engine. The model of each scenario stays on the engine which ran it
+    and only the requested arrays are sent back with fetch.
+
+    For testing, a local multi-process cluster can be started with:
+        ipcluster start -n 4
+    and used with RemoteScenarios(profile='default').
+
+    Parameters
+    ----------
+    string : profile
+        ipyparallel profile of the cluster.
+
+    object : client
+        Existing ipyparallel Client, used instead of the profile.
+    """
+
+    def __init__(self, profile='mpi', client=None):
+        if client is None:
+            client = Client(profile=profile)
+        self._client = client
+        self._lview = client.load_balanced_view()
+        self._results = {}
+        self._count = 0
+
+    def submit(self, filename, params=None, tEnd=None, seed=None, solver=None, name=None):
+        """
+        Submit a scenario: load the XmL input file with the given input parameters and
+        run it to tEnd (end time of the XmL input file when None).
+
+        Returns the scenario name and its AsyncResult.
+        """
+
+        if name is None:
+            name = 'scenario-%d' % self._count
+        self._count += 1
+        if name in self._results:
+            raise ValueError('Scenario %s is already defined' % name)
+
+        result = self._lview.apply_async(_engine_scenario, name, filename, os.getcwd(),
+                                         params, seed, solver, tEnd)
+        self._results[name] = result
+
+        return name, result
+
+    def map(self, filename, design, tEnd=None, seeds=None, solver=None):
+        """
+        Submit one scenario per set of input parameters of the design and return the
+        list of scenario names.
+        """
+
+        names = []
+        for k, params in enumerate(design):
+            seed = None
+            if seeds is not None:
+                seed = seeds[k]
+            names.append(self.submit(filename, params, tEnd, seed, solver)[0])
+
+        return names
+
+    def result(self, name):
+        """Return the AsyncResult of a scenario."""
+        return self._results[name]
+
+    def wait(self, names=None, timeout=-1):
+        """Wait for the given scenarios (all of them when None) to complete."""
+        if names is None:
+            names = list(self._results.keys())
+        return self._client.wait([self._results[name] for name in names], timeout)
+
+    def fetch_async(self, name, attributes):
+        """
+        Retrieve the requested attributes (e.g. core.thickness, coral.population) of a
+        completed scenario from the engine which ran it, returns an AsyncResult of a
+        dictionary of the values.
+        """
+
+        result = self._results[name]
+        result.get()
+
+        return self._client[result.engine_id].apply_async(_engine_fetch, name, list(attributes))
+
+    def fetch(self, name, attributes):
+        """Blocking version of fetch_async."""
+        return self.fetch_async(name, attributes).get()
+
+    def release(self, name):
+        """Free the model of a scenario on its engine."""
+        result = self._results.pop(name)
+        if result.ready() and result.successful():
+            self._client[result.engine_id].apply_sync(_engine_release, name)
+
+    def ncpus(self):
+        """Return the number of engines of the cluster."""
+        return len(self._client.ids)
@@ -10,6 +10,7 @@
    Implementation relating to pyReefCore coral evolution.
 """
 
+import odeSolver
 import coralGLV
 import coreData
 import modelPlot
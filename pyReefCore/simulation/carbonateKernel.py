@@ -0,0 +1,335 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines a fused carbonate step kernel. A single call computes the environmental
+factors of the active forcings from their levels, integrates the Generalized Lotka-Volterra
+equation over the carbonate step with the Dormand-Prince scheme of the dopri solver, clamps
+the populations, computes the carbonate production and deposits it in the current layer.
+Karstification of exposed cores is left to coreData.
+
+The kernel only works on plain arrays and scalars. It is compiled with numba when the
+library is available and otherwise runs the same code with numpy.
+"""
+import numpy
+
+from pyReefCore.simulation.odeSolver import dopriSolver, nullStepSize
+
+# Kernels built for each mode
+_kernels = {}
+
+def _build(jit):
+    """
+    Build the carbonate step kernel, compiled with jit (e.g. numba.njit) or run by Python
+    when jit is None.
+    """
+
+    if jit is None:
+        jit = lambda function: function
+
+    A = dopriSolver.A.copy()
+    C = dopriSolver.C.copy()
+    E = dopriSolver.E.copy()
+    safety = dopriSolver.safety
+    minFactor = dopriSolver.minFactor
+    maxFactor = dopriSolver.maxFactor
+
+    @jit
+    def glv(X, epsilon, alpha, out):
+        out[:] = numpy.dot(alpha, X)
+        out += epsilon
+        out *= X
+
+    @jit
+    def norm(x):
+        return numpy.sqrt(numpy.dot(x, x)/len(x))
+
+    @jit
+    def initialStep(y, epsilon, alpha, t, tEnd, rtol, atol, minStep, K, work):
+        # Starting step size estimation from Hairer, Norsett & Wanner (1993), II.4
+        ynew = work[0]
+        yerr = work[1]
+        scale = work[2]
+        scale[:] = numpy.abs(y)*rtol+atol
+        yerr[:] = y/scale
+        d0 = norm(yerr)
+        yerr[:] = K[0]/scale
+        d1 = norm(yerr)
+        if d0 < 1.e-5 or d1 < 1.e-5:
+            h0 = 1.e-6
+        else:
+            h0 = 0.01*d0/d1
+        h0 = min(h0, tEnd-t)
+        ynew[:] = K[0]*h0+y
+        glv(ynew, epsilon, alpha, K[1])
+        yerr[:] = (K[1]-K[0])/scale
+        d2 = norm(yerr)/h0
+        if max(d1, d2) <= 1.e-15:
+            h1 = max(1.e-6, h0*1.e-3)
+        else:
+            h1 = (0.01/max(d1, d2))**(1./5.)
+
+        return max(min(100.*h0, h1), minStep)
+
+    @jit
+    def dopri(y, epsilon, alpha, t, tEnd, h, rtol, atol, minStep, K, work, stats):
+        # Integration from t to tEnd, the state is updated in place (see dopriSolver)
+        ynew = work[0]
+        yerr = work[1]
+        scale = work[2]
+        glv(y, epsilon, alpha, K[0])
+        stats[0] += 1
+        if h <= 0.:
+            h = initialStep(y, epsilon, alpha, t, tEnd, rtol, atol, minStep, K, work)
+            stats[0] += 1
+        while t < tEnd:
+            last = h >= tEnd-t
+            if last:
+                hstep = tEnd-t
+            else:
+                hstep = h
+            # Runge-Kutta stages
+            for s in range(1, 7):
+                ynew[:] = numpy.dot(A[s,:s], K[:s])
+                ynew *= hstep
+                ynew += y
+                glv(ynew, epsilon, alpha, K[s])
+                stats[0] += 1
+            # Local error estimate
+            yerr[:] = numpy.dot(E, K)
+            yerr *= hstep
+            scale[:] = numpy.maximum(numpy.abs(y), numpy.abs(ynew))*rtol+atol
+            yerr /= scale
+            err = norm(yerr)
+            if err <= 1. or hstep <= minStep:
+                stats[1] += 1
+                if last:
+                    t = tEnd
+                else:
+                    t += hstep
+                y[:] = ynew
+                K[0][:] = K[6]
+                # Keep the proposed step when it was truncated to reach tEnd
+                if not last or hstep == h:
+                    if err == 0.:
+                        factor = maxFactor
+                    else:
+                        factor = min(maxFactor, safety*err**(-1./5.))
+                    h = max(hstep*factor, minStep)
+            else:
+                stats[2] += 1
+                factor = max(minFactor, safety*err**(-1./5.))
+                h = max(hstep*factor, minStep)
+
+        return h
+
+    @jit
+    def step(levels, kinds, tables, xmax, below, above, malthus, alpha, y, t, tEnd, h,
+             solverParams, stepParams, prod, sh, topH, layID, coralH, thickness, K, work,
+             stats):
+        rtol = solverParams[0]
+        atol = solverParams[1]
+        minStep = solverParams[2]
+        maxpop = stepParams[0]
+        facOpt = stepParams[1]
+        dt = stepParams[2]
+        prodscale = stepParams[3]
+        fac = work[3]
+        epsilon = work[4]
+        production = work[5]
+        row = work[6]
+        S = len(y)
+
+        # Environmental factors limiting species activity
+        fac[:] = 1.
+        nb = tables.shape[2]
+        for k in range(len(levels)):
+            value = levels[k]
+            if kinds[k] == 0:
+                row[:] = value
+            elif value < 0.:
+                row[:] = below[k]
+            elif value > xmax[k]:
+                row[:] = above[k]
+            else:
+                pos = 0.
+                if xmax[k] > 0.:
+                    pos = value/xmax[k]*(nb-1)
+                i = min(int(pos), nb-2)
+                w = pos-i
+                row[:] = tables[k,:,i]*(1.-w)+tables[k,:,i+1]*w
+            if k == 0:
+                fac[:] = row
+            else:
+                fac[:] = numpy.minimum(fac, row)
+
+        # Generalized Lotka-Volterra equation over the carbonate step
+        epsilon[:] = malthus*fac
+        h = dopri(y, epsilon, alpha, t, tEnd, h, rtol, atol, minStep, K, work, stats)
+
+        # Population limits and turn-on criterion, no population without accommodation space
+        y[:] = numpy.minimum(y, maxpop)
+        y[epsilon == 0.] = 0.
+        y[numpy.logical_and(fac >= facOpt, y == 0.)] = 1.
+        if topH <= 0.:
+            y[:] = 0.
+
+        # Carbonate production for the given time step [m]
+        production[:] = prod*y*dt/prodscale
+        production[numpy.logical_not(epsilon > 0.)] = 0.
+        production[:] = numpy.minimum(production, prod*dt)
+
+        # Deposition in the current layer (see coreData.coralProduction)
+        if topH > 0.:
+            prodsum = production.sum()
+            toth = prodsum+sh
+            if topH-sh < 0.:
+                coralH[S,layID] += topH
+                thickness[layID] += topH
+                topH = 0.
+            else:
+                if topH-toth < 0:
+                    production *= (topH-sh)/prodsum
+                    toth = production.sum()+sh
+                coralH[:S,layID] += production
+                coralH[S,layID] += sh
+                thickness[layID] += toth
+                topH -= toth
+
+        return h, topH
+
+    return step
+
+def kernel(mode='auto'):
+    """
+    Carbonate step kernel.
+
+    Parameters
+    ----------
+    string : mode
+        numba for the compiled kernel, numpy for the kernel run by Python, auto to use
+        numba when it is available and numpy otherwise.
+    """
+
+    if mode == 'auto':
+        try:
+            import numba
+            mode = 'numba'
+        except ImportError:
+            mode = 'numpy'
+    if mode not in ('numba', 'numpy'):
+        raise ValueError('Unknown carbonate kernel %s, use numba, numpy or auto.'%mode)
+
+    if mode not in _kernels:
+        jit = None
+        if mode == 'numba':
+            import numba
+            jit = numba.njit
+        _kernels[mode] = _build(jit)
+
+    return mode, _kernels[mode]
+
+class carbonateKernel(object):
+    """
+    Fused carbonate step of a Model, holds the arrays used by the kernel. The last step size
+    of the GLV integration is kept in h as a warm start for the next step and the solver
+    statistics are given by nfev, naccept and nreject.
+
+    Parameters
+    ----------
+    string : mode
+        Kernel mode (numba, numpy or auto).
+
+    object : input
+        Input parameters of the simulation.
+
+    object : force
+        Environmental forcing of the simulation.
+    """
+
+    def __init__(self, mode, input, force):
+
+        self.mode, self._step = kernel(mode)
+        self.name = 'kernel-'+self.mode
+        self.h = 0.
+        S = input.speciesNb
+        self.tables = force.kernelTables()
+        self.malthus = numpy.ascontiguousarray(input.malthusParam, dtype=float)
+        self.alpha = numpy.ascontiguousarray(input.communityMatrix, dtype=float)
+        self.prod = numpy.ascontiguousarray(input.speciesProduction, dtype=float)
+        self.solverParams = numpy.array([input.odeRtol, input.odeAtol, input.odeMinStep])
+        self.stepParams = numpy.array([input.maxpop, input.facOpt, input.tCarb,
+                                       input.prodscale], dtype=float)
+        self.K = numpy.zeros((7,S), dtype=float)
+        self.work = numpy.zeros((7,S), dtype=float)
+        self.stats = numpy.zeros(3, dtype=numpy.int64)
+
+        return
+
+    @property
+    def nfev(self):
+        return int(self.stats[0])
+
+    @property
+    def naccept(self):
+        return int(self.stats[1])
+
+    @property
+    def nreject(self):
+        return int(self.stats[2])
+
+    def idle(self, t0, tEnd):
+        """
+        Update the step size of the GLV integration over a carbonate step with null
+        populations, which does not need to be integrated (see odeSolver.nullStepSize).
+        """
+
+        self.h = nullStepSize(self.h, t0, tEnd, self.solverParams[2])
+
+        return
+
+    def step(self, levels, y, t, tEnd, h, sh, topH, layID, coralH, thickness):
+        """
+        Advance a carbonate step, the population y and the current layer of the core are
+        updated in place.
+
+        Returns the last step size of the GLV integration and the new top elevation.
+
+        Parameters
+        ----------
+        variable : levels
+            Levels of the active forcings (see enviForce.getLevels).
+
+        variable : y
+            Species population distribution at the beginning of the step.
+
+        float : t, tEnd
+            Beginning and end of the carbonate step.
+
+        float : h
+            First step size of the integration, estimated when lower or equal to 0.
+
+        float : sh
+            Siliciclastic sediment thickness deposited during the step [m].
+
+        float : topH
+            Accommodation space at the beginning of the step [m].
+
+        int : layID
+            Index of the current stratigraphic layer.
+
+        variable : coralH, thickness
+            Composition and thickness records of the core layers.
+        """
+
+        kinds, tables, xmax, below, above = self.tables
+
+        return self._step(levels, kinds, tables, xmax, below, above, self.malthus,
+                          self.alpha, y, t, tEnd, h, self.solverParams, self.stepParams,
+                          self.prod, sh, topH, layID, coralH, thickness, self.K, self.work,
+                          self.stats)
@@ -14,12 +14,14 @@ and its interaction with the other species.
 """
 import os
 import numpy
-import odespy
+
+from pyReefCore.simulation import odeSolver
 
 class coralGLV:
     """
-    This class solves the Generalized Lotka-Volterra equation using Runge-Kutta-Fehlberg
-    method (RKF45 or Fehlberg as defined in the odespy library)
+    This class solves the Generalized Lotka-Volterra equation using by default the
+    Runge-Kutta-Fehlberg method (RKF45 or Fehlberg as defined in the odespy library).
+    Other ODE solvers are available from the odeSolver module.
     """
 
     def __init__(self, input = None):
@@ -27,12 +29,21 @@ class coralGLV:
         Constructor.
         """
 
+        # ODE solver name
+        self.solver = input.odeSolver
         # RKF relative tolerance for solution
-        self.rtol = 1.e-6
+        self.rtol = input.odeRtol
         # RKF absolute tolerance for solution
-        self.atol = self.rtol
+        self.atol = input.odeAtol
         # RKF minimum step size for an adaptive algorithm.
-        self.min_step = 1.e-4
+        self.min_step = input.odeMinStep
+        self.odeRKF = None
+        # Number of output points per carbonate step, 0 advances adaptively to the end
+        self.odeGrid = input.odeGrid
+        # Number of intermediate states kept per carbonate step in adaptive mode
+        self.odeDense = input.odeDense
+        self.denseTime = []
+        self.densePop = []
         # Definition of the intrinsic rate of a population species
         self.epsilon = input.malthusParam
         # Community matrix representing the interactions between species
@@ -42,6 +53,14 @@ class coralGLV:
         self.population = numpy.zeros((input.speciesNb,len(self.iterationTime)),dtype=float)
         self.accspace = numpy.zeros(len(self.iterationTime),dtype=float)
         self.mbsl = numpy.zeros(len(self.iterationTime),dtype=float)
+        # Current population in double precision, records may be stored in single precision
+        self.state = numpy.array(input.speciesPopulation,dtype=float)
+        # Use the vectorised right-hand side with preallocated work arrays
+        self.vecRHS = True
+        self._dX = numpy.zeros(input.speciesNb,dtype=float)
+        self._jac = numpy.zeros((input.speciesNb,input.speciesNb),dtype=float)
+        self._jacdiag = numpy.zeros(input.speciesNb,dtype=float)
+        self._diag = numpy.diag_indices(input.speciesNb)
 
         return
 
@@ -66,13 +85,145 @@ class coralGLV:
 
         return function
 
+    def _functionGLVvec(self, X, t):
+        """
+        Vectorised form of the Generalized Lotka-Volterra equation computed as
+        (epsilon + alpha.X) * X.
+
+        The result is written in a preallocated buffer which is overwritten on the
+        next call. Solvers keeping several stages in memory need to copy it.
+
+        Parameters
+        ----------
+
+        variable : X
+            Species population distribution at current time step.
+
+        variable : t
+            Time step on which to solve the ODEs for.
+        """
+
+        numpy.dot(self.alpha, X, out=self._dX)
+        self._dX += self.epsilon
+        self._dX *= X
+
+        return self._dX
+
+    def _jacobianGLV(self, X, t):
+        """
+        Analytic Jacobian of the Generalized Lotka-Volterra equation used by implicit and
+        stiff solvers: diag(epsilon + alpha.X) + diag(X).alpha
+
+        As for the vectorised right-hand side, the returned matrix is a preallocated
+        buffer.
+
+        Parameters
+        ----------
+
+        variable : X
+            Species population distribution at current time step.
+
+        variable : t
+            Time step on which to solve the ODEs for.
+        """
+
+        numpy.dot(self.alpha, X, out=self._jacdiag)
+        self._jacdiag += self.epsilon
+        numpy.multiply(X[:,None], self.alpha, out=self._jac)
+        self._jac[self._diag] += self._jacdiag
+
+        return self._jac
+
     def solverGLV(self):
         """
-        This function build the RKF solver used for the Generalized Lotka-Volterra equation.
+        This function build the ODE solver used for the Generalized Lotka-Volterra equation.
+
+        The solver is built once and reused for later calls as long as the solver name
+        and the right-hand side mode are unchanged.
+        """
+
+        if self.vecRHS:
+            functionGLV = self._functionGLVvec
+        else:
+            functionGLV = self._functionGLV
+
+        if self.odeRKF is not None:
+            if self.odeRKF.name == self.solver and self.odeRKF.f == functionGLV:
+                return self.odeRKF
+
+        # Solver initialisation
+        self.odeRKF = odeSolver.create(self.solver, functionGLV, jac=self._jacobianGLV,
+                                       rtol=self.rtol, atol=self.atol,
+                                       min_step=self.min_step)
+
+        return self.odeRKF
+
+    def rearmGLV(self, epsilon, X0):
+        """
+        Re-arm the ODE solver for a new carbonate step. The solver object is kept and
+        starts from its last accepted step size.
+
+        Parameters
+        ----------
+
+        variable : epsilon
+            Intrinsic rate of a population species for the new step.
+
+        variable : X0
+            Species population distribution at the beginning of the step.
+        """
+
+        self.epsilon = epsilon
+        self.odeRKF.set_initial_condition(X0)
+
+        return self.odeRKF
+
+    def idleGLV(self, t0, tEnd):
+        """
+        Advance the ODE solver over a carbonate step with null populations, the populations
+        stay null and are not integrated (see odeSolver.idle).
+
+        Parameters
+        ----------
+
+        float : t0
+            Beginning of the carbonate step.
+
+        float : tEnd
+            End of the carbonate step.
+        """
+
+        if self.odeGrid > 0:
+            tODE = numpy.linspace(t0, tEnd, self.odeGrid+1)
+            for k in range(1, len(tODE)):
+                self.odeRKF.idle(tODE[k-1], tODE[k])
+        else:
+            self.odeRKF.idle(t0, tEnd)
+
+        return
+
+    def advanceGLV(self, t0, tEnd):
+        """
+        Integrate the Generalized Lotka-Volterra equation from t0 to tEnd with adaptive
+        internal steps and return the final populations. When odeDense is set the
+        intermediate populations are interpolated and stored in denseTime and densePop.
+
+        Parameters
+        ----------
+
+        float : t0
+            Beginning of the carbonate step.
+
+        float : tEnd
+            End of the carbonate step.
         """
 
-        # RKF initialisation
-        odeRKF = odespy.Fehlberg(self._functionGLV, atol=self.atol,
-                                   rtol=self.rtol, min_step=self.min_step)
+        if self.odeDense > 0:
+            tDense = numpy.linspace(t0, tEnd, self.odeDense+2)[1:-1]
+            X, Xdense = self.odeRKF.advance(t0, tEnd, tDense)
+            self.denseTime.append(tDense)
+            self.densePop.append(Xdense.T)
+        else:
+            X, Xdense = self.odeRKF.advance(t0, tEnd)
 
-        return odeRKF
+        return X
@@ -12,13 +12,51 @@ the interactions between the active forcing paramters.
 """
 import os
 import numpy
-import pandas as pd
-import skfuzzy as fuzz
 
-import matplotlib
-from matplotlib import gridspec
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
+from pyReefCore.simulation import coreMetrics
+
+def karstLayers(thickness, top, remero):
+    """
+    Layers eroded by karstification from the uppermost layer containing sediments downwards.
+    Only a band of layers below the top one is read, it is enlarged until it contains the
+    requested erosion.
+
+    Returns the number of layers entirely removed, their thickness and the thickness eroded
+    from the next layer.
+
+    Parameters
+    ----------
+    variable : thickness
+        Thickness of the core layers.
+
+    int : top
+        Uppermost layer containing sediments.
+
+    float : remero
+        Thickness to erode due to karstification [m].
+    """
+
+    # Only the top layer is eroded
+    if remero < thickness[top]:
+        return 0, 0., remero
+
+    band = 8
+    while True:
+        bottom = max(top-band+1, 0)
+        cumthick = numpy.cumsum(thickness[bottom:top+1][::-1])
+        if bottom == 0 or cumthick[-1] >= remero:
+            break
+        band *= 4
+
+    nb = numpy.searchsorted(cumthick, remero, side='right')
+    full = 0.
+    if nb > 0:
+        full = cumthick[nb-1]
+        remero -= full
+    if nb == len(cumthick) or remero <= 0.:
+        remero = 0.
+
+    return nb, full, remero
 
 class coreData:
     """
@@ -45,6 +83,16 @@ class coreData:
         self.coralH = numpy.zeros((input.speciesNb+1,self.layNb),dtype=float)
         self.karstero = numpy.zeros(self.layNb,dtype=float)
 
+        # Uppermost layer containing sediments (layers above it are empty)
+        self.topLay = -1
+        # Summary metrics updated with the core records
+        self.metrics = coreMetrics.coreMetrics(input.speciesNb+1)
+
+        # Work arrays of the carbonate production
+        self._production = numpy.zeros(len(self.prod),dtype=float)
+        self._maxProd = numpy.zeros(len(self.prod),dtype=float)
+        self._inactive = numpy.zeros(len(self.prod),dtype=bool)
+
         # Diagonal part of the community matrix (coefficient ii)
         self.communityMatrix = input.communityMatrix
         self.alpha = input.communityMatrix.diagonal()
@@ -91,6 +139,9 @@ class coreData:
     def _plot_fuzzy_curve(self, xd, xs, xf, dtrap, strap, ftrap, size,
                           dpi, font, colors, width, fname):
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         matplotlib.rcParams.update({'font.size': font})
 
         for s in range(len(self.names)):
@@ -146,6 +197,13 @@ class coreData:
             Save filename.
         """
 
+        import pandas as pd
+        import skfuzzy as fuzz
+        import matplotlib
+        from matplotlib import gridspec
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mtick
+
         from matplotlib.cm import terrain
         nbcolors = len(self.names)+3
         colors = terrain(numpy.linspace(0, 1, nbcolors))
@@ -438,12 +496,15 @@ class coreData:
         """
 
         # Compute production for the given time step [m]
-        production = numpy.zeros((coral.shape))
-        ids = numpy.where(epsilon>0.)[0]
-        production[ids] = self.prod[ids] * coral[ids] * self.dt / self.prodscale
-        maxProd = self.prod * self.dt
-        tmpids = numpy.where(production>maxProd)[0]
-        production[tmpids] = maxProd[tmpids]
+        production = self._production
+        numpy.multiply(self.prod, coral, out=production)
+        production *= self.dt
+        production /= self.prodscale
+        numpy.greater(epsilon, 0., out=self._inactive)
+        numpy.logical_not(self._inactive, out=self._inactive)
+        numpy.copyto(production, 0., where=self._inactive)
+        numpy.multiply(self.prod, self.dt, out=self._maxProd)
+        numpy.minimum(production, self._maxProd, out=production)
 
         # Total thickness deposited
         sh = sedh * self.dt
@@ -459,25 +520,7 @@ class coreData:
 
         # In case there is no accommodation space and karstification is activated
         if self.topH < 0. and ero < 0:
-            remero = -ero
-            for k in range(layID,-1,-1):
-                if remero <= 0.:
-                    break
-                ch = self.thickness[k]
-                if self.thickness[k] > remero:
-                    perc = remero/self.thickness[k]
-                    self.thickness[k] -= remero
-                    self.karstero[k] += remero
-                    self.topH += remero
-                    for j in range(len(self.prod)+1):
-                        self.coralH[j,k] -= perc*self.coralH[j,k]
-                    remero = 0.
-                else:
-                    remero -= self.thickness[k]
-                    self.karstero[k] += self.thickness[k]
-                    self.coralH[:,k] = 0.
-                    self.topH += self.thickness[k]
-                    self.thickness[k] = 0.
+            self._karstification(-ero)
 
             return
 
@@ -518,4 +561,50 @@ class coreData:
             # Update current layer top elevation
             self.topH -= toth
 
+        # Uppermost layer containing sediments
+        if self.thickness[layID] > 0.:
+            self.topLay = layID
+            self.metrics.deposit(layID, self.coralH, self.thickness)
+
+        return
+
+    def _karstification(self, remero):
+        """
+        Erode the core from its uppermost layer containing sediments downwards. Layers are
+        entirely removed as long as the cumulative thickness from the top is lower than the
+        erosion, the next one is partially eroded (see karstLayers).
+
+        Parameters
+        ----------
+
+        variable : remero
+            Thickness to erode due to karstification [m].
+        """
+
+        top = self.topLay
+        if top < 0:
+            return
+
+        nb, removed, remero = karstLayers(self.thickness, top, remero)
+
+        # Layers entirely removed
+        if nb > 0:
+            full = slice(top-nb+1, top+1)
+            self.metrics.erodeLayers(full, self.coralH, self.thickness)
+            self.karstero[full] += self.thickness[full]
+            self.coralH[:,full] = 0.
+            self.thickness[full] = 0.
+            self.topH += removed
+        self.topLay = top-nb
+
+        # Partially eroded layer
+        if remero > 0.:
+            k = top-nb
+            perc = remero/self.thickness[k]
+            self.metrics.erodeLayer(k, perc, remero, self.coralH)
+            self.thickness[k] -= remero
+            self.karstero[k] += remero
+            self.topH += remero
+            self.coralH[:,k] -= perc*self.coralH[:,k]
+
         return
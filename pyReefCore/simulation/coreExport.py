@@ -0,0 +1,145 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module exports the core of a simulation as named columns, one row per stratigraphic
+layer: depth, thickness, proportion and accumulated proportion of each community and of the
+siliciclastic sediment, and the sea-level, water flow, sediment input, tectonic rate and
+karstification records.
+
+The columns are views of the model records whenever possible and are written as they are in
+NPZ, Parquet or Feather files (the last two require pyarrow). CSV files are written by
+chunks of rows, and are used as fallback when pyarrow is not available.
+"""
+import os
+import numpy
+
+# Supported formats and their file extensions
+FORMATS = {'npz': '.npz', 'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+
+# Number of rows formatted at once in CSV files
+CSV_CHUNK = 10000
+
+def coreColumns(plot):
+    """
+    Columns of the core, returns their names and values in order. The names of the
+    communities should be unique.
+
+    Parameters
+    ----------
+    object : plot
+        Plotting object of the model (see modelPlot) holding the simulation records.
+    """
+
+    sedH = plot.sedH[:,:-1]
+    depth = plot.depth[:-1]
+    n = len(depth)
+    bottom = plot.surf + depth.sum()
+
+    # Proportion and accumulated proportion of each component in the layers
+    prop = numpy.zeros(sedH.shape)
+    numpy.divide(sedH, depth, out=prop, where=depth>0)
+    acc = numpy.cumsum(prop, axis=0)
+
+    duplicates = sorted(set(name for name in plot.names if list(plot.names).count(name) > 1))
+    if len(duplicates) > 0:
+        raise ValueError('Duplicate community names %s, the core columns would overwrite '
+                         'each other.'%', '.join(map(str, duplicates)))
+
+    names = ['depth']
+    columns = [bottom - numpy.cumsum(depth)]
+    for prefix, values in [('th_', sedH), ('prop_', prop), ('acc_', acc)]:
+        for s in range(len(plot.names)):
+            names.append(prefix+plot.names[s])
+            columns.append(values[s])
+    for name, record in [('sealevel', plot.sealevel), ('waterflow', plot.waterflow),
+                         ('sedinput', plot.sedinput), ('tecrate', plot.tecinput),
+                         ('karstification', plot.karstero)]:
+        names.append(name)
+        columns.append(record[:n])
+
+    return names, columns
+
+def _writeCSV(filename, names, columns, sep):
+    """
+    Write the columns in a CSV file, the values are formatted by chunks of rows.
+    """
+
+    with open(filename, 'w') as f:
+        f.write(sep.join(names)+'\n')
+        for start in range(0, len(columns[0]), CSV_CHUNK):
+            rows = numpy.column_stack([c[start:start+CSV_CHUNK] for c in columns]).tolist()
+            f.write(''.join(sep.join(map(str, row))+'\n' for row in rows))
+
+    return
+
+def _table(names, columns):
+    """
+    Arrow table of the columns.
+    """
+
+    import pyarrow
+
+    return pyarrow.Table.from_arrays([pyarrow.array(numpy.ascontiguousarray(c))
+                                      for c in columns], names)
+
+def exportCore(plot, filename, fmt=None, sep='\t'):
+    """
+    Export the core columns (see coreColumns) to a file.
+
+    Returns the name of the written file, which has a .csv extension when the CSV fallback
+    is used and a .npz extension in NPZ format (added by numpy when missing).
+
+    Parameters
+    ----------
+    object : plot
+        Plotting object of the model (see modelPlot) holding the simulation records.
+
+    string : filename
+        Output file name.
+
+    string : fmt
+        File format (npz, parquet, feather or csv), given by the file extension when None.
+
+    string : sep
+        Separator used in CSV files.
+    """
+
+    if fmt is None:
+        ext = os.path.splitext(filename)[1].lower()
+        fmt = 'csv'
+        for name, fext in FORMATS.items():
+            if ext == fext:
+                fmt = name
+    if fmt not in FORMATS:
+        raise ValueError('Unknown export format %s, use one of %s.'
+                         %(fmt, ', '.join(sorted(FORMATS))))
+
+    names, columns = coreColumns(plot)
+    if fmt in ('parquet', 'feather'):
+        try:
+            table = _table(names, columns)
+        except ImportError:
+            filename = os.path.splitext(filename)[0]+FORMATS['csv']
+            print 'Warning: pyarrow is not available, the core is exported to',filename
+            fmt = 'csv'
+
+    if fmt == 'npz':
+        if not filename.endswith(FORMATS['npz']):
+            filename += FORMATS['npz']
+        numpy.savez(filename, **dict(zip(names, columns)))
+    elif fmt == 'parquet':
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(table, filename)
+    elif fmt == 'feather':
+        import pyarrow.feather
+        pyarrow.feather.write_feather(table, filename)
+    else:
+        _writeCSV(filename, names, columns, sep)
+
+    return filename
@@ -0,0 +1,230 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module accumulates summary metrics of a core while it is built: thickness of each
+community and of the siliciclastic sediment, total core thickness, karstified thickness and
+facies sequence (dominant component of the successive layers, merged in units).
+
+The layer receiving the deposits is kept open and read from the core records. When the
+deposits move to a new layer, the open layer is added to the totals and to the facies
+sequence. Karstification removes the eroded thickness from the top of the sequence.
+"""
+import numpy
+
+class coreMetrics(object):
+    """
+    Summary metrics accumulator of a core, updated by coreData.
+
+    Parameters
+    ----------
+    int : components
+        Number of core components (communities and siliciclastic sediment).
+    """
+
+    def __init__(self, components):
+
+        # Composition of the closed layers
+        self.totals = numpy.zeros(components, dtype=float)
+        self.eroded = 0.
+        # Layer receiving the deposits
+        self.layer = -1
+        # Facies units of the closed layers from the bottom: dominant component and thickness
+        self.facies = []
+        self.unitH = []
+        self._work = numpy.zeros(components, dtype=float)
+
+        return
+
+    def _close(self, coralH, thickness):
+        """
+        Add the open layer to the totals and facies sequence.
+        """
+
+        k = self.layer
+        if k < 0 or thickness[k] <= 0.:
+            return
+
+        self.totals += coralH[:,k]
+        facies = int(coralH[:,k].argmax())
+        if len(self.facies) > 0 and self.facies[-1] == facies:
+            self.unitH[-1] += thickness[k]
+        else:
+            self.facies.append(facies)
+            self.unitH.append(thickness[k])
+
+        return
+
+    def _remove(self, thick):
+        """
+        Remove an eroded thickness from the top of the facies sequence.
+        """
+
+        while thick > 0. and len(self.unitH) > 0:
+            if self.unitH[-1] <= thick*(1.+1.e-12):
+                thick -= self.unitH.pop()
+                self.facies.pop()
+            else:
+                self.unitH[-1] -= thick
+                thick = 0.
+
+        return
+
+    def deposit(self, layID, coralH, thickness):
+        """
+        Record a deposit in a layer, the previous layer is closed when the deposits move to a
+        new one.
+
+        Parameters
+        ----------
+        int : layID
+            Index of the layer receiving the deposit.
+
+        variable : coralH, thickness
+            Composition and thickness records of the core layers.
+        """
+
+        if layID != self.layer:
+            self._close(coralH, thickness)
+            self.layer = layID
+
+        return
+
+    def erodeLayers(self, full, coralH, thickness):
+        """
+        Record the removal of layers by karstification, called before the records are eroded
+        (see coreData._karstification).
+
+        Parameters
+        ----------
+        slice : full
+            Layers entirely removed.
+
+        variable : coralH, thickness
+            Composition and thickness records of the core layers.
+        """
+
+        lo, hi = full.start, full.stop
+        self.eroded += thickness[lo:hi].sum()
+        # The open layer is the uppermost one and is read from the records
+        if hi-1 == self.layer:
+            hi -= 1
+        if hi > lo:
+            numpy.sum(coralH[:,lo:hi], axis=1, out=self._work)
+            self.totals -= self._work
+            self._remove(thickness[lo:hi].sum())
+
+        return
+
+    def erodeLayer(self, k, perc, remero, coralH):
+        """
+        Record the partial karstification of a layer, called before the records are eroded
+        (see coreData._karstification).
+
+        Parameters
+        ----------
+        int : k
+            Eroded layer.
+
+        float : perc
+            Eroded proportion of the layer.
+
+        float : remero
+            Eroded thickness.
+
+        variable : coralH
+            Composition records of the core layers.
+        """
+
+        self.eroded += remero
+        if k != self.layer:
+            numpy.multiply(coralH[:,k], perc, out=self._work)
+            self.totals -= self._work
+            self._remove(remero)
+
+        return
+
+    def rebuild(self, coralH, thickness, karstero, topLay):
+        """
+        Compute the metrics from the core records, for example when the simulation is
+        restored from a checkpoint. The uppermost layer containing sediments is kept open.
+
+        Parameters
+        ----------
+        variable : coralH, thickness, karstero
+            Composition, thickness and karstification records of the core layers.
+
+        int : topLay
+            Uppermost layer containing sediments.
+        """
+
+        self.layer = topLay
+        self.eroded = float(karstero.sum())
+        self.totals[:] = 0.
+        self.facies = []
+        self.unitH = []
+        if topLay <= 0:
+            return
+
+        numpy.sum(coralH[:,:topLay], axis=1, out=self.totals)
+        ids = numpy.flatnonzero(thickness[:topLay] > 0.)
+        if len(ids) == 0:
+            return
+        facies = coralH[:,ids].argmax(axis=0)
+        starts = numpy.append(0, numpy.flatnonzero(numpy.diff(facies))+1)
+        self.facies = facies[starts].tolist()
+        self.unitH = numpy.add.reduceat(thickness[ids], starts).tolist()
+
+        return
+
+    def total(self, thickness):
+        """
+        Core thickness, the open layer is included.
+
+        Parameters
+        ----------
+        variable : thickness
+            Thickness records of the core layers.
+        """
+
+        total = self.totals.sum()
+        if self.layer >= 0:
+            total += thickness[self.layer]
+
+        return total
+
+    def summary(self, coralH, thickness):
+        """
+        Summary of the core, the open layer is included.
+
+        Returns a dictionary with the core thickness, the thickness of each component
+        (totals), the karstified thickness and the facies sequence from the bottom of the
+        core (facies, faciesThickness).
+
+        Parameters
+        ----------
+        variable : coralH, thickness
+            Composition and thickness records of the core layers.
+        """
+
+        totals = self.totals.copy()
+        facies = list(self.facies)
+        unitH = list(self.unitH)
+        k = self.layer
+        if k >= 0 and thickness[k] > 0.:
+            totals += coralH[:,k]
+            top = int(coralH[:,k].argmax())
+            if len(facies) > 0 and facies[-1] == top:
+                unitH[-1] += thickness[k]
+            else:
+                facies.append(top)
+                unitH.append(thickness[k])
+
+        return {'thickness': totals.sum(), 'totals': totals, 'eroded': self.eroded,
+                'facies': numpy.array(facies, dtype=int),
+                'faciesThickness': numpy.array(unitH, dtype=float)}
@@ -8,16 +8,15 @@
 ##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
 """
 Here we set plotting functions used to visualise pyReef dataset.
+
+In headless mode the figures are drawn on the Agg backend without pyplot, they are never
+shown and are returned by the plotting functions, so that they can be rendered in batch
+jobs and worker processes (see sweep.SweepRunner).
 """
 
-import matplotlib
 import numpy as np
-import pandas as pd
-from matplotlib import gridspec
-import matplotlib.pyplot as plt
 
-from scipy.ndimage.filters import gaussian_filter
-from matplotlib.ticker import FormatStrFormatter
+from pyReefCore.simulation import coreExport
 
 import warnings
 warnings.simplefilter(action = "ignore", category = FutureWarning)
@@ -27,9 +26,14 @@ class modelPlot():
     Class for plotting outputs from pyReef model.
     """
 
-    def __init__(self, input=None):
+    def __init__(self, input=None, headless=False):
         """
         Constructor.
+
+        Parameters
+        ----------
+        bool : headless
+            If True, figures are rendered with the Agg backend, returned instead of shown.
         """
 
         self.names = np.empty(input.speciesNb+1, dtype="S14")
@@ -53,9 +57,48 @@ class modelPlot():
         self.temperature = None
         self.nutrient = None
         self.folder = input.outDir
+        self.headless = headless
+
+        return
+
+    def _figure(self, size, dpi):
+        """
+        New figure, attached to an Agg canvas in headless mode and managed by pyplot otherwise.
+        """
+
+        if self.headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            fig = Figure(figsize=size, dpi=dpi)
+            FigureCanvasAgg(fig)
+        else:
+            import matplotlib.pyplot as plt
+            fig = plt.figure(figsize=size, dpi=dpi)
+
+        return fig
+
+    def _show(self, figs):
+        """
+        Show the figures, or return them in headless mode.
+        """
+
+        if self.headless:
+            return figs
+
+        import matplotlib.pyplot as plt
+        plt.show()
 
         return
 
+    def _colors(self, number, name='terrain'):
+        """
+        Default colors sampled from a Matplotlib color map.
+        """
+
+        from matplotlib import cm
+
+        return getattr(cm, name)(np.linspace(0, 1, number))
+
     def two_scales(self, ax1, time, data0, data1, c1, c2, font):
         """
 
@@ -170,8 +213,12 @@ class modelPlot():
 
         variable : fname
             Save PNG filename.
+
+        Returns the accommodation and production figures in headless mode.
         """
 
+        import matplotlib
+
         matplotlib.rcParams.update({'font.size': font})
 
         if colors is not None:
@@ -182,7 +229,8 @@ class modelPlot():
             c1 = '#229649'
 
         # Define figure size
-        fig, ax = plt.subplots(1,figsize=size, dpi=dpi)
+        fig = self._figure(size, dpi)
+        ax = fig.add_subplot(111)
         ax.set_facecolor('#f2f2f3')
         tmp = self.mbsl[:-2]-self.accspace[:-2]
         tmp2 = np.ediff1d(tmp)
@@ -197,26 +245,26 @@ class modelPlot():
 
         ttl = ax.title
         ttl.set_position([.5, 1.05])
-        plt.title('Accommodation space & core elevation through time',size=font+3)
+        ax2.set_title('Accommodation space & core elevation through time',size=font+3)
 
         self.color_y_axis(ax1, c1)
         self.color_y_axis(ax2, c2)
         ax2.plot(self.timeLay, self.sealevel, linewidth=2, c='#4badf2', linestyle='--', label='sealevel', zorder=0)
 
-        plt.xlim(self.timeCarb.min(), self.timeCarb.max())
+        ax2.set_xlim(self.timeCarb.min(), self.timeCarb.max())
 
         # Legend, title and labels
         lgd = ax2.legend(frameon=False,bbox_to_anchor=(1.14, 1.05))
-        plt.setp(lgd.get_texts(), color='#4badf2', fontsize=font+1)
-        plt.grid()
-        plt.show()
+        matplotlib.artist.setp(lgd.get_texts(), color='#4badf2', fontsize=font+1)
+        ax2.grid()
 
         if fname is not None:
             name = self.folder+'/'+fname
             fig.savefig(name, bbox_inches='tight')
 
         # Define figure size
-        fig, ax = plt.subplots(1,figsize=size, dpi=dpi)
+        fig2 = self._figure(size, dpi)
+        ax = fig2.add_subplot(111)
         ax.set_facecolor('#f2f2f3')
 
         # Plotting curves
@@ -229,24 +277,23 @@ class modelPlot():
 
         ttl = ax.title
         ttl.set_position([.5, 1.05])
-        plt.title('Core cumulative thickness & production rate through time',size=font+3)
+        ax2.set_title('Core cumulative thickness & production rate through time',size=font+3)
 
         self.color_y_axis(ax1, c1)
         self.color_y_axis(ax2, c2)
         # plt.xlabel('Time [y]',size=font+2)
         # plt.ylabel('Core thickness [m]',size=font+2)
         # ax.yaxis.label.set_color('#2ca02c')
-        plt.xlim(self.timeCarb.min(), self.timeCarb.max())
+        ax2.set_xlim(self.timeCarb.min(), self.timeCarb.max())
 
         # Legend, title and labels
-        plt.grid()
-        plt.show()
+        ax2.grid()
 
         if fname is not None:
             name = self.folder+'/prodvsdepth-'+fname
-            fig.savefig(name, bbox_inches='tight')
+            fig2.savefig(name, bbox_inches='tight')
 
-        return
+        return self._show((fig, fig2))
 
     def communityTime(self, colors=None, size=(10,5), font=9, dpi=80, fname=None):
         """
@@ -269,12 +316,19 @@ class modelPlot():
 
         variable : fname
             Save PNG filename.
+
+        Returns the figure in headless mode.
         """
 
+        import matplotlib
+
         matplotlib.rcParams.update({'font.size': font})
+        if colors is None:
+            colors = self._colors(len(self.pop)+10)
 
         # Define figure size
-        fig, ax = plt.subplots(1,figsize=size, dpi=dpi)
+        fig = self._figure(size, dpi)
+        ax = fig.add_subplot(111)
         ax.set_facecolor('#f2f2f3')
 
         # Plotting curves
@@ -282,24 +336,23 @@ class modelPlot():
             ax.plot(self.timeCarb, self.pop[s,:], label=self.names[s],linewidth=3,c=colors[s])
 
         # Legend, title and labels
-        plt.grid()
-        lgd = plt.legend(frameon=False,loc=4,prop={'size':font+1}, bbox_to_anchor=(1.2,-0.02))
-        plt.xlabel('Time [y]',size=font+2)
-        plt.ylabel('Population',size=font+2)
-        plt.ylim(0., int(self.pop.max())+1)
-        plt.xlim(self.timeCarb.min(), self.timeCarb.max())
+        ax.grid()
+        lgd = ax.legend(frameon=False,loc=4,prop={'size':font+1}, bbox_to_anchor=(1.2,-0.02))
+        ax.set_xlabel('Time [y]',size=font+2)
+        ax.set_ylabel('Population',size=font+2)
+        ax.set_ylim(0., int(self.pop.max())+1)
+        ax.set_xlim(self.timeCarb.min(), self.timeCarb.max())
 
 
         ttl = ax.title
         ttl.set_position([.5, 1.05])
-        plt.title('Evolution of community populations with time',size=font+3)
-        plt.show()
+        ax.set_title('Evolution of community populations with time',size=font+3)
 
         if fname is not None:
             name = self.folder+'/'+fname
             fig.savefig(name, bbox_extra_artists=(lgd,), bbox_inches='tight')
 
-        return
+        return self._show(fig)
 
     def communityDepth(self, colors=None, size=(10,5), font=9, dpi=80, fname=None):
         """
@@ -322,12 +375,19 @@ class modelPlot():
 
         variable : fname
             Save PNG filename.
+
+        Returns the figure in headless mode.
         """
 
+        import matplotlib
+
         matplotlib.rcParams.update({'font.size': font})
+        if colors is None:
+            colors = self._colors(len(self.pop)+10)
 
         # Define figure size
-        fig, ax = plt.subplots(1,figsize=size, dpi=dpi)
+        fig = self._figure(size, dpi)
+        ax = fig.add_subplot(111)
         ax.set_facecolor('#f2f2f3')
 
         # Plotting curves
@@ -337,23 +397,51 @@ class modelPlot():
             ax.plot(d, self.pop[s,::self.step], label=self.names[s],linewidth=3,c=colors[s])
 
         # Legend, title and labels
-        plt.grid()
-        lgd = plt.legend(frameon=False,loc=4,prop={'size':font+1}, bbox_to_anchor=(1.2,-0.02))
-        plt.xlabel('Depth [m]',size=font+2)
-        plt.ylabel('Population',size=font+2)
-        plt.ylim(0., int(self.pop.max())+1)
-        plt.xlim(d.max(), d.min())
+        ax.grid()
+        lgd = ax.legend(frameon=False,loc=4,prop={'size':font+1}, bbox_to_anchor=(1.2,-0.02))
+        ax.set_xlabel('Depth [m]',size=font+2)
+        ax.set_ylabel('Population',size=font+2)
+        ax.set_ylim(0., int(self.pop.max())+1)
+        ax.set_xlim(d.max(), d.min())
 
         ttl = ax.title
         ttl.set_position([.5, 1.05])
-        plt.title('Evolution of communities population with depth',size=font+3)
-        plt.show()
+        ax.set_title('Evolution of communities population with depth',size=font+3)
 
         if fname is not None:
             name = self.folder+'/'+fname
             fig.savefig(name, bbox_extra_artists=(lgd,), bbox_inches='tight')
 
-        return
+        return self._show(fig)
+
+    def _decimate(self, d, bottom, pixel):
+        """
+        Merge the consecutive core layers lying in the same pixel row.
+
+        Parameters
+        ----------
+        variable : d
+            Depth of the top of each layer, from the bottom of the core.
+
+        float : bottom
+            Depth of the bottom of the core.
+
+        float : pixel
+            Pixel height in depth units.
+
+        Returns the bottom and top depths of the merged layers and the index of their
+        thickest layer.
+        """
+
+        rows = np.floor((bottom-d)/max(pixel, 1.e-12)).astype(int)
+        ends = np.append(np.flatnonzero(rows[1:] != rows[:-1]), len(d)-1)
+        tops = d[ends]
+        bases = np.append(bottom, tops[:-1])
+        thick = -np.ediff1d(d, to_begin=d[0]-bottom)
+        # Layers sorted by pixel row and thickness, the thickest is the last of each row
+        order = np.lexsort((thick, rows))
+
+        return bases, tops, order[ends]
 
     def drawCore(self, depthext = None, thext = None, propext = [0.,1.], tstep = 10, lwidth = 3,
                  colsed=None, coltime=None, size=(8,10), font=8, dpi=80, figname=None,
@@ -398,12 +486,17 @@ class modelPlot():
             Save gigure (the type of file needs to be provided e.g. .png or .pdf).
 
         variable : filename
-            Save model output to a CSV file.
+            Save model output to a CSV file (see coreExport).
 
         variable : sep
             Separator used in the CSV file.
+
+        Returns the core and environmental figures in headless mode.
         """
 
+        from matplotlib import gridspec
+        from matplotlib.collections import PolyCollection
+
         p1 = self.sedH[:,:-1]
         ids = np.where(self.depth[:-1]>0)[0]
         p2 = np.zeros((self.sedH.shape))
@@ -422,10 +515,14 @@ class modelPlot():
             depthext = [self.surf,bottom-self.depth[0]]
 
 
+        if colsed is None:
+            colsed = self._colors(len(self.sedH)+10)
+        if coltime is None:
+            coltime = self._colors(len(self.timeLay)+3, 'plasma')
         colsed[len(self.sedH)-1]=np.array([244./256.,164/256.,96/256.,1.])
 
         # Define figure size
-        fig = plt.figure(figsize=size, dpi=dpi)
+        fig = self._figure(size, dpi)
         gs = gridspec.GridSpec(1,21)
         ax1 = fig.add_subplot(gs[:5])
         ax2 = fig.add_subplot(gs[5:10], sharey=ax1)
@@ -438,13 +535,6 @@ class modelPlot():
         ax3.set_facecolor('#f2f2f3')
         ax4.set_facecolor('#f2f2f3')
         ax5.set_facecolor('#f2f2f3')
-        x = np.zeros(2)
-        y = np.zeros(2)
-        x[0] = 0.
-        x[1] = 1.
-        old = np.zeros(2)
-        old[0] = bottom
-        old[1] = bottom
 
         # Plotting curves
         for s in range(len(self.sedH)):
@@ -464,38 +554,37 @@ class modelPlot():
         ax42.yaxis.tick_right()
         ax52.plot(tmpx, d, zorder=1)
         ax52.yaxis.tick_right()
+
+        # Time layers and bio-facies, one collection of rectangles for all the layers, layers
+        # thinner than a pixel are merged and drawn with the color of the thickest one
+        pixel = abs(depthext[1]-depthext[0])/(size[1]*dpi)
+        bases, tops, ids = self._decimate(d, bottom, pixel)
+        layers = np.zeros((len(ids),4,2))
+        layers[:,1:3,0] = 1.
+        layers[:,:2,1] = bases[:,None]
+        layers[:,2:,1] = tops[:,None]
+        tcolors = np.asarray(coltime)[ids]
+        fcolors = np.asarray(colsed)[facies[ids]]
+        ax4.add_collection(PolyCollection(layers, facecolors=tcolors, edgecolors=tcolors,
+                                          zorder=10, rasterized=True))
+        ax5.add_collection(PolyCollection(layers, facecolors=fcolors, edgecolors=fcolors,
+                                          zorder=10, rasterized=True))
+        ax4.hlines(tops, 0., 1., colors='k', zorder=10, linewidth=0.25, rasterized=True)
+
+        # Time markers every tstep layers, only kept when the core is above the previous one
+        # by more than the height of their labels
+        spacing = font*dpi/72.*pixel
         ticks = []
         ttime = []
-        p = 0
-        for s in range(len(d)):
-            y[0] = d[s]
-            y[1] = d[s]
-            ax4.fill_between(x, old, y, color=coltime[s], zorder=10)
-            ax5.fill_between(x, old, y, color=colsed[facies[s]], zorder=10)
-            old[0] = y[0]
-            old[1] = y[1]
-            p += 1
-            ax4.plot(x,y,'k', zorder=10,linewidth=0.25)
-            if p == tstep:
-                # if len(ticks)>0:
-                #     print len(ticks),ticks[-1],y[1]
-                # ticks.append(y[1])
-                # ttime.append(int(self.timeLay[s+1]))
-                # ax4.plot(x,y,'k', zorder=10,linewidth=1)
-                # ax5.plot(x,y,'k', zorder=10,linewidth=1)
-                if len(ticks) > 0:
-                    if ticks[-1] > y[1]:
-                        ticks.append(y[1])
-                        ttime.append((self.timeLay[s+1]/1000.))
-                        ax4.plot(x,y,'#db20bf', zorder=10,linewidth=3)
-                        ax5.plot(x,y,'#db20bf', zorder=10,linewidth=3)
-                else:
-                    ticks.append(y[1])
-                    ttime.append((self.timeLay[s+1]/1000.))
-                    # ttime.append(int(self.timeLay[s+1]))
-                    ax4.plot(x,y,'#db20bf', zorder=10,linewidth=3)
-                    ax5.plot(x,y,'#db20bf', zorder=10,linewidth=3)
-                p = 0
+        for s in range(tstep-1, len(d), tstep):
+            if len(ticks) == 0 or ticks[-1] > d[s]+spacing:
+                ticks.append(d[s])
+                ttime.append((self.timeLay[s+1]/1000.))
+        if len(ticks) > 0:
+            ax4.hlines(ticks, 0., 1., colors='#db20bf', zorder=10, linewidth=3)
+            ax5.hlines(ticks, 0., 1., colors='#db20bf', zorder=10, linewidth=3)
+        ax4.autoscale_view()
+        ax5.autoscale_view()
 
         ax42.set_yticks(ticks)
         ax42.set_yticklabels(ttime, minor=False, fontsize=font, rotation=90, va='center')
@@ -560,10 +649,7 @@ class modelPlot():
         tt4.set_position([.5, 1.025])
         tt5.set_position([.5, 1.025])
         fig.tight_layout()
-        plt.tight_layout()
-        plt.figtext(1.01, 0.3, 'Two last cores axes \nleft: depth [m] \nright:time [ky]',horizontalalignment='left', fontsize=font+1)
-        plt.show()
-
+        fig.text(1.01, 0.3, 'Two last cores axes \nleft: depth [m] \nright:time [ky]',horizontalalignment='left', fontsize=font+1)
 
         if figname is not None:
             name = self.folder+'/'+figname
@@ -571,12 +657,12 @@ class modelPlot():
             print 'Figure has been saved in',name
 
         # Define figure size
-        fig = plt.figure(figsize=size, dpi=dpi)
+        fig2 = self._figure(size, dpi)
         gs = gridspec.GridSpec(1,12)
-        ax1 = fig.add_subplot(gs[:3])
-        ax2 = fig.add_subplot(gs[3:6], sharey=ax1)
-        ax3 = fig.add_subplot(gs[6:9], sharey=ax1)
-        ax4 = fig.add_subplot(gs[9:12], sharey=ax1)
+        ax1 = fig2.add_subplot(gs[:3])
+        ax2 = fig2.add_subplot(gs[3:6], sharey=ax1)
+        ax3 = fig2.add_subplot(gs[6:9], sharey=ax1)
+        ax4 = fig2.add_subplot(gs[9:12], sharey=ax1)
 
         ax1.plot(self.sealevel, self.timeLay, linewidth=lwidth, c='slateblue')
         ax2.plot(self.waterflow, self.timeLay, linewidth=lwidth, c='darkcyan')
@@ -610,43 +696,15 @@ class modelPlot():
         tt2.set_position([.5, 1.01])
         tt3.set_position([.5, 1.01])
         tt4.set_position([.5, 1.01])
-        fig.tight_layout()
-        plt.tight_layout()
-        plt.show()
+        fig2.tight_layout()
         if figname is not None:
             name = self.folder+'/envi'+figname
-            fig.savefig(name, bbox_extra_artists=(lgd,), bbox_inches='tight')
+            fig2.savefig(name, bbox_inches='tight')
             print 'Figure has been saved in','envi'+name
         print ''
 
         if filename is not None:
-            tmp = np.column_stack((d.T,p1.T))
-            tmp1 = np.column_stack((tmp,p2[:,:-1].T))
-            tmp2 = np.column_stack((tmp1,p3[:,:-1].T))
-            tmp3 = np.column_stack((tmp2,self.sealevel[:-1].T))
-            tmp4 = np.column_stack((tmp3,self.waterflow[:-1].T))
-            tmp5 = np.column_stack((tmp4,self.sedinput[:-1].T))
-            tmp6 = np.column_stack((tmp5,self.tecinput[:-1].T))
-            tmp7 = np.column_stack((tmp6,p6.T))
-
-            cols = []
-            cols.append('depth')
-            for s in range(len(self.names)):
-                cols.append('th_'+self.names[s])
-            for s in range(len(self.names)):
-                cols.append('prop_'+self.names[s])
-            for s in range(len(self.names)):
-                cols.append('acc_'+self.names[s])
-            cols.append('sealevel')
-            cols.append('waterflow')
-            cols.append('sedinput')
-            cols.append('tecrate')
-            cols.append('karstification')
-
-            df = pd.DataFrame(tmp7)
-            df.columns = cols
-            name = self.folder+'/'+filename
-            df.to_csv(name, sep=sep, encoding='utf-8', index=False)
+            name = coreExport.exportCore(self, self.folder+'/'+filename, 'csv', sep)
             print 'Model results have been saved in',name
 
-        return
+        return self._show((fig, fig2))
@@ -0,0 +1,575 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines the ODE solvers available to integrate the Generalized Lotka-Volterra
+equation. All solvers share the odespy calling convention: the right-hand side is called as
+f(X, t), the initial state is set with set_initial_condition and solve returns the solution
+for each requested time point. A solver object is meant to be reused: set_initial_condition
+re-arms it for a new integration and the last accepted step size is kept as a warm start.
+
+Available solvers are registered in the solvers dictionary:
+    + fehlberg: Runge-Kutta-Fehlberg from the odespy library (default),
+    + dopri: built-in Dormand-Prince RK45 stepper,
+    + scipy-RK45, scipy-LSODA and scipy-Radau: scipy.integrate.solve_ivp methods.
+"""
+import numpy
+
+class odeSolver(object):
+    """
+    Base class for the ODE solvers used by coralGLV.
+
+    Parameters
+    ----------
+    function : f
+        Right-hand side of the ODE system f(X, t).
+
+    function : jac
+        Jacobian of the right-hand side jac(X, t), only used by implicit solvers.
+
+    float : rtol
+        Relative tolerance for the solution.
+
+    float : atol
+        Absolute tolerance for the solution.
+
+    float : min_step
+        Minimum step size for adaptive algorithms.
+    """
+
+    name = None
+
+    def __init__(self, f, jac=None, rtol=1.e-6, atol=1.e-6, min_step=1.e-4):
+
+        self.f = f
+        self.jac = jac
+        self.rtol = rtol
+        self.atol = atol
+        self.min_step = min_step
+        self.U0 = None
+        # Last accepted step size, used as first step of the next call to solve
+        self.h = None
+        # Number of right-hand side evaluations
+        self.nfev = 0
+        # Number of accepted and rejected steps, None when the solver does not report them
+        self.naccept = None
+        self.nreject = None
+
+        return
+
+    def set_initial_condition(self, U0):
+        """
+        Define the initial state of the ODE system.
+
+        Parameters
+        ----------
+        variable : U0
+            Species population distribution at initial time.
+        """
+
+        self.U0 = numpy.array(U0, dtype=float)
+
+        return
+
+    def solve(self, time_points):
+        """
+        Integrate the ODE system and return the solution at the given time points.
+
+        Parameters
+        ----------
+        variable : time_points
+            Increasing time values, the first one corresponds to the initial condition.
+        """
+
+        raise NotImplementedError
+
+    def advance(self, t0, tEnd, dense=None):
+        """
+        Integrate the ODE system from t0 to tEnd with adaptive internal steps and return
+        the final state. Intermediate states are only computed when requested.
+
+        Parameters
+        ----------
+        float : t0
+            Initial time.
+
+        float : tEnd
+            Final time.
+
+        variable : dense
+            Optional increasing times within ]t0,tEnd[ for which the solution is returned
+            as a second array, None otherwise.
+        """
+
+        if dense is None:
+            u, t = self.solve([t0, tEnd])
+            return u[-1], None
+
+        u, t = self.solve(numpy.concatenate(([t0], dense, [tEnd])))
+
+        return u[-1], u[1:-1]
+
+    def idle(self, t0, tEnd):
+        """
+        Advance a null state from t0 to tEnd without integrating it, the state stays null.
+        Adaptive solvers which keep their step size between calls update it as the
+        integration would, the base class keeps it unchanged.
+
+        Parameters
+        ----------
+        float : t0
+            Initial time.
+
+        float : tEnd
+            Final time.
+        """
+
+        return
+
+
+class fehlbergSolver(odeSolver):
+    """
+    Runge-Kutta-Fehlberg solver (RKF45) from the odespy library. The odespy object is
+    reused between calls but odespy does not expose its step size for a warm start, nor its
+    numbers of accepted and rejected steps: only the right-hand side evaluations are counted.
+    """
+
+    name = 'fehlberg'
+
+    def __init__(self, f, jac=None, rtol=1.e-6, atol=1.e-6, min_step=1.e-4):
+
+        super(fehlbergSolver, self).__init__(f, jac, rtol, atol, min_step)
+
+        import odespy
+        self.odeRKF = odespy.Fehlberg(self._countedf, atol=self.atol,
+                                        rtol=self.rtol, min_step=self.min_step)
+
+        return
+
+    def _countedf(self, X, t):
+
+        self.nfev += 1
+
+        return self.f(X, t)
+
+    def set_initial_condition(self, U0):
+
+        self.odeRKF.set_initial_condition(U0)
+
+        return
+
+    def solve(self, time_points):
+
+        return self.odeRKF.solve(time_points)
+
+
+class scipySolver(odeSolver):
+    """
+    Wrapper around the scipy.integrate solve_ivp methods.
+
+    The scipy solver classes are stepped directly so that the last accepted step size
+    can be used as first step for the next call to solve. The scipy solvers retry rejected
+    steps internally and do not report them, only accepted steps are counted.
+    """
+
+    method = None
+    withJac = False
+
+    def __init__(self, f, jac=None, rtol=1.e-6, atol=1.e-6, min_step=1.e-4):
+
+        super(scipySolver, self).__init__(f, jac, rtol, atol, min_step)
+        self.naccept = 0
+
+        from scipy import integrate
+        self._method = getattr(integrate, self.method)
+
+        return
+
+    def _fun(self, t, X):
+
+        # The right-hand side may return a reused buffer, scipy keeps the stages
+        return numpy.array(self.f(X, t))
+
+    def _jac(self, t, X):
+
+        return numpy.array(self.jac(X, t))
+
+    def solve(self, time_points):
+
+        time_points = numpy.asarray(time_points, dtype=float)
+        t0 = time_points[0]
+        tEnd = time_points[-1]
+        options = {}
+        if self.withJac and self.jac is not None:
+            options['jac'] = self._jac
+        if self.method == 'LSODA':
+            options['min_step'] = self.min_step
+        if self.h is not None:
+            options['first_step'] = min(self.h, tEnd-t0)
+
+        solver = self._method(self._fun, t0, self.U0, tEnd, rtol=self.rtol,
+                              atol=self.atol, **options)
+        u = numpy.zeros((len(time_points),len(self.U0)))
+        u[0] = self.U0
+        k = 1
+        while solver.status == 'running':
+            message = solver.step()
+            if solver.status == 'failed':
+                raise RuntimeError('ODE solver %s failed: %s'%(self.name, message))
+            self.naccept += 1
+            if k < len(time_points) and time_points[k] <= solver.t:
+                sol = solver.dense_output()
+                while k < len(time_points) and time_points[k] < solver.t:
+                    u[k] = sol(time_points[k])
+                    k += 1
+                if k < len(time_points) and time_points[k] == solver.t:
+                    u[k] = solver.y
+                    k += 1
+        u[k:] = solver.y
+
+        self.nfev += solver.nfev
+        if getattr(solver, 'h_abs', None) is not None:
+            self.h = solver.h_abs
+        elif solver.step_size is not None:
+            self.h = solver.step_size
+
+        return u, time_points
+
+
+class scipyRK45Solver(scipySolver):
+    """
+    Explicit Runge-Kutta method of order 5(4) from scipy.
+    """
+
+    name = 'scipy-RK45'
+    method = 'RK45'
+
+
+class scipyLSODASolver(scipySolver):
+    """
+    LSODA method from scipy with automatic stiffness detection.
+    """
+
+    name = 'scipy-LSODA'
+    method = 'LSODA'
+    withJac = True
+
+
+class scipyRadauSolver(scipySolver):
+    """
+    Implicit Runge-Kutta method of the Radau IIA family of order 5 from scipy.
+    """
+
+    name = 'scipy-Radau'
+    method = 'Radau'
+    withJac = True
+
+
+class dopriSolver(odeSolver):
+    """
+    Built-in Dormand-Prince RK45 stepper with adaptive time step.
+
+    Stage and work arrays are allocated once and reused for every step and every call
+    to solve.
+    """
+
+    name = 'dopri'
+
+    # Dormand-Prince Butcher tableau
+    C = numpy.array([0., 1./5., 3./10., 4./5., 8./9., 1., 1.])
+    A = numpy.array([
+        [0., 0., 0., 0., 0., 0.],
+        [1./5., 0., 0., 0., 0., 0.],
+        [3./40., 9./40., 0., 0., 0., 0.],
+        [44./45., -56./15., 32./9., 0., 0., 0.],
+        [19372./6561., -25360./2187., 64448./6561., -212./729., 0., 0.],
+        [9017./3168., -355./33., 46732./5247., 49./176., -5103./18656., 0.],
+        [35./384., 0., 500./1113., 125./192., -2187./6784., 11./84.]])
+    # Difference between the 5th and 4th order solutions
+    E = numpy.array([71./57600., 0., -71./16695., 71./1920., -17253./339200.,
+                     22./525., -1./40.])
+
+    safety = 0.9
+    minFactor = 0.2
+    maxFactor = 10.
+
+    def __init__(self, f, jac=None, rtol=1.e-6, atol=1.e-6, min_step=1.e-4):
+
+        super(dopriSolver, self).__init__(f, jac, rtol, atol, min_step)
+        self.naccept = 0
+        self.nreject = 0
+
+        self.neq = 0
+        self.K = None
+        self._fsal = False
+
+        return
+
+    def _allocate(self, neq):
+
+        self.neq = neq
+        self.y = numpy.zeros(neq)
+        self.ynew = numpy.zeros(neq)
+        self.yerr = numpy.zeros(neq)
+        self.scale = numpy.zeros(neq)
+        self.yold = numpy.zeros(neq)
+        self.K = numpy.zeros((7,neq))
+
+        return
+
+    def set_initial_condition(self, U0):
+
+        U0 = numpy.asarray(U0, dtype=float)
+        if self.K is None or len(U0) != self.neq:
+            self._allocate(len(U0))
+        self.y[:] = U0
+        self._fsal = False
+
+        return
+
+    def _norm(self, x):
+
+        return numpy.sqrt(numpy.dot(x, x)/self.neq)
+
+    def _initial_step(self, t, tEnd):
+        """
+        Starting step size estimation from Hairer, Norsett & Wanner (1993), II.4.
+        """
+
+        numpy.abs(self.y, out=self.scale)
+        self.scale *= self.rtol
+        self.scale += self.atol
+        numpy.divide(self.y, self.scale, out=self.yerr)
+        d0 = self._norm(self.yerr)
+        numpy.divide(self.K[0], self.scale, out=self.yerr)
+        d1 = self._norm(self.yerr)
+        if d0 < 1.e-5 or d1 < 1.e-5:
+            h0 = 1.e-6
+        else:
+            h0 = 0.01*d0/d1
+        h0 = min(h0, tEnd-t)
+
+        numpy.multiply(self.K[0], h0, out=self.ynew)
+        self.ynew += self.y
+        self.K[1][:] = self.f(self.ynew, t+h0)
+        self.nfev += 1
+        numpy.subtract(self.K[1], self.K[0], out=self.yerr)
+        self.yerr /= self.scale
+        d2 = self._norm(self.yerr)/h0
+        if max(d1, d2) <= 1.e-15:
+            h1 = max(1.e-6, h0*1.e-3)
+        else:
+            h1 = (0.01/max(d1, d2))**(1./5.)
+
+        return max(min(100.*h0, h1), self.min_step)
+
+    def _advance(self, t, tEnd, dense=None, out=None):
+        """
+        Integrate the ODE system from t to tEnd, the state is updated in place.
+
+        When dense is given, the solution at these increasing times within ]t,tEnd] is
+        interpolated on the accepted steps and written in out.
+        """
+
+        K = self.K
+        if not self._fsal:
+            K[0][:] = self.f(self.y, t)
+            self.nfev += 1
+            self._fsal = True
+        if self.h is None:
+            self.h = self._initial_step(t, tEnd)
+
+        h = self.h
+        k = 0
+        while t < tEnd:
+            last = h >= tEnd-t
+            if last:
+                hstep = tEnd-t
+            else:
+                hstep = h
+            # Runge-Kutta stages
+            for s in range(1,7):
+                numpy.dot(self.A[s,:s], K[:s], out=self.ynew)
+                self.ynew *= hstep
+                self.ynew += self.y
+                K[s][:] = self.f(self.ynew, t+self.C[s]*hstep)
+                self.nfev += 1
+
+            # Local error estimate
+            numpy.dot(self.E, K, out=self.yerr)
+            self.yerr *= hstep
+            numpy.abs(self.y, out=self.scale)
+            numpy.abs(self.ynew, out=self.yold)
+            numpy.maximum(self.scale, self.yold, out=self.scale)
+            self.scale *= self.rtol
+            self.scale += self.atol
+            self.yerr /= self.scale
+            err = self._norm(self.yerr)
+
+            if err <= 1. or hstep <= self.min_step:
+                # Step accepted (first same as last)
+                self.naccept += 1
+                told = t
+                if last:
+                    t = tEnd
+                else:
+                    t += hstep
+                self.yold[:] = self.y
+                self.y[:] = self.ynew
+                if dense is not None:
+                    while k < len(dense) and dense[k] <= t:
+                        self._interpolate((dense[k]-told)/hstep, hstep, out[k])
+                        k += 1
+                K[0][:] = K[6]
+                # Keep the proposed step when it was truncated to reach tEnd
+                if not last or hstep == h:
+                    if err == 0.:
+                        factor = self.maxFactor
+                    else:
+                        factor = min(self.maxFactor, self.safety*err**(-1./5.))
+                    h = max(hstep*factor, self.min_step)
+            else:
+                self.nreject += 1
+                factor = max(self.minFactor, self.safety*err**(-1./5.))
+                h = max(hstep*factor, self.min_step)
+
+        self.h = h
+
+        return
+
+    def idle(self, t0, tEnd):
+
+        self.h = nullStepSize(self.h, t0, tEnd, self.min_step)
+
+        return
+
+    def _interpolate(self, theta, h, out):
+        """
+        Cubic Hermite interpolation on the last accepted step, based on the states and
+        derivatives at both ends of the step.
+        """
+
+        theta2 = theta*theta
+        theta3 = theta2*theta
+        numpy.multiply(self.yold, 2.*theta3-3.*theta2+1., out=out)
+        out += (theta3-2.*theta2+theta)*h*self.K[0]
+        out += (-2.*theta3+3.*theta2)*self.y
+        out += (theta3-theta2)*h*self.K[6]
+
+        return
+
+    def advance(self, t0, tEnd, dense=None):
+
+        if dense is None:
+            self._advance(t0, tEnd)
+            return self.y.copy(), None
+
+        dense = numpy.asarray(dense, dtype=float)
+        out = numpy.zeros((len(dense),self.neq))
+        self._advance(t0, tEnd, dense, out)
+
+        return self.y.copy(), out
+
+    def solve(self, time_points):
+
+        time_points = numpy.asarray(time_points, dtype=float)
+        u = numpy.zeros((len(time_points),self.neq))
+        u[0] = self.y
+        for k in range(1,len(time_points)):
+            self._advance(time_points[k-1], time_points[k])
+            u[k] = self.y
+
+        return u, time_points
+
+def nullStepSize(h, t, tEnd, min_step):
+    """
+    Step size of the Dormand-Prince integration (see dopriSolver) after advancing a null
+    state from t to tEnd. The right-hand side and the error estimate of a null state are
+    null, all the steps are accepted and the step size grows by maxFactor.
+
+    Parameters
+    ----------
+    float : h
+        Step size at t, estimated as for a null state when None or not positive.
+
+    float : t, tEnd
+        Integration interval.
+
+    float : min_step
+        Minimum step size.
+    """
+
+    if h is None or h <= 0.:
+        # Starting step size of a null state (see dopriSolver._initial_step)
+        h0 = min(1.e-6, tEnd-t)
+        h = max(min(100.*h0, max(1.e-6, h0*1.e-3)), min_step)
+
+    while t < tEnd:
+        last = h >= tEnd-t
+        if last:
+            hstep = tEnd-t
+            t = tEnd
+        else:
+            hstep = h
+            t += hstep
+        if not last or hstep == h:
+            h = max(hstep*dopriSolver.maxFactor, min_step)
+
+    return h
+
+# Registry of the available ODE solvers
+solvers = {}
+
+def register(solver):
+    """
+    Register an ODE solver class under its name.
+
+    Parameters
+    ----------
+    class : solver
+        Class deriving from odeSolver.
+    """
+
+    solvers[solver.name] = solver
+
+    return solver
+
+def create(name, f, jac=None, rtol=1.e-6, atol=1.e-6, min_step=1.e-4):
+    """
+    Build the ODE solver registered under the given name.
+
+    Parameters
+    ----------
+    string : name
+        Name of the ODE solver.
+
+    function : f
+        Right-hand side of the ODE system f(X, t).
+
+    function : jac
+        Jacobian of the right-hand side jac(X, t).
+
+    float : rtol
+        Relative tolerance for the solution.
+
+    float : atol
+        Absolute tolerance for the solution.
+
+    float : min_step
+        Minimum step size for adaptive algorithms.
+    """
+
+    if name not in solvers:
+        raise ValueError('Unknown ODE solver %s, available solvers are: %s'
+                         %(name, ', '.join(sorted(solvers.keys()))))
+
+    return solvers[name](f, jac=jac, rtol=rtol, atol=atol, min_step=min_step)
+
+for _solver in [fehlbergSolver, dopriSolver, scipyRK45Solver, scipyLSODASolver,
+                scipyRadauSolver]:
+    register(_solver)
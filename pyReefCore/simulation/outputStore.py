@@ -0,0 +1,165 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module stores the population and core records of a simulation on disk instead of
+keeping them in memory. Each record is a memory-mapped .npy file of the output folder which
+is filled as the simulation advances and read lazily by the plotting and export functions.
+"""
+import os
+import json
+import numpy
+
+# Records of the coral object, one column per carbonate step
+CORAL_RECORDS = ['population', 'accspace', 'mbsl']
+
+# Records of the core object, one column per stratigraphic layer
+CORE_RECORDS = ['thickness', 'coralH', 'karstero', 'sealevel', 'sedinput', 'tecrate',
+                'waterflow', 'nutrient', 'temperature', 'pH']
+
+# Core records re-read by the karstification which are always kept in double precision
+STATE_RECORDS = ['thickness', 'coralH', 'karstero']
+
+class outputStore:
+    """
+    This class maps the coral and core records on .npy files of an output folder.
+
+    The records are appended step by step by Model.run_to_time through the usual coral and
+    core arrays. Every chunk carbonate steps the written pages are flushed to disk and the
+    files are mapped again so that the resident memory does not grow with the simulation
+    length.
+    """
+
+    def __init__(self, folder, precision='float64', chunk=1000):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        string : folder
+            Folder of the record files, created if needed.
+
+        string : precision
+            Data type of the records (float64 or float32), the karstified core records
+            (thickness, coralH, karstero) are always stored in double precision.
+
+        int : chunk
+            Number of carbonate steps between two flushes of the records.
+        """
+
+        if numpy.dtype(precision) not in (numpy.float32, numpy.float64):
+            raise ValueError('Records precision should be float32 or float64')
+        self.folder = folder
+        self.precision = numpy.dtype(precision).name
+        self.chunk = max(int(chunk), 1)
+        self.coral = None
+        self.core = None
+        self._maps = {}
+        self.steps = 0
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        return
+
+    def _path(self, name):
+
+        return os.path.join(self.folder, name+'.npy')
+
+    def attach(self, coral, core):
+        """
+        Create the record files from the current coral and core records and replace these
+        records by views of their memory maps.
+
+        Parameters
+        ----------
+        object : coral
+            coralGLV object of the simulation.
+
+        object : core
+            coreData object of the simulation.
+        """
+
+        self.coral = coral
+        self.core = core
+        for obj, names in ((coral, CORAL_RECORDS), (core, CORE_RECORDS)):
+            for name in names:
+                dtype = self.precision
+                if name in STATE_RECORDS:
+                    dtype = 'float64'
+                data = getattr(obj, name)
+                record = numpy.lib.format.open_memmap(self._path(name), mode='w+',
+                                                      dtype=dtype, shape=data.shape)
+                record[:] = data
+                self._set(obj, name, record)
+        self.flush()
+
+        return
+
+    def _set(self, obj, name, record):
+        """
+        Replace a record by a plain array view of its memory map, indexing a memmap object
+        in the simulation loop is much slower than indexing an array.
+        """
+
+        self._maps[name] = record
+        setattr(obj, name, record.view(numpy.ndarray))
+
+        return
+
+    def _remap(self):
+        """
+        Map again the record files, dropping the pages held by the previous maps.
+        """
+
+        for obj, names in ((self.coral, CORAL_RECORDS), (self.core, CORE_RECORDS)):
+            for name in names:
+                self._set(obj, name, numpy.load(self._path(name), mmap_mode='r+'))
+
+        return
+
+    def step(self, count=1):
+        """
+        Record the end of carbonate steps, the records are flushed every chunk steps.
+
+        Parameters
+        ----------
+        int : count
+            Number of carbonate steps.
+        """
+
+        self.steps += count
+        if self.steps//self.chunk > (self.steps-count)//self.chunk:
+            self.flush()
+            self._remap()
+
+        return
+
+    def flush(self):
+        """
+        Write the records to disk with a description of the store.
+        """
+
+        for record in self._maps.values():
+            record.flush()
+        with open(os.path.join(self.folder, 'records.json'), 'w') as f:
+            json.dump({'precision': self.precision, 'steps': self.steps,
+                       'records': CORAL_RECORDS+CORE_RECORDS}, f, indent=1)
+
+        return
+
+    def read(self, name):
+        """
+        Read only memory map of a record.
+
+        Parameters
+        ----------
+        string : name
+            Record name (e.g. population, coralH, sealevel).
+        """
+
+        return numpy.load(self._path(name), mmap_mode='r')
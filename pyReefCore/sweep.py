@@ -0,0 +1,629 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   pyReefCore parameter sweep: runs many independent simulations over a local process pool.
+
+   Each job loads the XmL template with its own set of input parameters and its own seed,
+   runs the model and sends back the requested records which are appended, as soon as they
+   are received, to a columnar result store on disk (one file per column).
+
+   Scenarios sharing the beginning of a simulation can instead be branched from a running
+   model with the ForkRunner.
+
+   Both runners can render the figures of each simulation in their worker processes with
+   the headless plotting functions (see modelPlot).
+"""
+import os
+import sys
+import json
+import itertools
+import traceback
+import multiprocessing
+import numpy as np
+
+from pyReefCore.model import Model
+from pyReefCore.timing import aggregateReports
+from pyReefCore.simulation.coreExport import FORMATS
+
+# Records returned by default for each job
+RECORDS = ('core.topH', 'core.thickness', 'core.coralH', 'coral.accspace')
+
+# Fields of the summary record (see Model.summary) with the same shape for all the jobs, the
+# facies sequence has a different length in each simulation and cannot be recorded
+SUMMARY = ('thickness', 'totals', 'eroded', 'years', 'rate')
+
+def _checkRecords(records):
+    """
+    Check the summary fields requested as records.
+    """
+
+    records = list(records)
+    for path in records:
+        if path.startswith('summary.') and path[8:] not in SUMMARY:
+            raise ValueError('Summary field %s cannot be recorded, use one of %s.'
+                             %(path[8:], ', '.join(SUMMARY)))
+
+    return records
+
+def gridDesign(**axes):
+    """
+    Full factorial design: every combination of the given parameter values.
+
+    Parameters
+    ----------
+    axes :
+        Parameter names (e.g. depth0 or malthusParam[0]) and their list of values.
+    """
+
+    names = sorted(axes.keys())
+
+    return [dict(zip(names, values)) for values in itertools.product(*[axes[n] for n in names])]
+
+def latinHypercube(samples, seed=0, **bounds):
+    """
+    Latin hypercube design: each parameter range is divided into as many intervals as
+    samples and each interval is sampled exactly once.
+
+    Parameters
+    ----------
+    int : samples
+        Number of parameter sets.
+
+    int : seed
+        Seed of the random number generator used to build the design.
+
+    bounds :
+        Parameter names (e.g. depth0 or malthusParam[0]) and their (min, max) range.
+    """
+
+    rng = np.random.RandomState(seed)
+    names = sorted(bounds.keys())
+    design = [{} for k in range(samples)]
+    for name in names:
+        low, high = bounds[name]
+        values = (rng.permutation(samples)+rng.uniform(size=samples))/float(samples)
+        values = low+values*(high-low)
+        for k in range(samples):
+            design[k][name] = values[k]
+
+    return design
+
+class ResultStore(object):
+    """
+    Columnar store of the sweep results. Each column is a raw binary file in which the rows
+    are appended in the order they are received, the data type and row shape of the columns
+    are described in the columns.json file. The job column gives the design index of each row.
+
+    Parameters
+    ----------
+    string : folder
+        Folder of the store.
+
+    string : mode
+        'w' to create a new store, 'r' to read an existing one.
+    """
+
+    def __init__(self, folder, mode='r'):
+
+        self.folder = folder
+        self.mode = mode
+        self.columns = {}
+        self._files = {}
+        self.nrows = 0
+        if mode == 'w':
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+        else:
+            with open(os.path.join(folder, 'columns.json')) as f:
+                meta = json.load(f)
+            self.columns = dict((k, (str(v[0]), tuple(v[1]))) for k, v in meta['columns'].items())
+            self.nrows = meta['nrows']
+            # Complete rows written after the last flush of an interrupted sweep
+            rows = []
+            for name, (dtype, shape) in self.columns.items():
+                size = np.dtype(dtype).itemsize*int(np.prod(shape))
+                fname = os.path.join(folder, name+'.bin')
+                if size > 0 and os.path.exists(fname):
+                    rows.append(os.path.getsize(fname)//size)
+            if len(rows) > 0:
+                self.nrows = max(self.nrows, min(rows))
+
+        return
+
+    def append(self, row):
+        """
+        Append one row to the store. The columns are defined by the first row, the following
+        rows should have the same columns and row shapes. A row is checked before any column
+        is written so that a rejected row leaves the store unchanged.
+
+        Parameters
+        ----------
+        dict : row
+            Column names and values.
+        """
+
+        row = dict((name, np.asarray(value)) for name, value in row.items())
+        if self.nrows == 0 and len(self.columns) == 0:
+            for name, value in row.items():
+                self.columns[name] = (value.dtype.str, value.shape)
+                self._files[name] = open(os.path.join(self.folder, name+'.bin'), 'wb')
+            self._writeColumns()
+        elif set(row) != set(self.columns):
+            missing = sorted(set(self.columns)-set(row))
+            extra = sorted(set(row)-set(self.columns))
+            raise ValueError('Row columns do not match the store: missing %s, undefined %s'
+                             %(missing, extra))
+        for name, value in row.items():
+            shape = self.columns[name][1]
+            if value.shape != shape:
+                raise ValueError('Wrong shape %s for column %s, expected %s'
+                                 %(value.shape, name, shape))
+        for name, value in row.items():
+            self._files[name].write(value.astype(self.columns[name][0]).tostring())
+        self.nrows += 1
+
+        return
+
+    def _writeColumns(self):
+        """
+        Write the columns description file.
+        """
+
+        with open(os.path.join(self.folder, 'columns.json'), 'w') as f:
+            json.dump({'nrows': self.nrows, 'columns': self.columns}, f, indent=1)
+
+        return
+
+    def flush(self):
+        """
+        Write buffered rows and the columns description to disk.
+        """
+
+        for f in self._files.values():
+            f.flush()
+        self._writeColumns()
+
+        return
+
+    def close(self):
+
+        if self.mode == 'w':
+            self.flush()
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+        return
+
+    def read(self, name, sort=True, mmap=False):
+        """
+        Read a column as an array of shape (rows,) + row shape.
+
+        Parameters
+        ----------
+        string : name
+            Column name.
+
+        bool : sort
+            If True, rows are sorted by job index instead of completion order.
+
+        bool : mmap
+            If True, the column is memory-mapped instead of loaded in memory.
+        """
+
+        dtype, shape = self.columns[name]
+        fname = os.path.join(self.folder, name+'.bin')
+        if mmap:
+            data = np.memmap(fname, dtype=dtype, mode='r', shape=(self.nrows,)+shape)
+        else:
+            data = np.fromfile(fname, dtype=dtype, count=self.nrows*int(np.prod(shape)))
+            data = data.reshape((self.nrows,)+shape)
+        if sort:
+            job = np.fromfile(os.path.join(self.folder, 'job.bin'), dtype=self.columns['job'][0],
+                              count=self.nrows)
+            data = data[np.argsort(job)]
+
+        return data
+
+# Sweep configuration of the worker processes, set by the pool initializer
+_config = None
+
+def _initWorker(config):
+
+    global _config
+    _config = config
+
+    return
+
+def _runJob(job):
+    """
+    Run one simulation of the sweep in a worker process and return its records.
+    """
+
+    index, params, seed = job
+    try:
+        model = Model(solver=_config['solver'])
+        model.load_xml(_config['xmlfile'], params=params, makedir=False, seed=seed)
+        if _config['checkpoint'] is not None:
+            model.load_checkpoint(_config['checkpoint'])
+        tEnd = _config['tEnd']
+        if tEnd is None:
+            tEnd = model.input.tEnd
+        model.run_to_time(tEnd, showtime=tEnd-model.tNow+1., timing=_config['timing'],
+                          fastforward=_config['fastforward'], stop=_config['stop'])
+        records = _records(model, _config['records'])
+        if _config['figures'] is not None:
+            _render(model, _config['figures'], _config['figdir'], index)
+        if _config['export'] is not None:
+            model.export(os.path.join(_config['exportdir'], 'job%06d%s'
+                                      %(index, FORMATS[_config['export']])), _config['export'])
+        if _config['timing']:
+            records.update(_timings(model.timer.report()))
+    except Exception:
+        return index, seed, None, traceback.format_exc()
+
+    return index, seed, records, None
+
+def _records(model, paths):
+    """
+    Read the requested attributes (e.g. core.thickness) of a model, or the fields of its
+    summary record (e.g. summary.totals, see Model.summary).
+    """
+
+    records = {}
+    summary = None
+    for path in paths:
+        if path.startswith('summary.'):
+            if summary is None:
+                summary = model.summary()
+            records[path] = np.asarray(summary[path[8:]])
+            continue
+        obj = model
+        for attr in path.split('.'):
+            obj = getattr(obj, attr)
+        records[path] = np.asarray(obj)
+
+    return records
+
+def _render(model, figures, folder, index):
+    """
+    Render the figures of a simulation in headless mode, the files are saved in a folder
+    named after the job index (e.g. figures/job000012/core.png).
+    """
+
+    model.plot.headless = True
+    model.plot.folder = os.path.join(folder, 'job%06d' %index)
+    if not os.path.exists(model.plot.folder):
+        os.makedirs(model.plot.folder)
+    for method, kwargs in figures.items():
+        getattr(model.plot, method)(**kwargs)
+
+    return
+
+def _timings(report):
+    """
+    Numerical fields of a timing report as records (e.g. timing.wall, timing.phases.solve).
+    """
+
+    records = {}
+    for name, value in report.items():
+        if isinstance(value, dict):
+            for phase, wall in value.items():
+                records['timing.%s.%s' %(name, phase)] = np.asarray(wall)
+        elif isinstance(value, (int, float)):
+            records['timing.'+name] = np.asarray(value)
+
+    return records
+
+def _report(records):
+    """
+    Timing report of a job from its records.
+    """
+
+    report = {'phases': {}}
+    for name, value in records.items():
+        if not name.startswith('timing.'):
+            continue
+        keys = name.split('.')[1:]
+        if len(keys) == 2:
+            report[keys[0]][keys[1]] = value.item()
+        else:
+            report[keys[0]] = value.item()
+
+    return report
+
+class SweepRunner(object):
+    """
+    Parameter sweep over a local process pool. Jobs are scheduled by chunks on the pool
+    workers and their records are streamed to a ResultStore as they complete.
+
+    Parameters
+    ----------
+    string : xmlfile
+        XmL input file used as template for all jobs.
+
+    string : outdir
+        Folder of the result store.
+
+    int : processes
+        Number of worker processes, all the available cores when None.
+
+    int : chunksize
+        Number of jobs sent at once to a worker, computed from the design size when None.
+
+    int : seed
+        Base seed from which the seed of each job is drawn.
+
+    string : solver
+        ODE solver name overriding the one of the XmL input file.
+
+    float : tEnd
+        Simulation end time, the one of the XmL input file when None.
+
+    list : records
+        Model attributes returned by each job (e.g. core.thickness, coral.population) or
+        fields of its summary record (summary.thickness, summary.totals, summary.eroded,
+        summary.years or summary.rate, see Model.summary). The facies sequence has a
+        different length in each job and cannot be recorded.
+
+    string : checkpoint
+        Checkpoint file (see Model.save_checkpoint) from which all jobs are resumed instead
+        of starting at the beginning of the simulation.
+
+    bool : timing
+        If True, the timing report of each job (see timing.RunTimer) is added to its records
+        (timing.wall, timing.phases.solve...) and the sum over all jobs is saved in the
+        timing.json file of the result store.
+
+    dict : figures
+        Plotting functions of modelPlot (e.g. drawCore) and their arguments, rendered by the
+        workers after each job in headless mode. The files of each job are saved in its own
+        folder of the figures folder of the result store (e.g. figures/job000012).
+
+    string : export
+        Format (npz, parquet, feather or csv) of the core columns exported by the workers
+        after each job (see Model.export) in the cores folder of the result store (e.g.
+        cores/job000012.npz).
+
+    bool : fastforward
+        If True, phases of null populations are advanced at once (see Model.run_to_time).
+
+    list : stop
+        Stop conditions of the runs (see events), they are sent to the workers and should
+        be picklable (e.g. events.CoreRemoved()).
+    """
+
+    def __init__(self, xmlfile, outdir, processes=None, chunksize=None, seed=0, solver=None,
+                 tEnd=None, records=RECORDS, checkpoint=None, timing=False, figures=None,
+                 export=None, fastforward=False, stop=None):
+
+        self.xmlfile = os.path.abspath(xmlfile)
+        self.outdir = outdir
+        self.processes = processes
+        if self.processes is None:
+            self.processes = multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.seed = seed
+        self.solver = solver
+        self.tEnd = tEnd
+        self.records = _checkRecords(records)
+        self.checkpoint = checkpoint
+        if self.checkpoint is not None:
+            self.checkpoint = os.path.abspath(checkpoint)
+        self.timing = timing
+        self.figures = figures
+        if export is not None and export not in FORMATS:
+            raise ValueError('Unknown export format %s, use one of %s.'
+                             %(export, ', '.join(sorted(FORMATS))))
+        self.export = export
+        self.fastforward = fastforward
+        self.stop = stop
+        self.failures = []
+        self.report = None
+
+        return
+
+    def seeds(self, njobs):
+        """
+        Deterministic seed of each job, independent of the scheduling order.
+        """
+
+        return np.random.RandomState(self.seed).randint(0, 0x7FFFFFFF, size=njobs)
+
+    def run(self, design, verbose=True):
+        """
+        Run all the jobs of a design and return the result store.
+
+        Parameters
+        ----------
+        list : design
+            Parameter sets, each one being a dictionary of input parameters to override
+            (see gridDesign and latinHypercube).
+        """
+
+        design = list(design)
+        njobs = len(design)
+        seeds = self.seeds(njobs)
+        chunksize = self.chunksize
+        if chunksize is None:
+            chunksize = max(1, njobs//(4*self.processes))
+
+        config = {'xmlfile': self.xmlfile, 'solver': self.solver, 'tEnd': self.tEnd,
+                  'records': self.records, 'checkpoint': self.checkpoint,
+                  'timing': self.timing, 'figures': self.figures,
+                  'figdir': os.path.abspath(os.path.join(self.outdir, 'figures')),
+                  'export': self.export, 'fastforward': self.fastforward, 'stop': self.stop,
+                  'exportdir': os.path.abspath(os.path.join(self.outdir, 'cores'))}
+        jobs = ((k, design[k], int(seeds[k])) for k in range(njobs))
+
+        store = ResultStore(self.outdir, mode='w')
+        if self.figures is not None and not os.path.exists(config['figdir']):
+            os.makedirs(config['figdir'])
+        if self.export is not None and not os.path.exists(config['exportdir']):
+            os.makedirs(config['exportdir'])
+        self.failures = []
+        reports = []
+        done = 0
+        pool = multiprocessing.Pool(self.processes, initializer=_initWorker, initargs=(config,))
+        try:
+            for index, seed, records, error in pool.imap_unordered(_runJob, jobs, chunksize):
+                done += 1
+                if error is not None:
+                    self.failures.append((index, error))
+                    print >> sys.stderr, 'Job %d failed:\n%s' %(index, error)
+                    continue
+                row = {'job': np.int64(index), 'seed': np.int64(seed)}
+                for name, value in design[index].items():
+                    value = np.asarray(value)
+                    if value.dtype.kind in 'SU':
+                        value = value.astype('S256')
+                    row[name] = value
+                row.update(records)
+                store.append(row)
+                if self.timing:
+                    reports.append(_report(records))
+                if verbose:
+                    print 'Sweep: %d/%d jobs done' %(done, njobs)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            store.close()
+
+        if self.timing:
+            self.report = aggregateReports(reports)
+            with open(os.path.join(self.outdir, 'timing.json'), 'w') as f:
+                json.dump(self.report, f, indent=1, sort_keys=True)
+
+        return store
+
+# Parent model of the fork runner, inherited by the forked worker processes
+_parent = None
+
+def _runBranch(job):
+    """
+    Fork the parent model in a worker process, run the branch and return its records.
+    """
+
+    index, params, tEnd, paths, figures, figdir, fastforward, stop = job
+    try:
+        model = _parent.fork(params)
+        if tEnd is None:
+            tEnd = model.input.tEnd
+        model.run_to_time(tEnd, showtime=tEnd-model.tNow+1., fastforward=fastforward,
+                          stop=stop)
+        records = _records(model, paths)
+        if figures is not None:
+            _render(model, figures, figdir, index)
+    except Exception:
+        return index, None, traceback.format_exc()
+
+    return index, records, None
+
+class ForkRunner(object):
+    """
+    Run scenarios branching from the current state of a model over a local process pool.
+
+    The worker processes are forked once the parent model is set, so they share its memory
+    copy-on-write and the parent state is never pickled. Each branch forks the parent model
+    with its own input parameters (e.g. a different sea-level curve) and continues the
+    simulation.
+
+    Parameters
+    ----------
+    object : model
+        Parent Model, usually run to the end of a common spin-up.
+
+    int : processes
+        Number of worker processes, all the available cores when None.
+
+    float : tEnd
+        End time of the branches, the one of the XmL input file when None.
+
+    list : records
+        Model attributes returned by each branch (e.g. core.thickness, coral.population) or
+        fields of its summary record (summary.thickness, summary.totals, summary.eroded,
+        summary.years or summary.rate, see Model.summary).
+
+    dict : figures
+        Plotting functions of modelPlot and their arguments, rendered by the workers after
+        each branch in headless mode (see SweepRunner).
+
+    string : figdir
+        Folder of the rendered figures.
+
+    bool : fastforward
+        If True, phases of null populations are advanced at once (see Model.run_to_time).
+
+    list : stop
+        Stop conditions of the branches (see events), they are sent to the workers and should
+        be picklable (e.g. events.CoreRemoved()).
+    """
+
+    def __init__(self, model, processes=None, tEnd=None, records=RECORDS, figures=None,
+                 figdir='figures', fastforward=False, stop=None):
+
+        self.model = model
+        self.processes = processes
+        if self.processes is None:
+            self.processes = multiprocessing.cpu_count()
+        self.tEnd = tEnd
+        self.records = _checkRecords(records)
+        self.figures = figures
+        self.figdir = os.path.abspath(figdir)
+        self.fastforward = fastforward
+        self.stop = stop
+        self.failures = []
+
+        return
+
+    def run(self, branches, verbose=True):
+        """
+        Run all the branches and return their records in the order of the branches, the
+        records of a failed branch are None.
+
+        Parameters
+        ----------
+        list : branches
+            Input parameters of each branch, as dictionaries of parameters to override.
+        """
+
+        global _parent
+
+        branches = list(branches)
+        results = [None]*len(branches)
+        jobs = [(k, branches[k], self.tEnd, self.records, self.figures, self.figdir,
+                 self.fastforward, self.stop) for k in range(len(branches))]
+        if self.figures is not None and not os.path.exists(self.figdir):
+            os.makedirs(self.figdir)
+        self.failures = []
+        _parent = self.model
+        try:
+            pool = multiprocessing.Pool(min(self.processes, max(len(jobs), 1)))
+            try:
+                for index, records, error in pool.imap_unordered(_runBranch, jobs):
+                    if error is not None:
+                        self.failures.append((index, error))
+                        print >> sys.stderr, 'Branch %d failed:\n%s' %(index, error)
+                        continue
+                    results[index] = records
+                    if verbose:
+                        print 'Fork: branch %d done' %index
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        finally:
+            _parent = None
+
+        return results
@@ -0,0 +1,207 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   pyReefCore run timing: wall time spent in each phase of the carbonate step loop, ODE
+   solver statistics and simulation throughput, exported as JSON reports.
+"""
+import json
+import time
+
+# Phases of a carbonate step, in loop order
+PHASES = ('forcing', 'solve', 'production', 'layers', 'events')
+
+# Solver statistics summed over the runs
+COUNTERS = ('nfev', 'naccept', 'nreject')
+
+def _add(total, value):
+    """
+    Sum of solver statistics, None when one of them is not reported by the solver.
+    """
+
+    if total is None or value is None:
+        return None
+
+    return total+value
+
+class RunTimer(object):
+    """
+    Timer of Model.run_to_time, the timings accumulate over successive calls.
+
+    The phases are:
+        + forcing: tectonic, sea-level and environmental factors evaluation,
+        + solve: GLV equation integration and population update,
+        + production: carbonate production and karstification of the core,
+        + layers: time and stratigraphic layer bookkeeping (and output store).
+        + events: stop conditions and phases advanced at once by the fast-forward (see
+          Model.run_to_time).
+
+    With the fused carbonate kernel (see carbonateKernel), the whole step after the forcing
+    levels evaluation is timed as solve.
+
+    The solver statistics are the numbers of right-hand side evaluations (nfev) and of
+    accepted and rejected steps (naccept, nreject). A statistic the solver cannot report is
+    None: the numbers of steps of the odespy fehlberg solver and the rejected steps of the
+    scipy solvers.
+    """
+
+    def __init__(self):
+
+        self.phases = dict((phase, 0.) for phase in PHASES)
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.solver = None
+        self.steps = 0
+        self.years = 0.
+        self.wall = 0.
+        self._start = None
+        self._mark = None
+        self._counts = None
+
+        return
+
+    def start(self, solver=None):
+        """
+        Start timing a run.
+
+        Parameters
+        ----------
+        object : solver
+            ODE solver of the run, only the statistics of the run are added to the counters
+            when the solver is reused between runs.
+        """
+
+        self._counts = dict((name, getattr(solver, name, None)) for name in COUNTERS)
+        self._start = time.time()
+        self._mark = self._start
+
+        return
+
+    def lap(self, phase):
+        """
+        Add the time elapsed since the previous lap to a phase.
+        """
+
+        now = time.time()
+        self.phases[phase] += now-self._mark
+        self._mark = now
+
+        return
+
+    def stop(self, years, steps, solver):
+        """
+        Stop timing a run.
+
+        Parameters
+        ----------
+        float : years
+            Simulated time of the run.
+
+        int : steps
+            Number of carbonate steps of the run.
+
+        object : solver
+            ODE solver of the run, its statistics are added to the counters.
+        """
+
+        self.wall += time.time()-self._start
+        self.years += years
+        self.steps += steps
+        self.solver = getattr(solver, 'name', None)
+        for name in COUNTERS:
+            count = getattr(solver, name, None)
+            if count is not None and self._counts[name] is not None:
+                count -= self._counts[name]
+            else:
+                count = None
+            self.counters[name] = _add(self.counters[name], count)
+
+        return
+
+    def report(self):
+        """
+        Structured timing report (JSON serialisable dictionary).
+        """
+
+        report = {'wall': self.wall, 'years': self.years, 'steps': self.steps,
+                  'solver': self.solver, 'phases': dict(self.phases)}
+        report.update(self.counters)
+        report['yearsPerSecond'] = 0.
+        if self.wall > 0.:
+            report['yearsPerSecond'] = self.years/self.wall
+
+        return report
+
+    def save(self, filename):
+        """
+        Save the timing report in a JSON file.
+        """
+
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=1, sort_keys=True)
+
+        return
+
+    def summary(self):
+        """
+        Print the timing report.
+        """
+
+        print formatReport(self.report())
+
+        return
+
+def aggregateReports(reports):
+    """
+    Sum the timing reports of several runs, for example the jobs of a sweep.
+
+    Parameters
+    ----------
+    list : reports
+        Timing reports given by RunTimer.report.
+    """
+
+    total = {'wall': 0., 'years': 0., 'steps': 0, 'runs': 0,
+             'phases': dict((phase, 0.) for phase in PHASES)}
+    for name in COUNTERS:
+        total[name] = 0
+    for report in reports:
+        total['runs'] += 1
+        for name in ['wall', 'years', 'steps']:
+            total[name] += report[name]
+        for name in COUNTERS:
+            total[name] = _add(total[name], report.get(name))
+        for phase in PHASES:
+            total['phases'][phase] += report['phases'][phase]
+    total['yearsPerSecond'] = 0.
+    if total['wall'] > 0.:
+        total['yearsPerSecond'] = total['years']/total['wall']
+
+    return total
+
+def formatReport(report):
+    """
+    Format a timing report as a table.
+    """
+
+    lines = ['%12s %10s %8s' %('phase', 'time [s]', 'share')]
+    wall = max(report['wall'], 1.e-12)
+    for phase in PHASES:
+        lines.append('%12s %10.3f %7.1f%%' %(phase, report['phases'][phase],
+                                            100.*report['phases'][phase]/wall))
+    lines.append('%12s %10.3f' %('total', report['wall']))
+    lines.append('%d steps, %.1f simulated years per second' %(report['steps'],
+                                                               report['yearsPerSecond']))
+    counts = []
+    for name in COUNTERS:
+        if report.get(name) is None:
+            counts.append('n/a')
+        else:
+            counts.append('%d' %report[name])
+    lines.append('RHS evaluations: %s, accepted steps: %s, rejected steps: %s' %tuple(counts))
+
+    return '\n'.join(lines)